@@ -1,9 +1,23 @@
 import json
+from pathlib import Path
 from protocols.mcp_client import sync_mcp_call
+from persona.persona_agent import load_rules
+from utils.disk_cache import DiskCache
 from utils.logger import get_logger
 
 logger = get_logger("AGENT_EXTRACTOR")
 MCP_SERVER_PORT = 8001
+OCR_CACHE_PATH = Path(__file__).resolve().parent.parent / "outputs" / "cache" / "ocr_cache.db"
+
+_ocr_cache = None
+
+def ocr_cache() -> DiskCache:
+    """OCR results keyed by the upload's sha256: re-uploads of the same file skip OCR entirely."""
+    global _ocr_cache
+    if _ocr_cache is None:
+        cfg = load_rules().get("uploads", {})
+        _ocr_cache = DiskCache(OCR_CACHE_PATH, namespace="ocr_cache", max_entries=int(cfg.get("ocr_cache_entries", 2000)))
+    return _ocr_cache
 
 def extractor_node(state: dict) -> dict:
     # 1. Check for Human Override (Re-run)
@@ -12,9 +26,17 @@ def extractor_node(state: dict) -> dict:
         return {
             "raw_text": "Human Corrected Data", 
             "structured_data": state["corrected_data"],
+            "extraction_method": "human",
             "status": "PROCESSING"
         }
 
+    sha256 = state.get("file_sha256")
+    if sha256:
+        cached = ocr_cache().get(sha256)
+        if cached is not None:
+            logger.info(f"OCR cache hit ({sha256[:12]})")
+            return json.loads(cached)
+
     logger.info(f"Calling FastMCP ({MCP_SERVER_PORT})...")
     
     # 2. Call Remote Tool
@@ -26,8 +48,16 @@ def extractor_node(state: dict) -> dict:
         res = json.loads(res_str) if isinstance(res_str, str) else res_str
         
         if res.get("status") == "success": 
-            logger.info("OCR Success")
-            return {"raw_text": res["text"]}
+            logger.info(f"OCR Success ({res.get('method')})")
+            update = {"raw_text": res["text"]}
+            if res.get("line_items"):
+                # Table mode: the translator only has to read the header fields
+                logger.info(f"Table extraction found {len(res['line_items'])} line items")
+                update["table_line_items"] = res["line_items"]
+                update["header_text"] = res.get("header_text", "")
+            if sha256:
+                ocr_cache().put(sha256, json.dumps(update))
+            return update
         
         # FAIL CASE: OCR returned error
         logger.error(f"OCR Failed: {res.get('message')}")
@@ -1,20 +1,26 @@
 # A simple script to index text
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
-# Re-use the embeddings logic
-from rag_agents.retrieval_agent import embeddings, DB_PATH
+from rag_agents.index_service import get_index_service
+from utils.text_parsing import parse_date, parse_number
+
+def build_invoice_metadata(file_name: str, invoice: dict, is_valid: bool) -> dict:
+    """Structured fields stored with the vector, used for filtered / hybrid retrieval."""
+    invoice = invoice or {}
+    amount = invoice.get("total_amount")
+    return {
+        "source": file_name,
+        "invoice_no": invoice.get("invoice_no"),
+        "vendor": invoice.get("vendor_name"),
+        "status": "PASS" if is_valid else "FAIL",
+        "date": parse_date(invoice.get("invoice_date")),
+        "amount": amount if isinstance(amount, (int, float)) else parse_number(str(amount or "")),
+        "currency": invoice.get("currency"),
+    }
 
 def index_invoice_text(text: str, metadata: dict):
     print(" [Indexing] Saving invoice text to Vector DB...")
     
-    doc = Document(page_content=text, metadata=metadata)
-    
-    # Check if DB exists to append or create new
-    try:
-        db = FAISS.load_local(DB_PATH, embeddings, allow_dangerous_deserialization=True)
-        db.add_documents([doc])
-    except:
-        db = FAISS.from_documents([doc], embeddings)
-        
-    db.save_local(DB_PATH)
-    print(" [Indexing] Success.")
\ No newline at end of file
+    # The index service keeps the index in memory and logs the write;
+    # snapshots are flushed to disk in batches. Re-uploads replace (or skip,
+    # if unchanged) the invoice's previous document instead of adding a copy.
+    doc_id = get_index_service().upsert(text, metadata)
+    print(f" [Indexing] Success (doc {doc_id}).")
@@ -5,7 +5,11 @@ from pathlib import Path
 from datetime import datetime
 from protocols.a2a import AgentMessage
 from protocols.mcp_client import sync_mcp_call
+from persona.persona_agent import load_rules
+from tools.report_renderer import ReportRendererTool
 from utils.logger import get_logger
+from utils.report_store import get_report_store
+from utils.artifacts import write_artifact
 
 # Initialize Logger
 logger = get_logger("AGENT_REPORTER")
@@ -18,6 +22,8 @@ REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 class ReportingAgent:
     def __init__(self):
         self.name = "reporting_agent"
+        self.renderer = ReportRendererTool()
+        self.llm_narrative = load_rules().get("reporting", {}).get("llm_narrative", False)
         logger.debug("Reporting Agent Initialized")
 
     def process_message(self, message: AgentMessage) -> AgentMessage:
@@ -31,29 +37,15 @@ class ReportingAgent:
         if not data:
             return self._error(message, "No data provided for reporting")
 
-        # 2. Prepare Data for Remote Call
-        safe_data = str(data)
-        logger.info(f"Calling FastMCP (Port {MCP_SERVER_PORT})... Data Size: {len(safe_data)} chars")
-        
         try:
-            # 3. Call Remote Server (Google ADK Tools) to get HTML
-            res_str = sync_mcp_call(MCP_SERVER_PORT, "generate_report", {"report_data": safe_data})
+            # 2. Optional LLM narrative (the report itself no longer needs the LLM)
+            narrative = self._narrative(data) if self.llm_narrative else None
             
-            # 4. Parse Response
-            if isinstance(res_str, str):
-                if "Error" in res_str and not res_str.strip().startswith("{"):
-                    logger.error(f"Server returned error string: {res_str}")
-                    return self._error(message, res_str)
-                
-                # Clean Markdown if the LLM added it
-                clean = res_str.replace("```json", "").replace("```", "").strip()
-                res = json.loads(clean)
-            else:
-                res = res_str
-                
-            report_html = res.get("html", "<b>Error: No HTML returned from AI</b>")
+            # 3. Render HTML locally from the compiled template
+            report_html = self.renderer.execute(data, narrative=narrative)
+            logger.info(f"Rendered HTML report locally ({len(report_html)} bytes)")
             
-            # 5. Generate Filenames
+            # 4. Generate Filenames
             inv_num = data.get('invoice_no')
             
             # Create a safe filename
@@ -66,9 +58,8 @@ class ReportingAgent:
             json_filename = f"{safe_id}.json"
             
             html_path = REPORTS_DIR / html_filename
-            json_path = REPORTS_DIR / json_filename
             
-            # 6. Generate Human Readable Summary (THE FIX)
+            # 5. Generate Human Readable Summary (THE FIX)
             status = data.get('validation_status', 'Unknown')
             discrepancies = data.get('discrepancies', [])
             
@@ -79,10 +70,9 @@ class ReportingAgent:
                 issue_text = discrepancies[0] if discrepancies else "Unknown Validation Error"
                 summary = f"❌ Rejected: {issue_text}"
 
-            # 7. Save Files to Disk
-            # Save HTML
-            with open(html_path, "w", encoding="utf-8") as f: 
-                f.write(report_html)
+            # 6. Save Files to Disk
+            # Save HTML (atomically, with gzip/brotli copies for /api/download)
+            write_artifact(html_path, report_html)
             
             # Save JSON Metadata
             metadata = {
@@ -98,12 +88,12 @@ class ReportingAgent:
                 }
             }
             
-            with open(json_path, "w", encoding="utf-8") as f: 
-                json.dump(metadata, f, indent=2)
+            # The report store versions it, logs the event and writes the JSON file atomically
+            metadata = get_report_store().put(metadata)
 
             logger.info(f"Files Saved Successfully: {json_filename}")
             
-            # 8. Return Success
+            # 7. Return Success
             return AgentMessage(
                 sender=self.name, 
                 receiver=message.sender, 
@@ -116,6 +106,17 @@ class ReportingAgent:
             logger.critical(f"Reporting Logic Failed: {str(e)}")
             return self._error(message, str(e))
 
+    def _narrative(self, data: dict):
+        """Asks the LLM (FastMCP Port 8002) for a short summary paragraph. Never fails the report."""
+        logger.info(f"Calling FastMCP (Port {MCP_SERVER_PORT}) for narrative summary...")
+        try:
+            res_str = sync_mcp_call(MCP_SERVER_PORT, "summarize_report", {"report_data": json.dumps(data, default=str)})
+            res = json.loads(res_str) if isinstance(res_str, str) else res_str
+            return res.get("summary") or None
+        except Exception as e:
+            logger.warning(f"Narrative skipped: {e}")
+            return None
+
     def _error(self, msg, err):
         return AgentMessage(
             sender=self.name, 
@@ -0,0 +1,118 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from protocols.mcp_client import sync_mcp_call
+from persona.persona_agent import load_rules
+from tools.chunked_extraction import PAGE_BREAK, reduce_extraction
+from agents.extractor_agent import extractor_node
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("AGENT_STREAMER")
+metrics = get_metrics("streaming_pipeline")
+OCR_SERVER_PORT = 8001
+LLM_SERVER_PORT = 8002
+
+def _call(port, tool, args) -> dict:
+    res_str = sync_mcp_call(port, tool, args)
+    try:
+        return json.loads(res_str) if isinstance(res_str, str) else (res_str or {})
+    except ValueError:
+        return {"status": "error", "error": res_str}
+
+def _extract_header(text: str) -> dict:
+    return _call(LLM_SERVER_PORT, "translate_header", {"header_text": text})
+
+def _extract_items(text: str) -> dict:
+    return _call(LLM_SERVER_PORT, "extract_line_items", {"chunk_text": text})
+
+def _done(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+def streaming_extractor_node(state: dict) -> dict:
+    """
+    Streaming OCR -> LLM handoff.
+    Pages are OCR'd one at a time; the header LLM call starts as soon as page 1
+    is ready and each page's line items are extracted while the next page is
+    still being OCR'd. Short invoices just return the text for the normal path.
+    """
+    if state.get("is_rerun") and state.get("corrected_data"):
+        return extractor_node(state)
+
+    cfg = load_rules().get("streaming_pipeline", {})
+    file_path = state["file_path"]
+    started = time.time()
+
+    count = _call(OCR_SERVER_PORT, "ocr_page_count", {"file_path": file_path})
+    if count.get("status") != "success":
+        logger.error(f"Page count failed: {count.get('message')}")
+        return {"status": "FAILED", "error_message": count.get("message", "Unknown OCR Error"), "raw_text": ""}
+    pages_total = count["pages"]
+    stream = pages_total >= int(cfg.get("min_pages", 2))
+    logger.info(f"{pages_total} page(s) - {'streaming' if stream else 'sequential'} mode")
+
+    pages, header_pages = [], []
+    table_items, item_futures = [], []
+    header_future = None
+
+    pool = ThreadPoolExecutor(max_workers=int(cfg.get("max_concurrency", 4)))
+    try:
+        for index in range(pages_total):
+            page = _call(OCR_SERVER_PORT, "ocr_extract_page", {"file_path": file_path, "page_index": index})
+            if page.get("status") != "success":
+                logger.error(f"OCR Failed on page {index}: {page.get('message')}")
+                return {"status": "FAILED", "error_message": page.get("message", "Unknown OCR Error"), "raw_text": ""}
+
+            pages.append(page["text"])
+            header_pages.append(page.get("header_text", page["text"]))
+            table_items.extend(page.get("line_items", []))
+            if not stream:
+                continue
+
+            # Table pages already have their rows; other pages go to the LLM now
+            if page.get("line_items"):
+                item_futures.append(_done({"line_items": page["line_items"]}))
+            else:
+                item_futures.append(pool.submit(_extract_items, page["text"]))
+
+            # Speculative header extraction: page 1 usually carries every header field
+            if index == 0:
+                header_future = pool.submit(_extract_header, header_pages[0])
+                metrics.observe("time_to_first_page_ms", (time.time() - started) * 1000)
+
+        raw_text = "".join(p + "\n" + PAGE_BREAK for p in pages)
+        if not stream:
+            update = {"raw_text": raw_text}
+            if table_items:
+                update["table_line_items"] = table_items
+                update["header_text"] = "\n".join(header_pages)
+            return update
+
+        header = header_future.result()
+        metrics.observe("time_to_header_ms", (time.time() - started) * 1000)
+        # Speculation missed (e.g. the total is on the last page): ask again with first + last page
+        if "error" not in header and header.get("total_amount") in (None, "", 0):
+            metrics.incr("header_retries")
+            header = _extract_header(f"{header_pages[0]}\n...\n{header_pages[-1]}")
+        if "error" in header:
+            return {"status": "FAILED", "error_message": header["error"], "raw_text": raw_text}
+
+        chunk_items = []
+        for future in item_futures:
+            result = future.result()
+            if "error" in result:
+                return {"status": "FAILED", "error_message": result["error"], "raw_text": raw_text}
+            chunk_items.append(result.get("line_items", []))
+    finally:
+        # Not a 'with' block: a failed invoice must not wait for its queued or running LLM calls
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    tolerance = load_rules().get("validation_rules", {}).get("price_tolerance_percent", 5.0)
+    data = reduce_extraction(header, chunk_items, tolerance, chunk_texts=pages)
+    metrics.observe("total_ms", (time.time() - started) * 1000)
+    metrics.incr("streamed_invoices")
+    logger.info(f"Streamed {pages_total} pages -> {len(data['line_items'])} line items")
+
+    return {"raw_text": raw_text, "structured_data": data, "extraction_method": "llm"}
@@ -14,8 +14,15 @@ class TranslationAgent:
         if not raw_text: 
             return self._error(message, "No text provided")
 
-        logger.info(f"Calling FastMCP ({MCP_SERVER_PORT})...")
-        res_str = sync_mcp_call(MCP_SERVER_PORT, "translate_invoice", {"raw_text": raw_text})
+        # Table mode: line items are already parsed, only ask the LLM for the header
+        line_items = message.payload.get("line_items")
+        if line_items:
+            header_text = message.payload.get("header_text") or raw_text
+            logger.info(f"Calling FastMCP ({MCP_SERVER_PORT}) for header fields only...")
+            res_str = sync_mcp_call(MCP_SERVER_PORT, "translate_header", {"header_text": header_text})
+        else:
+            logger.info(f"Calling FastMCP ({MCP_SERVER_PORT})...")
+            res_str = sync_mcp_call(MCP_SERVER_PORT, "translate_invoice", {"raw_text": raw_text})
         
         try:
             if isinstance(res_str, str):
@@ -26,6 +33,9 @@ class TranslationAgent:
             
             if "error" in data:
                 return self._error(message, data["error"])
+            
+            if line_items:
+                data = self._merge_line_items(data, line_items)
                 
             logger.info("Translation Success")
             
@@ -41,6 +51,20 @@ class TranslationAgent:
         except Exception as e:
             return self._error(message, str(e))
 
+    def _merge_line_items(self, header: dict, line_items: list) -> dict:
+        """Combines LLM header fields with table line items (PO copied onto every item)."""
+        po_number = header.pop("po_number", None)
+        items = []
+        for item in line_items:
+            item = dict(item)
+            if not item.get("po_number"):
+                item["po_number"] = po_number
+            items.append(item)
+        header["line_items"] = items
+        if po_number:
+            header["po_number"] = po_number
+        return header
+
     def _error(self, msg, err):
         return AgentMessage(
             sender=self.name, 
@@ -1,21 +1,29 @@
 import json
-from protocols.mcp_client import sync_mcp_call
+from protocols.mcp_client import sync_mcp_gather
 from persona.persona_agent import load_rules
 from utils.logger import get_logger
 
 logger = get_logger("AGENT_VALIDATOR")
 MCP_SERVER_PORT = 8001
 
+def _parse(res_str):
+    if isinstance(res_str, str):
+        if "Error" in res_str and not res_str.strip().startswith("{"): raise Exception(res_str)
+        return json.loads(res_str)
+    return res_str or {}
+
 def validation_node(state: dict) -> dict:
     data = state.get("structured_data")
-    if not data: 
+    if not data:
         logger.error("No Data Received")
         return {"status": "FAILED", "error_message": "No Data"}
 
+    rules = load_rules().get("validation_rules", {})
+
     # 1. FIND PO NUMBER
     po_number = None
     line_items = data.get('line_items', [])
-    
+
     # Scan header first, then items
     if data.get('po_number'):
         po_number = data.get('po_number')
@@ -25,32 +33,54 @@ def validation_node(state: dict) -> dict:
             if val and str(val).lower() not in ['none', 'null', '']:
                 po_number = val
                 break
-            
+
     if not po_number:
         logger.warning("❌ NO PO NUMBER FOUND. Skipping Remote Validation.")
         return {"discrepancies": ["Missing PO Number in Invoice Data"], "is_valid": False}
 
-    # 2. CALL REMOTE SERVER
-    logger.info(f"Calling FastMCP (Port {MCP_SERVER_PORT}) to validate {po_number}...")
-    
+    # 2. BUILD INDEPENDENT CHECKS (PO, Vendor, every SKU)
+    checks = [("po", po_number, f"Invalid PO Number: {po_number} (Not found in ERP)")]
+
+    vendor = data.get('vendor_name')
+    if rules.get("validate_vendor", False) and vendor:
+        checks.append(("vendor", vendor, f"Unknown Vendor: {vendor} (Not found in ERP)"))
+
+    if rules.get("validate_skus", False):
+        codes = []
+        for item in line_items:
+            code = item.get('item_code')
+            if code and str(code).lower() not in ['none', 'null', ''] and code not in codes:
+                codes.append(code)
+        checks += [("sku", code, f"Unknown SKU: {code} (Not found in ERP)") for code in codes]
+
+    # 3. CALL REMOTE SERVER - all checks fan out concurrently
+    logger.info(f"Calling FastMCP (Port {MCP_SERVER_PORT}) for {len(checks)} checks in parallel...")
+
     try:
-        res_str = sync_mcp_call(MCP_SERVER_PORT, "validate_business_data", {"validation_type": "po", "key": po_number})
-        
-        # Parse Response
-        if isinstance(res_str, str):
-            if "Error" in res_str and not res_str.strip().startswith("{"): raise Exception(res_str)
-            res = json.loads(res_str)
-        else:
-            res = res_str
-            
-        logger.info(f"Remote Result: {res}")
-        
-        discrepancies = []
-        if not res.get("valid"):
-            discrepancies.append(f"Invalid PO Number: {po_number} (Not found in ERP)")
-            
-        return {"discrepancies": discrepancies, "is_valid": len(discrepancies) == 0}
-        
+        responses = sync_mcp_gather([
+            (MCP_SERVER_PORT, "validate_business_data", {"validation_type": v_type, "key": key})
+            for v_type, key, _ in checks
+        ])
     except Exception as e:
         logger.error(f"Validation Crash: {e}")
-        return {"discrepancies": [f"System Error: {e}"], "is_valid": False}
\ No newline at end of file
+        return {"discrepancies": [f"System Error: {e}"], "is_valid": False}
+
+    discrepancies = []
+    results = {}
+    for (v_type, key, message), res_str in zip(checks, responses):
+        try:
+            res = _parse(res_str)
+        except Exception as e:
+            logger.error(f"Validation Crash ({v_type} {key}): {e}")
+            discrepancies.append(f"System Error: {e}")
+            continue
+
+        logger.info(f"Remote Result [{v_type} {key}]: {res}")
+        if res.get("status") == "error":
+            discrepancies.append(f"System Error: {res.get('message')}")
+            continue
+        results[f"{v_type}:{key}"] = res.get("valid", False)
+        if not res.get("valid"):
+            discrepancies.append(message)
+
+    return {"discrepancies": discrepancies, "is_valid": len(discrepancies) == 0, "validation_results": results}
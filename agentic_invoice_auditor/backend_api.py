@@ -1,19 +1,29 @@
 import uvicorn
-import shutil
 import json
 import uuid
+import hashlib
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Query, Response, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 import traceback 
 
 # Import Core Logic
 from main_workflow import build_graph
 from rag_agents.workflow import rag_app
-from agents.indexing_tool import index_invoice_text
+from rag_agents.chat_stream import stream_chat
+from utils.metrics import load_all_metrics
+from rag_agents.index_service import get_index_service
+from rag_agents.resident_index import get_resident_index
+from rag_agents.answer_cache import get_answer_cache
+from utils.report_store import get_report_store, VersionConflict
+from utils.blob_store import get_blob_store, upload_limits, UploadRejected
+from utils.batch_jobs import get_batch_runner, get_batch_store, batch_limits, resume_batches
+from utils.artifacts import negotiate, content_hash, etag_matches, artifact_settings
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent
@@ -38,8 +48,59 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Token", "ETag"],
 )
 
+class CompressRoutes:
+    """
+    gzip for the JSON list endpoints only. Report downloads are precompressed on disk, and
+    the SSE chat stream must not be buffered by a compressor.
+    """
+    def __init__(self, app, prefixes, minimum_size=1024):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.prefixes):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+app.add_middleware(CompressRoutes, prefixes=["/api/reports", "/api/batches", "/api/metrics"])
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuses uploads whose declared size is over the limit before any of the body is read."""
+    limit = None
+    if request.method == "POST" and request.url.path == "/api/upload":
+        limit = upload_limits()["max_bytes"]
+    elif request.method == "POST" and request.url.path == "/api/upload/batch":
+        limit = batch_limits()["max_batch_bytes"]
+    if limit is not None:
+        length = request.headers.get("content-length")
+        # Multipart framing adds a little on top of the files themselves
+        if length and length.isdigit() and int(length) > limit + 1024 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "Upload exceeds the size limit"})
+    return await call_next(request)
+
+@app.on_event("startup")
+def warm_vector_index():
+    """Replays the index write-ahead log and loads the chat index before the first request."""
+    try:
+        get_index_service()
+        get_resident_index()
+    except Exception as e:
+        print(f" [API] Vector index not ready: {e}")
+
+@app.on_event("startup")
+def resume_interrupted_batches():
+    """Bulk uploads cut short by a restart or crash continue in this worker."""
+    try:
+        resume_batches()
+    except Exception as e:
+        print(f" [API] Could not resume batches: {e}")
+
 # --- Pydantic Models (Data Structures) ---
 class ChatRequest(BaseModel):
     question: str
@@ -49,10 +110,33 @@ class ActionRequest(BaseModel):
     invoice_id: str
     action: str 
     notes: Optional[str] = ""
+    version: Optional[int] = None # Alternative to an If-Match header
 
 class RerunRequest(BaseModel):
     invoice_id: str
     updated_data: Dict[str, Any]
+    version: Optional[int] = None
+
+# --- Report versions (ETag / If-Match) ---
+def report_etag(report: dict) -> str:
+    return f'"{report["invoice_id"]}.v{report.get("version", 1)}"'
+
+def expected_version(if_match: Optional[str], version: Optional[int]) -> Optional[int]:
+    """Version the client last saw, from If-Match ('"INV-1001.v3"', '*' = any) or the request body."""
+    if if_match and if_match.strip() != "*":
+        tag = if_match.split(",")[0].strip().removeprefix("W/").strip('"')
+        try:
+            return int(tag.rsplit(".v", 1)[1])
+        except (IndexError, ValueError):
+            raise HTTPException(400, f"Malformed If-Match: {if_match}")
+    return version
+
+def version_conflict(e: VersionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail={"message": "Report was changed by someone else; reload and retry", "current_version": e.current},
+        headers={"ETag": report_etag({"invoice_id": e.invoice_id, "version": e.current})},
+    )
 
 # --- ENDPOINTS ---
 
@@ -63,55 +147,39 @@ def health_check():
 @app.post("/api/upload")
 async def upload_invoice(file: UploadFile = File(...)):
     """
-    1. Saves file
-    2. Runs LangGraph Workflow
-    3. Indexes for RAG
-    4. MOVES file to processed folder <--- NEW
-    5. Returns Result
+    1. Streams the file into content-addressed storage (hashed and size/type-checked on the way)
+    2. Runs LangGraph Workflow (report, RAG indexing and archiving fan out in parallel)
+    3. Returns Result
     """
     try:
-        # 1. Save File
-        file_path = INCOMING_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        print(f" [API] Processing: {file.filename}")
+        # 1. Save File (identical bytes are stored once; same-named uploads no longer collide)
+        blob = await get_blob_store().ingest(file, file.filename)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    finally:
+        await file.close()
+
+    try:
+        print(f" [API] Processing: {file.filename} (sha256 {blob['sha256'][:12]})")
         
-        # 2. Run Workflow
+        # 2. Run Workflow (blocking: OCR, LLM calls) in the threadpool, off the event loop
         workflow = build_graph()
-        final_state = workflow.invoke({"status": "STARTING", "file_name": file.filename})
-        
-        # 3. Index for RAG
-        if final_state.get("raw_text"):
-            audit = final_state.get("structured_data", {})
-            status = "PASS" if final_state.get("is_valid") else "FAIL"
-            issues = final_state.get("discrepancies", [])
-            
-            context = f"""
-            INVOICE: {file.filename}
-            STATUS: {status}
-            VENDOR: {audit.get('vendor_name')}
-            ISSUES: {issues}
-            RAW TEXT: {final_state['raw_text']}
-            """
-            index_invoice_text(context, {"source": file.filename})
-
-        # --- 4. NEW: FILE LIFECYCLE MANAGEMENT ---
-        # Move the file to 'processed' only if we reached this point successfully
-        destination_path = PROCESSED_DIR / file.filename
+        final_state = await run_in_threadpool(workflow.invoke, {
+            "status": "STARTING",
+            "file_name": file.filename,
+            "file_path": blob["path"],
+            "file_sha256": blob["sha256"],
+        })
         
-        # Check for duplicates and rename if necessary (e.g., "invoice.pdf" -> "uuid_invoice.pdf")
-        if destination_path.exists():
-            timestamp = uuid.uuid4().hex[:8]
-            destination_path = PROCESSED_DIR / f"{timestamp}_{file.filename}"
-            
-        shutil.move(str(file_path), str(destination_path))
-        print(f" [API] Archived {file.filename} to processed folder.")
-        # -----------------------------------------
+        # 3. Report, RAG indexing and archiving already ran as parallel branches inside the workflow
+        if final_state.get("archived_path"):
+            print(f" [API] Archived {file.filename} to processed folder.")
 
         return {
             "status": "success",
             "filename": file.filename,
+            "sha256": blob["sha256"],
+            "duplicate": blob["duplicate"],
             "data": final_state.get("structured_data"),
             "validation": {
                 "is_valid": final_state.get("is_valid"),
@@ -127,19 +195,129 @@ async def upload_invoice(file: UploadFile = File(...)):
         #    os.remove(file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/upload/batch", status_code=202)
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """
+    Bulk upload: several invoices and/or ZIP archives in one request.
+    Each file (or ZIP member) is streamed into the blob store and queued for the workflow
+    as soon as it is stored; the response comes back once everything is stored, with a
+    batch id to poll at /api/batches/{batch_id}. Bad files are reported per file instead
+    of failing the batch.
+    """
+    limits = batch_limits()
+    store, runner = get_blob_store(), get_batch_runner()
+    batch_id = runner.create()
+    queued, stored_bytes = 0, 0
+    try:
+        for file in files:
+            try:
+                remaining = limits["max_batch_bytes"] - stored_bytes
+                if queued >= limits["max_files"] or remaining <= 0:
+                    runner.reject(batch_id, file.filename, "Batch file or size limit reached")
+                elif Path(file.filename or "").suffix.lower() == ".zip":
+                    # zipfile needs random access: the spooled upload file is seekable, reads run in the threadpool
+                    count, size = await run_in_threadpool(
+                        runner.ingest_zip, batch_id, file.file, store, limits["max_files"] - queued, remaining
+                    )
+                    queued, stored_bytes = queued + count, stored_bytes + size
+                else:
+                    blob = await store.ingest(file, file.filename, max_bytes=min(remaining, upload_limits()["max_bytes"]))
+                    runner.add(batch_id, blob)
+                    queued, stored_bytes = queued + 1, stored_bytes + blob["size"]
+            except UploadRejected as e:
+                runner.reject(batch_id, file.filename, str(e))
+            finally:
+                await file.close()
+    finally:
+        runner.seal(batch_id)
+
+    print(f" [API] Batch {batch_id}: {queued} file(s) queued")
+    return runner.status(batch_id)
+
+@app.get("/api/batches/{batch_id}")
+def get_batch(batch_id: str):
+    """Aggregate progress and per-file results of a bulk upload."""
+    progress = get_batch_store().progress(batch_id) # Any worker can answer, not just the one running it
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress
+
 @app.get("/api/reports")
-def get_reports():
-    """Returns list of all processed JSON reports"""
-    reports = []
-    # Sort by newest
-    files = sorted(REPORTS_DIR.glob("*.json"), key=lambda x: x.stat().st_mtime, reverse=True)
-    for f in files:
-        try:
-            with open(f, "r") as jf:
-                reports.append(json.load(jf))
-        except: pass
+def get_reports(
+    response: Response,
+    status: Optional[str] = None,
+    vendor: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[int] = None,
+    since: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    view: Literal["full", "summary"] = "full",
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Processed reports from the report store, newest first (still a plain array).
+    status can be a comma-separated list. With limit, X-Next-Cursor is set when there
+    are more pages. X-Sync-Token can be passed back as 'since' to get only changed reports.
+    Every write bumps the sync token, so it versions the whole list: an unchanged dashboard
+    refresh is answered 304 without running the query.
+    """
+    store = get_report_store()
+    token = store.sync_token() # Read first: a write racing the query is re-sent, never skipped
+    query = json.dumps([status, vendor, date_from, date_to, cursor, since, limit, view])
+    etag = f'W/"reports.{token}.{hashlib.sha256(query.encode()).hexdigest()[:16]}"'
+    cache_headers = {"ETag": etag, "Cache-Control": artifact_settings()["cache_control"]}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+    reports, next_cursor = store.list(
+        status=status.split(",") if status else None,
+        vendor=vendor,
+        date_from=date_from,
+        date_to=date_to,
+        cursor=cursor,
+        since=since,
+        limit=limit,
+        view=view,
+    )
+    if next_cursor is not None:
+        # Delta sync pages forward (oldest first), so its next page starts after the last seq
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+        if since is not None:
+            token = next_cursor
+    response.headers["X-Sync-Token"] = str(token)
     return reports
 
+@app.get("/api/reports/stats")
+def get_report_stats(response: Response, if_none_match: Optional[str] = Header(None)):
+    """Report counts by status over the whole store, for the dashboard cards (lists are paged)."""
+    store = get_report_store()
+    token = store.sync_token()
+    etag = f'W/"report-stats.{token}"'
+    cache_headers = {"ETag": etag, "Cache-Control": artifact_settings()["cache_control"]}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+    by_status = store.status_counts()
+    return {"total": sum(by_status.values()), "by_status": by_status, "sync_token": token}
+
+@app.get("/api/reports/{invoice_id}")
+def get_report(invoice_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    """One full report, including its audit trail. The ETag goes back as If-Match on updates."""
+    report = get_report_store().get(invoice_id)
+    if report is None:
+        raise HTTPException(404, "Report not found")
+    etag = report_etag(report)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return report
+
+@app.get("/api/reports/{invoice_id}/events")
+def get_report_events(invoice_id: str):
+    """Append-only audit log of a report (generated, approved, rejected, re-run...)."""
+    return get_report_store().events(invoice_id)
+
 @app.post("/api/chat")
 def chat_agent(req: ChatRequest):
     """RAG Chatbot Endpoint"""
@@ -149,41 +327,85 @@ def chat_agent(req: ChatRequest):
         # Format history string for the agent
         hist_str = [f"{msg}" for msg in req.history]
         
+        # Repeated / near-duplicate questions reuse the stored answer
+        cache = get_answer_cache()
+        cached = cache.get(req.question, hist_str)
+        if cached:
+            return {
+                "answer": cached["answer"],
+                "score": cached["reflection_score"],
+                "is_safe": cached["reflection_score"].get("is_safe", False),
+                "cached": True
+            }
+
         # RUN THE AGENT
         result = rag_app.invoke({"question": req.question, "chat_history": hist_str})
+        cache.put(req.question, hist_str, result)
         
         return {
             "answer": result.get("answer", "No answer"),
             "score": result.get("reflection_score", {}),
-            "is_safe": result.get("reflection_score", {}).get("is_safe", False)
+            "is_safe": result.get("reflection_score", {}).get("is_safe", False),
+            "cached": False
         }
     except Exception as e:
         print("!!! CHAT ENDPOINT ERROR !!!")
         traceback.print_exc() 
         raise HTTPException(status_code=500, detail=f"Backend Error: {str(e)}")
 
+@app.post("/api/chat/stream")
+def chat_agent_stream(req: ChatRequest):
+    """RAG Chatbot, streamed as Server-Sent Events (tokens first, reflection verdict last)"""
+    print(f" [API] Streaming Chat Request: {req.question}")
+    hist_str = [f"{msg}" for msg in req.history]
+
+    def events():
+        try:
+            for event, data in stream_chat(req.question, hist_str):
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield f"event: error\ndata: {json.dumps({'detail': f'Backend Error: {str(e)}'})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/action")
-def human_action(req: ActionRequest):
-    """Handle Manual Approve/Reject"""
-    json_path = REPORTS_DIR / f"{req.invoice_id}.json"
-    
-    if not json_path.exists():
+def human_action(req: ActionRequest, response: Response, if_match: Optional[str] = Header(None)):
+    """Handle Manual Approve/Reject (pass the report's ETag as If-Match to avoid overwriting a newer decision)"""
+    new_status = "Approved" if req.action == "APPROVE" else "Rejected"
+
+    def apply(data):
+        data["status"] = new_status
+        data["human_readable_summary"] = (data.get("human_readable_summary") or "") + f" (Manually {req.action}: {req.notes})"
+
+    try:
+        data = get_report_store().update(
+            req.invoice_id, apply, expected_version(if_match, req.version),
+            event=new_status.lower(), actor="reviewer", detail={"action": req.action, "notes": req.notes},
+        )
+    except VersionConflict as e:
+        raise version_conflict(e)
+    if data is None:
         raise HTTPException(404, "Report not found")
-        
-    with open(json_path, "r") as f:
-        data = json.load(f)
-        
-    data["status"] = "Approved" if req.action == "APPROVE" else "Rejected"
-    data["human_readable_summary"] += f" (Manually {req.action}: {req.notes})"
-    
-    with open(json_path, "w") as f:
-        json.dump(data, f)
-        
-    return {"status": "success", "new_state": data["status"]}
+    # Chat answers citing this invoice are stale now (other workers notice via the sync token)
+    get_answer_cache().invalidate_invoice(req.invoice_id)
+
+    response.headers["ETag"] = report_etag(data)
+    return {"status": "success", "new_state": data["status"], "version": data["version"]}
 
 @app.post("/api/rerun")
-def rerun_validation(req: RerunRequest):
+def rerun_validation(req: RerunRequest, response: Response, if_match: Optional[str] = Header(None)):
     """Edit Data and Re-run Workflow"""
+    store = get_report_store()
+    version = expected_version(if_match, req.version)
+    current = store.get(req.invoice_id)
+    # Fail before the (slow) workflow if the client is already behind
+    if current is not None and version is not None and current.get("version", 1) != version:
+        raise version_conflict(VersionConflict(req.invoice_id, version, current.get("version", 1)))
     try:
         print(f" [API] Re-running {req.invoice_id} with new data...")
         workflow = build_graph()
@@ -199,30 +421,62 @@ def rerun_validation(req: RerunRequest):
         
         final_state = workflow.invoke(rerun_state)
         
-        # Update JSON if passed
+        # Update the report if passed
         if final_state.get("is_valid"):
-            json_path = REPORTS_DIR / f"{req.invoice_id}.json"
-            if json_path.exists():
-                with open(json_path, "r") as f: data = json.load(f)
+            def apply(data):
                 data["status"] = "Approved"
-                data["audit_trail"]["invoice_data"] = req.updated_data
+                data.setdefault("audit_trail", {})["invoice_data"] = req.updated_data
                 data["human_readable_summary"] = "Re-run Passed (Manual Data)"
-                with open(json_path, "w") as f: json.dump(data, f)
+
+            # Amend exactly the version this rerun's reporting step wrote (or, if it wrote another
+            # report, the one checked above): a write by anyone else in between is a conflict
+            if final_state.get("report_id") == req.invoice_id:
+                base = final_state.get("report_version")
+            else:
+                base = current.get("version", 1) if current is not None else None
+            data = store.update(
+                req.invoice_id, apply, base,
+                event="rerun_passed", actor="reviewer", detail={"updated_data": req.updated_data},
+            )
+            if data is not None:
+                response.headers["ETag"] = report_etag(data)
+                get_answer_cache().invalidate_invoice(req.invoice_id)
 
         return {
             "is_valid": final_state.get("is_valid"),
             "discrepancies": final_state.get("discrepancies")
         }
+    except VersionConflict as e:
+        raise version_conflict(e)
     except Exception as e:
         raise HTTPException(500, str(e))
     
+@app.get("/api/metrics")
+def get_metrics():
+    """Pipeline stats (template hit rate, etc.) flushed by every process"""
+    return load_all_metrics()
+
 @app.get("/api/download/{filename}")
-def download_report(filename: str):
-    """Serves the generated HTML report to the frontend."""
+def download_report(filename: str, accept_encoding: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    """
+    Serves the generated HTML report to the frontend: the precompressed br/gzip file the
+    client accepts, with a strong per-encoding ETag; If-None-Match is answered 304.
+    """
     file_path = REPORTS_DIR / filename
-    if not file_path.exists():
+    if filename.startswith(".") or file_path.suffix in (".gz", ".br") or not file_path.is_file():
         raise HTTPException(status_code=404, detail="Report not found")
-    return FileResponse(path=file_path, filename=filename, media_type='text/html')
+    body_path, encoding = negotiate(file_path, accept_encoding)
+    digest = content_hash(file_path)[:32]
+    headers = {
+        "ETag": f'"{digest}-{encoding}"' if encoding else f'"{digest}"',
+        "Cache-Control": artifact_settings()["cache_control"],
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path=body_path, filename=filename, media_type='text/html', headers=headers)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -2,14 +2,20 @@ import json
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, List, Dict, Any, Optional
 import os
+from pathlib import Path
 
 # Import Agents
 from agents.extractor_agent import extractor_node
+from agents.streaming_agent import streaming_extractor_node
 from agents.validation_agent import validation_node
 from agents.translation_agent import TranslationAgent
 from agents.reporting_agent import ReportingAgent
+from agents.indexing_tool import index_invoice_text, build_invoice_metadata
 from protocols.a2a import AgentMessage
+from persona.persona_agent import load_rules
 from tools.file_watcher import InvoiceWatcherTool
+from tools.template_extractor import VendorTemplateTool
+from utils.blob_store import get_blob_store
 
 # Define Shared Memory
 class InvoiceState(TypedDict):
@@ -21,10 +27,19 @@ class InvoiceState(TypedDict):
     is_valid: bool
     discrepancies: List[str]
     final_report_html: str
+    report_id: str # Report store entry written by the reporting step...
+    report_version: int # ...and its version (a rerun amends exactly this one)
     status: str
     error_message: str
     is_rerun: bool
+    file_sha256: str # Content hash of web uploads (blob store key, OCR cache key)
     corrected_data: dict
+    extraction_method: str # "template", "llm" or "human"
+    table_line_items: List[dict] # Line items read from PDF table geometry
+    header_text: str # Page text outside the line item table
+    # Written by the parallel post-validation branches (one key per branch)
+    indexed: bool
+    archived_path: str
 
 # --- NODE DEFINITIONS ---
 
@@ -64,6 +79,10 @@ class InvoiceState(TypedDict):
 
 def monitor_node(state):
     print(f"\n--- [1] MONITOR NODE ---")
+    # Web uploads arrive already stored (content-addressed blob)
+    if state.get("file_path") and os.path.exists(state["file_path"]):
+        print(f"   Targeting Upload: {state['file_path']}")
+        return {"status": "PROCESSING"}
     # Support for UI-driven file selection
     if state.get("file_name"):
         path = f"data/incoming/{state['file_name']}"
@@ -120,14 +139,40 @@ def extractor_wrapper(state):
     print(f"\n--- [2] EXTRACTOR NODE ---")
     return extractor_node(state)
 
+def streaming_wrapper(state):
+    print(f"\n--- [2] STREAMING EXTRACTOR NODE ---")
+    return streaming_extractor_node(state)
+
+def template_node(state):
+    print(f"\n--- [2b] TEMPLATE FAST-PATH NODE ---")
+    if state.get("status") == "FAILED" or state.get("structured_data"):
+        return {}
+    
+    res = VendorTemplateTool().execute(state.get("raw_text", ""))
+    if res["matched"]:
+        print(f"   TEMPLATE HIT: {res['vendor']} (confidence {res['confidence']:.2f}) - skipping LLM")
+        return {"structured_data": res["structured_data"], "extraction_method": "template"}
+    
+    print(f"   No template match ({res['reason']}) - using LLM")
+    return {}
+
 def translation_node(state):
     print(f"\n--- [3] TRANSLATOR NODE ---")
     if state.get("status") == "FAILED": 
         print("   Skipping (Previous Step Failed)")
         return {"status": "FAILED"}
     
+    if state.get("structured_data"):
+        print("   Skipping (Data already extracted)")
+        return {}
+    
     agent = TranslationAgent()
-    msg = AgentMessage("orch", "trans", "TRANSLATE_EXTRACT", {"raw_text": state["raw_text"]})
+    payload = {"raw_text": state["raw_text"]}
+    if state.get("table_line_items"):
+        print(f"   Using {len(state['table_line_items'])} table line items (header-only prompt)")
+        payload["line_items"] = state["table_line_items"]
+        payload["header_text"] = state.get("header_text", "")
+    msg = AgentMessage("orch", "trans", "TRANSLATE_EXTRACT", payload)
     
     # Call Agent (which calls FastMCP Port 8002)
     res = agent.process_message(msg)
@@ -135,7 +180,7 @@ def translation_node(state):
     if res.status == "SUCCESS": 
         data = res.payload["structured_data"]
         print(f"   DATA EXTRACTED:\n{json.dumps(data, indent=2)}") 
-        return {"structured_data": data}
+        return {"structured_data": data, "extraction_method": "llm"}
         
     print(f"   TRANSLATION FAILED: {res.payload}")
     return {"status": "FAILED", "error_message": res.payload.get("error")}
@@ -148,6 +193,11 @@ def validation_wrapper(state):
     result = validation_node(state)
     
     print(f"   VALIDATION RESULT: {result}")
+    
+    # Validated LLM extractions teach the template fast-path
+    if result.get("is_valid") and state.get("extraction_method") == "llm":
+        if VendorTemplateTool().learn(state.get("raw_text", ""), state["structured_data"]):
+            print("   Template updated for vendor")
     return result
 
 def reporting_node(state):
@@ -174,11 +224,59 @@ def reporting_node(state):
     
     if res.status == "SUCCESS":
         print("   Report Generated Successfully.")
-        return {"final_report_html": res.payload["report_html"], "status": "COMPLETED"}
+        report = res.payload.get("final_report") or {}
+        return {
+            "final_report_html": res.payload["report_html"],
+            "report_id": report.get("invoice_id"),
+            "report_version": report.get("version"),
+            "status": "COMPLETED",
+        }
         
     print(f"   REPORTING FAILED: {res.payload}")
     return {"status": "FAILED", "error_message": res.payload.get("error")}
 
+def indexing_node(state):
+    """Runs in parallel with reporting: indexes the invoice for the RAG chatbot."""
+    print(f"\n--- [5b] INDEXING NODE ---")
+    if state.get("is_rerun") or not state.get("raw_text"):
+        return {"indexed": False}
+    
+    audit = state.get("structured_data") or {}
+    status = "PASS" if state.get("is_valid") else "FAIL"
+    context = f"""
+            INVOICE: {state.get('file_name')}
+            STATUS: {status}
+            VENDOR: {audit.get('vendor_name')}
+            ISSUES: {state.get('discrepancies', [])}
+            RAW TEXT: {state['raw_text']}
+            """
+    try:
+        index_invoice_text(context, build_invoice_metadata(state.get("file_name"), audit, state.get("is_valid")))
+        return {"indexed": True}
+    except Exception as e:
+        print(f"   INDEXING FAILED: {e}")
+        return {"indexed": False}
+
+def archive_node(state):
+    """Runs in parallel with reporting: moves the upload from incoming to processed."""
+    print(f"\n--- [5c] ARCHIVE NODE ---")
+    file_path = state.get("file_path")
+    if state.get("is_rerun") or not file_path or not os.path.exists(file_path):
+        return {}
+    
+    # Blobs are the permanent copy of web uploads (and may be shared by duplicate uploads)
+    if get_blob_store().contains(file_path):
+        return {"archived_path": file_path}
+
+    # Watcher-picked files are already in the processed folder
+    watcher = InvoiceWatcherTool()
+    if Path(file_path).resolve().parent == watcher.process_path.resolve():
+        return {"archived_path": file_path}
+    
+    dest = watcher.move_to_processed(file_path)
+    print(f"   Archived to {dest}")
+    return {"archived_path": dest}
+
 # def reporting_node(state):
 #     print(f"\n--- [5] REPORTING NODE ---")
 #     if state.get("status") == "FAILED": 
@@ -225,17 +323,26 @@ def build_graph():
     wf = StateGraph(InvoiceState)
     
     wf.add_node("monitor", monitor_node)
-    wf.add_node("extractor", extractor_wrapper)
+    # Streaming mode overlaps OCR of later pages with LLM extraction of earlier ones
+    streaming = load_rules().get("streaming_pipeline", {}).get("enabled", False)
+    wf.add_node("extractor", streaming_wrapper if streaming else extractor_wrapper)
+    wf.add_node("template", template_node)
     wf.add_node("translator", translation_node)
     wf.add_node("validator", validation_wrapper)
     wf.add_node("reporter", reporting_node)
+    wf.add_node("indexer", indexing_node)
+    wf.add_node("archiver", archive_node)
     
     wf.set_entry_point("monitor")
     
     wf.add_edge("monitor", "extractor")
-    wf.add_edge("extractor", "translator")
+    wf.add_edge("extractor", "template")
+    wf.add_edge("template", "translator")
     wf.add_edge("translator", "validator")
-    wf.add_edge("validator", "reporter")
-    wf.add_edge("reporter", END)
+    
+    # Fan-out: report, RAG index and archive are independent, so they run as parallel branches
+    for branch in ["reporter", "indexer", "archiver"]:
+        wf.add_edge("validator", branch)
+        wf.add_edge(branch, END)
     
     return wf.compile()
\ No newline at end of file
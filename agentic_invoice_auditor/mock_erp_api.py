@@ -26,7 +26,8 @@ def health_check():
 @app.get("/api/v1/vendors/{vendor_id}")
 def get_vendor(vendor_id: str):
     vendors = load_data(VENDORS_FILE)
-    vendor = next((v for v in vendors if v["vendor_id"] == vendor_id), None)
+    # Invoices only carry the vendor name, so accept either the ID or the exact name
+    vendor = next((v for v in vendors if v["vendor_id"] == vendor_id or v["vendor_name"].lower() == vendor_id.lower()), None)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
     return vendor
@@ -0,0 +1,76 @@
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import os
+import random
+import time
+
+app = FastAPI(title="Mock LLM Server")
+
+# Stand-in for an OpenAI-compatible chat API, used to exercise the LLM gateway
+# (limits, retries, hedging) without spending real quota.
+# Run it, then start the app with LLM_STAND_IN_URL=http://127.0.0.1:8090/v1
+LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "300"))
+# Occasional very slow responses, to see hedging cut the tail
+SLOW_RATE = float(os.getenv("MOCK_LLM_SLOW_RATE", "0.05"))
+SLOW_MS = float(os.getenv("MOCK_LLM_SLOW_MS", "5000"))
+# Share of requests rejected with 429
+ERROR_RATE = float(os.getenv("MOCK_LLM_429_RATE", "0.1"))
+REPLY = os.getenv("MOCK_LLM_REPLY", '{"vendor_name": "Mock Vendor", "total_amount": 0, "line_items": []}')
+
+stats = {"requests": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+
+def _completion(model, content):
+    return {
+        "id": f"mock-{int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4, "total_tokens": len(content) // 4},
+    }
+
+def _chunk(model, delta, finish=None):
+    return {
+        "id": "mock-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    stats["requests"] += 1
+    if random.random() < ERROR_RATE:
+        stats["rate_limited"] += 1
+        return JSONResponse(status_code=429, content={"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error"}})
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        delay = SLOW_MS if random.random() < SLOW_RATE else LATENCY_MS
+        await asyncio.sleep(delay / 1000)
+    finally:
+        stats["in_flight"] -= 1
+
+    model = body.get("model", "mock")
+    if not body.get("stream"):
+        return _completion(model, REPLY)
+
+    async def events():
+        for word in REPLY.split(" "):
+            yield f"data: {json.dumps(_chunk(model, {'content': word + ' '}))}\n\n"
+            await asyncio.sleep(0.01)
+        yield f"data: {json.dumps(_chunk(model, {}, 'stop'))}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8090)
@@ -38,16 +38,29 @@ async def call_remote_mcp(port: int, tool_name: str, arguments: dict):
         # Return a JSON error string so the caller can parse it gracefully
         return json.dumps({"status": "error", "message": f"Connection Failed: {str(e)}"})
 
-def sync_mcp_call(port, tool_name, args):
-    """Wrapper to run async MCP calls in sync agents"""
+def _run_sync(coro):
+    """Runs a coroutine from sync code, reusing the running loop if there is one."""
     try:
         # Check if a loop is already running (FastAPI case)
         loop = asyncio.get_running_loop()
         if loop.is_running():
             # Use the existing loop
-            return loop.run_until_complete(call_remote_mcp(port, tool_name, args))
+            return loop.run_until_complete(coro)
     except RuntimeError:
         pass # No running loop, proceed to create new one
 
     # Fallback for scripts/Streamlit where no loop exists
-    return asyncio.run(call_remote_mcp(port, tool_name, args))
\ No newline at end of file
+    return asyncio.run(coro)
+
+def sync_mcp_call(port, tool_name, args):
+    """Wrapper to run async MCP calls in sync agents"""
+    return _run_sync(call_remote_mcp(port, tool_name, args))
+
+def sync_mcp_gather(calls):
+    """
+    Runs several MCP tool calls concurrently (asyncio.gather).
+    calls: list of (port, tool_name, args). Returns the responses in the same order.
+    """
+    async def _gather():
+        return await asyncio.gather(*(call_remote_mcp(port, tool, args) for port, tool, args in calls))
+    return list(_run_sync(_gather()))
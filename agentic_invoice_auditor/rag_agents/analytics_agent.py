@@ -0,0 +1,215 @@
+import json
+import re
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from rag_agents.analytics_store import get_analytics_store
+from rag_agents.hybrid_search import parse_date_filter, FAIL_WORDS, PASS_WORDS, AMOUNT_MIN, AMOUNT_MAX
+from rag_agents.rag_llms import rag_llm
+from rag_agents.reflection_agent import reflect
+from utils.metrics import get_metrics
+from utils.text_parsing import parse_number
+from utils.token_usage import record_prompt, record_response
+
+metrics = get_metrics("analytics")
+
+AGGREGATE_WORDS = re.compile(
+    r"\b(how many|number of|count|total|sum|spend|spent|average|avg|mean|per vendor|by vendor|breakdown|"
+    r"top \d+|per month|by month|monthly)\b|\bwhich vendors?\b.*\b(most|highest|largest|lowest)\b", re.I
+)
+GROUPS = [
+    (re.compile(r"\b(per|by|each|every|top \d+|which) vendors?\b|\bvendors? (with|by)\b", re.I), "vendor"),
+    (re.compile(r"\b(per|by|each) month\b|\bmonthly\b", re.I), "month"),
+    (re.compile(r"\b(per|by) status\b", re.I), "status"),
+    (re.compile(r"\b(per|by) currenc(y|ies)\b", re.I), "currency"),
+    (re.compile(r"\b(per|by) (error|issue|discrepancy|failure) (type|reason|category)\b|\bwhy\b.*\bfail", re.I), "category"),
+]
+CATEGORIES = [
+    (re.compile(r"\bpo\b|purchase order", re.I), "po"),
+    (re.compile(r"\bsku\b|item code", re.I), "sku"),
+    (re.compile(r"(unknown|invalid) vendor|vendor (validation|check)", re.I), "vendor"),
+    (re.compile(r"system error", re.I), "system"),
+]
+# An invoice number ("INV-1001", "invoice #4521") makes it a question about that invoice, not an aggregate
+INVOICE_REFERENCE = re.compile(r"\b[A-Za-z]{2,}[-_/#]\d[\w/-]*|\binvoice\s*(no\.?|number|#)\s*[\w/-]*\d", re.I)
+GROUP_COLUMNS = {"vendor": "i.vendor", "month": "i.month", "status": "i.status", "currency": "i.currency", "category": "d.category"}
+
+def _mentions_vendor(question: str, vendor: str) -> bool:
+    """Full vendor name, or its first word when that is distinctive ('BlueOcean' for 'BlueOcean Logistics')."""
+    name = (vendor or "").lower()
+    first = re.split(r"\W+", name)[0]
+    return bool(name) and (name in question or (len(first) >= 4 and re.search(rf"\b{re.escape(first)}\b", question) is not None))
+
+def names_invoice(question: str, invoice_numbers: list = ()) -> bool:
+    """True if the question is about one specific invoice (its number is named)."""
+    q = (question or "").lower()
+    if INVOICE_REFERENCE.search(q):
+        return True
+    return any(len(n) >= 3 and re.search(rf"(?<!\w){re.escape(str(n).lower())}(?!\w)", q) for n in invoice_numbers)
+
+def is_aggregate_question(question: str) -> bool:
+    """'total spend last month' is an aggregate; 'total amount of INV-1001' is not."""
+    return bool(AGGREGATE_WORDS.search(question or "")) and not names_invoice(question)
+
+def plan_query(question: str, vendors: list) -> dict:
+    """Turns an aggregate question into a small query spec (metric, grouping, filters)."""
+    q = question.lower()
+    if re.search(r"\b(average|avg|mean)\b", q):
+        metric = "avg"
+    elif re.search(r"\b(how many|number of|count)\b", q):
+        metric = "count"
+    elif re.search(r"\b(largest|biggest|highest|most expensive|max)\b", q) and not re.search(r"\b(per|by|which|top)\b", q):
+        metric = "max"
+    elif re.search(r"\b(total|sum|spend|spent|amount|value)\b", q):
+        metric = "sum"
+    else:
+        metric = "count"
+
+    group_by = next((g for pattern, g in GROUPS if pattern.search(q)), None)
+    top = re.search(r"\btop (\d+)\b", q)
+
+    filters = {}
+    failed, passed = FAIL_WORDS.search(q), PASS_WORDS.search(q)
+    if failed and not passed:
+        filters["passed"] = 0
+    elif passed and not failed:
+        filters["passed"] = 1
+    if failed:
+        category = next((c for pattern, c in CATEGORIES if pattern.search(q)), None)
+        if category:
+            filters["category"] = category
+    matched = [v for v in vendors if _mentions_vendor(q, v)]
+    if matched and group_by != "vendor":
+        filters["vendors"] = matched
+    date_from, date_to = parse_date_filter(question)
+    if date_from:
+        filters["date_from"], filters["date_to"] = date_from, date_to
+    m = AMOUNT_MIN.search(question)
+    if m and parse_number(m.group(2)) is not None:
+        filters["amount_min"] = parse_number(m.group(2))
+    m = AMOUNT_MAX.search(question)
+    if m and parse_number(m.group(2)) is not None:
+        filters["amount_max"] = parse_number(m.group(2))
+
+    return {"metric": metric, "group_by": group_by, "limit": int(top.group(1)) if top else 20, "filters": filters}
+
+def build_sql(plan: dict) -> tuple:
+    """Parameterized SQL for a query plan. Amount metrics are always split by currency."""
+    f = plan["filters"]
+    where, params = [], []
+    if "passed" in f:
+        where.append("i.passed = ?")
+        params.append(f["passed"])
+    if f.get("vendors"):
+        where.append(f"i.vendor IN ({','.join('?' * len(f['vendors']))})")
+        params += f["vendors"]
+    if f.get("date_from"):
+        where.append("i.invoice_date BETWEEN ? AND ?")
+        params += [f["date_from"], f["date_to"]]
+    if f.get("amount_min") is not None:
+        where.append("i.total_amount >= ?")
+        params.append(f["amount_min"])
+    if f.get("amount_max") is not None:
+        where.append("i.total_amount <= ?")
+        params.append(f["amount_max"])
+
+    join = ""
+    if plan["group_by"] == "category":
+        join = "JOIN discrepancies d ON d.invoice_id = i.invoice_id"
+        if f.get("category"):
+            where.append("d.category = ?")
+            params.append(f["category"])
+    elif f.get("category"):
+        where.append("EXISTS (SELECT 1 FROM discrepancies d WHERE d.invoice_id = i.invoice_id AND d.category = ?)")
+        params.append(f["category"])
+
+    metric = plan["metric"]
+    value = {"count": "COUNT(DISTINCT i.invoice_id)", "sum": "ROUND(SUM(i.total_amount), 2)",
+             "avg": "ROUND(AVG(i.total_amount), 2)", "max": "MAX(i.total_amount)"}[metric]
+    groups = []
+    if plan["group_by"]:
+        groups.append(f"{GROUP_COLUMNS[plan['group_by']]} AS grp")
+    if metric != "count":
+        groups.append("i.currency AS currency")
+
+    select = ", ".join(groups + [f"{value} AS value", "COUNT(DISTINCT i.invoice_id) AS invoices"])
+    sql = f"SELECT {select} FROM invoices i {join}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if groups:
+        sql += " GROUP BY " + ", ".join(g.split(" AS ")[1] for g in groups)
+        order = "grp" if plan["group_by"] == "month" else "value DESC"
+        sql += f" ORDER BY {order} LIMIT {int(plan['limit'])}"
+    return sql, params
+
+def describe_result(plan: dict, rows: list) -> str:
+    """Deterministic wording, used when the LLM is unavailable."""
+    if not rows or all(r.get("invoices", 0) == 0 for r in rows):
+        return "No processed invoices match that question."
+    label = {"count": "invoices", "sum": "total", "avg": "average amount", "max": "largest invoice"}[plan["metric"]]
+    lines = []
+    for r in rows:
+        head = f"{r['grp']}: " if "grp" in r else ""
+        currency = r.get("currency") or ""
+        currency += " " if len(currency) > 1 else "" # "USD 10.00" but "$10.00"
+        value = r["value"] if plan["metric"] == "count" else f"{currency}{r['value']:,.2f}" if r["value"] is not None else "n/a"
+        lines.append(f"- {head}{value} ({label}, {r['invoices']} invoice(s))")
+    return "\n".join(lines)
+
+def analytics_node(state: dict) -> dict:
+    """
+    Answers aggregate questions from the analytics store: the numbers are computed
+    with SQL, the LLM only turns the result into a sentence.
+    """
+    print(" [RAG] Analytics: Computing aggregate answer...")
+    question = state["question"]
+    store = get_analytics_store()
+    plan = plan_query(question, store.vendors())
+    sql, params = build_sql(plan)
+    rows = store.query(sql, params)
+    metrics.incr("queries")
+    print(f"   - Plan: {plan}")
+
+    result = {"question": question, "plan": plan, "rows": rows}
+    fallback = describe_result(plan, rows)
+    prompt = ChatPromptTemplate.from_template(
+        """You are an AI Invoice Assistant. The RESULT below was computed exactly from the invoice database.
+        Answer the QUESTION using only the RESULT. Do not change, round or recompute any number.
+        If the result is empty, say no processed invoices match.
+
+        QUESTION: {question}
+        RESULT: {result}
+
+        ANSWER:"""
+    )
+    inputs = {"question": question, "result": json.dumps(result, default=str)}
+    try:
+        record_prompt("rag.analytics", prompt.format(**inputs))
+        answer = (prompt | rag_llm | StrOutputParser()).invoke(inputs)
+        record_response("rag.analytics", answer)
+    except Exception as e:
+        print(f"   - Phrasing failed, using plain result: {e}")
+        answer = fallback
+
+    return {
+        "answer": answer,
+        "context_text": fallback,
+        "context": [],
+        "route": "analytics",
+        # The numbers are exact, but the phrasing (and the plan behind it) still gets graded
+        "reflection_score": reflect(question, fallback, answer),
+    }
+
+def route_question(state: dict) -> str:
+    """'analytics' for aggregate questions over a non-empty store, else the RAG path (also when one invoice is named)."""
+    question = state.get("question", "")
+    if not is_aggregate_question(question):
+        return "rag"
+    try:
+        store = get_analytics_store()
+        store.sync()
+        if store.count() and not names_invoice(question, store.invoice_numbers()):
+            metrics.incr("routed_analytics")
+            return "analytics"
+    except Exception as e:
+        print(f" [RAG] Analytics store unavailable: {e}")
+    return "rag"
@@ -0,0 +1,169 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+from utils.text_parsing import parse_date, parse_number
+
+logger = get_logger("ANALYTICS_STORE")
+metrics = get_metrics("analytics")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+REPORTS_DIR = BASE_DIR / "outputs" / "reports"
+DEFAULT_DB_PATH = BASE_DIR / "outputs" / "analytics" / "invoices.db"
+
+PASS_STATUSES = ("PASS", "Approved", "SUCCESS")
+
+def discrepancy_category(text: str) -> str:
+    """'Invalid PO Number: ...' -> 'po', 'Unknown SKU: ...' -> 'sku', ..."""
+    t = (text or "").lower()
+    if t.startswith("system error"):
+        return "system"
+    if re.search(r"\bpo\b", t):
+        return "po"
+    if "vendor" in t:
+        return "vendor"
+    if "sku" in t:
+        return "sku"
+    if "price" in t or "total" in t or "amount" in t:
+        return "amount"
+    return "other"
+
+class AnalyticsStore:
+    """
+    Columnar-ish SQLite copy of every report's audit_trail.invoice_data, for exact
+    aggregate answers (counts, spend, averages) without touching the LLM.
+    Synced incrementally: only report files whose mtime changed are re-read.
+    """
+    def __init__(self, path=None, reports_dir=None):
+        self.path = Path(path or DEFAULT_DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.reports_dir = Path(reports_dir or REPORTS_DIR)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (file TEXT PRIMARY KEY, mtime REAL);
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_id TEXT PRIMARY KEY,
+                file TEXT,
+                invoice_no TEXT,
+                vendor TEXT,
+                status TEXT,
+                passed INTEGER,
+                invoice_date TEXT,
+                month TEXT,
+                currency TEXT,
+                total_amount REAL,
+                line_item_count INTEGER,
+                discrepancy_count INTEGER,
+                processed_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS line_items (
+                invoice_id TEXT, description TEXT, item_code TEXT, po_number TEXT, qty REAL, unit_price REAL, total REAL
+            );
+            CREATE TABLE IF NOT EXISTS discrepancies (invoice_id TEXT, category TEXT, text TEXT);
+            CREATE INDEX IF NOT EXISTS idx_inv_vendor ON invoices (vendor);
+            CREATE INDEX IF NOT EXISTS idx_inv_date ON invoices (invoice_date);
+            CREATE INDEX IF NOT EXISTS idx_items_invoice ON line_items (invoice_id);
+            CREATE INDEX IF NOT EXISTS idx_disc_invoice ON discrepancies (invoice_id, category);
+            """
+        )
+        self._conn.commit()
+
+    def sync(self) -> int:
+        """Brings the store up to date with the reports folder. Returns the number of changed reports."""
+        started = time.time()
+        on_disk = {p.name: p.stat().st_mtime for p in self.reports_dir.glob("*.json")}
+        with self._lock:
+            known = dict(self._conn.execute("SELECT file, mtime FROM sources").fetchall())
+            changed = [name for name, mtime in on_disk.items() if known.get(name) != mtime]
+            removed = [name for name in known if name not in on_disk]
+
+            for name in removed:
+                self._delete(name)
+                self._conn.execute("DELETE FROM sources WHERE file = ?", (name,))
+            for name in changed:
+                try:
+                    with open(self.reports_dir / name, "r", encoding="utf-8") as f:
+                        report = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable report {name}: {e}")
+                    continue
+                self._delete(name)
+                self._insert(name, report)
+                self._conn.execute("INSERT OR REPLACE INTO sources (file, mtime) VALUES (?, ?)", (name, on_disk[name]))
+            self._conn.commit()
+
+        if changed or removed:
+            metrics.incr("reports_synced", len(changed) + len(removed))
+            logger.info(f"Synced {len(changed)} changed / {len(removed)} removed report(s)")
+        metrics.observe("sync_ms", (time.time() - started) * 1000)
+        return len(changed) + len(removed)
+
+    def _delete(self, file_name: str):
+        ids = [r[0] for r in self._conn.execute("SELECT invoice_id FROM invoices WHERE file = ?", (file_name,))]
+        for invoice_id in ids:
+            self._conn.execute("DELETE FROM line_items WHERE invoice_id = ?", (invoice_id,))
+            self._conn.execute("DELETE FROM discrepancies WHERE invoice_id = ?", (invoice_id,))
+        self._conn.execute("DELETE FROM invoices WHERE file = ?", (file_name,))
+
+    def _insert(self, file_name: str, report: dict):
+        data = (report.get("audit_trail") or {}).get("invoice_data") or {}
+        invoice_id = report.get("invoice_id") or Path(file_name).stem
+        status = report.get("status") or data.get("validation_status")
+        invoice_date = parse_date(data.get("invoice_date"))
+        amount = data.get("total_amount")
+        amount = amount if isinstance(amount, (int, float)) else parse_number(str(amount or ""))
+        items = data.get("line_items") or []
+        discrepancies = data.get("discrepancies") or []
+
+        self._conn.execute(
+            "INSERT OR REPLACE INTO invoices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                invoice_id, file_name, data.get("invoice_no"), data.get("vendor_name"), status,
+                1 if status in PASS_STATUSES else 0, invoice_date, invoice_date[:7] if invoice_date else None,
+                data.get("currency"), amount, len(items), len(discrepancies), report.get("timestamp"),
+            ),
+        )
+        self._conn.executemany(
+            "INSERT INTO line_items VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (invoice_id, i.get("description"), i.get("item_code"), i.get("po_number"),
+                 parse_number(str(i.get("qty"))), parse_number(str(i.get("unit_price"))), parse_number(str(i.get("total"))))
+                for i in items if isinstance(i, dict)
+            ],
+        )
+        self._conn.executemany(
+            "INSERT INTO discrepancies VALUES (?, ?, ?)",
+            [(invoice_id, discrepancy_category(str(d)), str(d)) for d in discrepancies],
+        )
+
+    def query(self, sql: str, params=()) -> list:
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def vendors(self) -> list:
+        return [r["vendor"] for r in self.query("SELECT DISTINCT vendor FROM invoices WHERE vendor IS NOT NULL")]
+
+    def invoice_numbers(self) -> list:
+        return [r["invoice_no"] for r in self.query("SELECT DISTINCT invoice_no FROM invoices WHERE invoice_no IS NOT NULL")]
+
+    def count(self) -> int:
+        return self.query("SELECT COUNT(*) AS n FROM invoices")[0]["n"]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_analytics_store() -> AnalyticsStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore()
+        return _store
@@ -0,0 +1,210 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from persona.persona_agent import load_rules
+from rag_agents.gates import ID_ENTITY, needs_rephrase
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("ANSWER_CACHE")
+metrics = get_metrics("answer_cache")
+
+# Identifiers that must match exactly: "INV-1001" vs "INV-1002" embed almost identically
+ENTITY = re.compile(r"[A-Za-z]{2,}[-_]?\d[\w-]*|\d[\d,.]*")
+# Cited by analytics answers: any report change may alter them
+ALL_INVOICES = "*"
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"[^\w\s-]", "", re.sub(r"\s+", " ", (question or "").lower())).strip()
+
+def _entities(question: str) -> frozenset:
+    return frozenset(e.lower().rstrip(".,") for e in ENTITY.findall(question or ""))
+
+def cited_invoices(result: dict) -> set:
+    """Invoice keys an answer depends on: invoice_no and source file stem of each retrieved document."""
+    if result.get("route") == "analytics":
+        return {ALL_INVOICES}
+    cited = set()
+    for doc in result.get("context") or []:
+        meta = getattr(doc, "metadata", None) or {}
+        if meta.get("invoice_no"):
+            cited.add(str(meta["invoice_no"]).lower())
+        if meta.get("source"):
+            cited.add(Path(str(meta["source"])).stem.lower())
+    return cited
+
+class AnswerCache:
+    """
+    Chat answer cache: exact (normalized text) and near-duplicate (embedding cosine >= threshold)
+    questions reuse a stored answer and its reflection score. LRU-bounded.
+    Everything is dropped when a new index generation goes live. Answers citing a report are
+    dropped once the report store's sync token shows it changed, whichever worker wrote it.
+    """
+    def __init__(self, embeddings, generation_fn, threshold=0.95, max_entries=500, ttl_seconds=None, enabled=True,
+                 changes_fn=None, vendors_fn=None):
+        self.enabled = enabled
+        self.embeddings = embeddings
+        self.generation_fn = generation_fn
+        self.changes_fn = changes_fn # since token -> (changed invoice keys, new token)
+        self.vendors_fn = vendors_fn # -> known vendor names
+        self.threshold = float(threshold)
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # normalized question -> entry
+        self._lock = threading.Lock()
+        self._generation = None
+        self._sync_token = None
+
+    def _check_generation(self):
+        # Called with the lock held
+        generation = self.generation_fn()
+        if generation != self._generation:
+            if self._entries:
+                metrics.incr("invalidated", len(self._entries))
+                logger.info(f"Index generation {self._generation} -> {generation}: dropped {len(self._entries)} cached answer(s)")
+            self._entries.clear()
+            self._generation = generation
+        if self.changes_fn is not None:
+            try:
+                changed, self._sync_token = self.changes_fn(self._sync_token)
+            except Exception as e:
+                logger.warning(f"Report changes unavailable: {e}")
+                return
+            self._drop_cited(changed)
+
+    def _drop_cited(self, invoice_ids) -> int:
+        # Called with the lock held
+        keys = {Path(str(i)).stem.lower() for i in invoice_ids if i}
+        if not keys:
+            return 0
+        stale = [k for k, e in self._entries.items() if ALL_INVOICES in e["cited"] or keys & e["cited"]]
+        for k in stale:
+            del self._entries[k]
+        if stale:
+            metrics.incr("invalidated", len(stale))
+            logger.info(f"Dropped {len(stale)} cached answer(s) citing {', '.join(sorted(keys)[:5])}")
+        return len(stale)
+
+    def names_subject(self, question: str) -> bool:
+        """An invoice / PO number or a known vendor name in the question itself."""
+        if ID_ENTITY.search(question or ""):
+            return True
+        q = (question or "").lower()
+        try:
+            vendors = self.vendors_fn() if self.vendors_fn else []
+        except Exception:
+            vendors = []
+        return any(v and re.search(rf"(?<!\w){re.escape(str(v).lower())}(?!\w)", q) for v in vendors)
+
+    def cacheable(self, question: str, history: list) -> bool:
+        """
+        A first question stands alone. Inside a conversation only questions naming their own subject
+        are shared: "What is the vendor?" means a different invoice in every chat.
+        """
+        if not history:
+            return True
+        needed, _ = needs_rephrase(question, history)
+        return not needed and self.names_subject(question)
+
+    def get(self, question: str, history: list = None):
+        if not self.enabled or not self.cacheable(question, history):
+            return None
+        key = normalize_question(question)
+        with self._lock:
+            self._check_generation()
+            entry = self._entries.get(key)
+            kind = "exact"
+            if entry is None and self._entries:
+                entry, kind = self._nearest(question), "semantic"
+            if entry is not None and self.ttl_seconds and time.time() - entry["created_at"] > self.ttl_seconds:
+                self._entries.pop(entry["key"], None)
+                entry = None
+            if entry is None:
+                metrics.incr("misses")
+                return None
+            self._entries.move_to_end(entry["key"])
+        metrics.incr(f"hits_{kind}")
+        return {"answer": entry["answer"], "reflection_score": entry["reflection_score"], "match": kind}
+
+    def _nearest(self, question: str):
+        import numpy as np
+        entities = _entities(question)
+        candidates = [e for e in self._entries.values() if e["entities"] == entities]
+        if not candidates:
+            return None
+        query = np.asarray(self.embeddings.embed_query(question), dtype="float32")
+        matrix = np.asarray([e["vector"] for e in candidates], dtype="float32")
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = int(np.argmax(scores))
+        return candidates[best] if scores[best] >= self.threshold else None
+
+    def put(self, question: str, history: list, result: dict):
+        """Stores a chat result ({"answer", "reflection_score", "context", "route"}) if it is safe and standalone."""
+        score = result.get("reflection_score") or {}
+        if not self.enabled or not result.get("answer") or not score.get("is_safe", False) or not self.cacheable(question, history):
+            return
+        vector = list(self.embeddings.embed_query(question))
+        key = normalize_question(question)
+        with self._lock:
+            self._check_generation()
+            self._entries[key] = {
+                "key": key,
+                "vector": vector,
+                "entities": _entities(question),
+                "answer": result["answer"],
+                "reflection_score": score,
+                "cited": cited_invoices(result),
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.incr("evicted")
+        metrics.set_gauge("entries", len(self._entries))
+
+    def invalidate_invoice(self, invoice_id: str) -> int:
+        """Drops answers that cited this invoice (and every analytics answer)."""
+        with self._lock:
+            return self._drop_cited([invoice_id])
+
+def report_changes(since):
+    """Invoice keys (id and invoice number) of reports written after the 'since' sync token, and the new token."""
+    from utils.report_store import get_report_store
+    store = get_report_store()
+    token = store.sync_token()
+    if since is None or token == since:
+        return [], token
+    reports, _ = store.list(since=since, view="summary")
+    changed = []
+    for report in reports:
+        changed += [report.get("invoice_id"), report.get("original_invoice_no")]
+    return changed, token
+
+def known_vendors() -> list:
+    from rag_agents.analytics_store import get_analytics_store
+    return get_analytics_store().vendors()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from rag_agents.retrieval_agent import embeddings
+            from rag_agents.resident_index import get_resident_index
+            cfg = load_rules().get("answer_cache", {})
+            ttl_minutes = cfg.get("ttl_minutes")
+            _cache = AnswerCache(
+                embeddings,
+                lambda: get_resident_index().generation,
+                threshold=cfg.get("similarity_threshold", 0.95),
+                max_entries=cfg.get("max_entries", 500),
+                ttl_seconds=ttl_minutes * 60 if ttl_minutes else None,
+                enabled=cfg.get("enabled", True),
+                changes_fn=report_changes,
+                vendors_fn=known_vendors,
+            )
+        return _cache
@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from rag_agents.rephrase_agent import rephrase_node
+from rag_agents.retrieval_agent import retrieval_node
+from rag_agents.generation_agent import generation_chain, GENERATION_PROMPT, NO_CONTEXT_ANSWER
+from rag_agents.reflection_agent import reflect
+from rag_agents.analytics_agent import analytics_node, route_question
+from rag_agents.answer_cache import get_answer_cache
+from utils.metrics import get_metrics
+from utils.token_usage import record_prompt, record_response
+
+metrics = get_metrics("chat_stream")
+RETRACT_MESSAGE = "This answer could not be verified against the processed invoices, so it has been withdrawn."
+# Keeps proxies from closing the connection while reflection runs
+HEARTBEAT_SECONDS = 5
+
+_reflection_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-reflect")
+
+def stream_chat(question: str, history: list):
+    """
+    Streaming version of rag_app: yields (event, data) pairs.
+      meta    -> the (rephrased) question and the route taken ("cache" for a stored answer)
+      token   -> a piece of the answer, as soon as the LLM produces it
+      answer  -> the full answer
+      verdict -> reflection grade, computed while the client is already showing the answer
+      retract -> the answer failed reflection and must be hidden
+      done    -> end of stream
+    """
+    started = time.time()
+    cache = get_answer_cache()
+    cached = cache.get(question, history)
+    if cached:
+        yield "meta", {"question": question, "route": "cache", "match": cached["match"]}
+        yield "token", {"text": cached["answer"]}
+        yield "answer", {"text": cached["answer"]}
+        yield "verdict", cached["reflection_score"]
+        yield "done", {"elapsed_ms": round((time.time() - started) * 1000)}
+        return
+
+    state = {"question": question, "chat_history": history}
+    state.update(rephrase_node(state))
+    route = route_question(state)
+    yield "meta", {"question": state["question"], "route": route}
+
+    if route == "analytics":
+        result = analytics_node(state)
+        cache.put(question, history, result)
+        yield "token", {"text": result["answer"]}
+        yield "answer", {"text": result["answer"]}
+        yield "verdict", result["reflection_score"]
+        yield "done", {"elapsed_ms": round((time.time() - started) * 1000)}
+        return
+
+    state.update(retrieval_node(state))
+    context = state.get("context_text", "")
+    if not context:
+        yield "token", {"text": NO_CONTEXT_ANSWER}
+        yield "answer", {"text": NO_CONTEXT_ANSWER}
+        yield "done", {"elapsed_ms": round((time.time() - started) * 1000)}
+        return
+
+    inputs = {"context": context, "question": state["question"]}
+    record_prompt("rag.generate", GENERATION_PROMPT.format(**inputs))
+    parts = []
+    for chunk in generation_chain().stream(inputs):
+        if not parts:
+            metrics.observe("time_to_first_token_ms", (time.time() - started) * 1000)
+        parts.append(chunk)
+        yield "token", {"text": chunk}
+    answer = "".join(parts)
+    record_response("rag.generate", answer)
+    yield "answer", {"text": answer}
+
+    # Reflection runs off the request thread; the client already has the full answer
+    verdict_future = _reflection_pool.submit(reflect, state["question"], context, answer)
+    while True:
+        try:
+            verdict = verdict_future.result(timeout=HEARTBEAT_SECONDS)
+            break
+        except TimeoutError:
+            yield "ping", {}
+    yield "verdict", verdict
+    cache.put(question, history, {"answer": answer, "reflection_score": verdict, "context": state.get("context")})
+    if not verdict.get("is_safe", False):
+        metrics.incr("retracted")
+        yield "retract", {"reason": verdict.get("reason"), "message": RETRACT_MESSAGE}
+
+    metrics.observe("total_ms", (time.time() - started) * 1000)
+    yield "done", {"elapsed_ms": round((time.time() - started) * 1000)}
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import time
+from array import array
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+from persona.persona_agent import load_rules
+from utils.disk_cache import DiskCache
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+load_dotenv()
+logger = get_logger("EMBEDDINGS")
+metrics = get_metrics("embeddings")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "outputs" / "cache" / "embedding_cache.db"
+
+class LocalEmbeddings(Embeddings):
+    """
+    Offline CPU embeddings via sentence-transformers (optional dependency).
+    `model_name` can be a hub id or a local folder, so no network is needed once the model is on disk.
+    """
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("embeddings.backend 'local' needs `pip install sentence-transformers`") from e
+        self.model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True, show_progress_bar=False)
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-hash embedding cache in front of any backend.
+    Keys are model id + input kind (query / document) + sha256(text), so re-indexing and
+    repeated questions reuse vectors, switching models never mixes vectors, and models
+    with asymmetric query/document embeddings never get the other kind back. Misses are embedded in batches.
+    """
+    def __init__(self, backend: Embeddings, model_id: str, batch_size: int = 32, cache: DiskCache = None):
+        self.backend = backend
+        self.model_id = model_id
+        self.batch_size = max(1, int(batch_size))
+        self.cache = cache
+
+    def _key(self, text: str, kind: str) -> str:
+        return f"{self.model_id}:{kind}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, text: str, kind: str):
+        if self.cache is None:
+            return None
+        blob = self.cache.get(self._key(text, kind))
+        return array("f", blob).tolist() if blob else None
+
+    def _store(self, text: str, vector, kind: str):
+        if self.cache is not None:
+            self.cache.put(self._key(text, kind), array("f", vector).tobytes(), version=self.model_id)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = [self._lookup(t, "doc") for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            started = time.time()
+            computed = self.backend.embed_documents([texts[i] for i in batch])
+            metrics.observe("batch_ms", (time.time() - started) * 1000)
+            metrics.incr("embedded", len(batch))
+            for i, vector in zip(batch, computed):
+                vectors[i] = list(vector)
+                self._store(texts[i], vectors[i], "doc")
+
+        metrics.incr("cached", len(texts) - len(missing))
+        return vectors
+
+    def embed_query(self, text):
+        vector = self._lookup(text, "query")
+        if vector is not None:
+            metrics.incr("cached")
+            return vector
+        vector = list(self.backend.embed_query(text))
+        metrics.incr("embedded")
+        self._store(text, vector, "query")
+        return vector
+
+def build_embeddings(cfg: dict = None) -> Embeddings:
+    """
+    Embeddings for the RAG stack, chosen in rules.yaml (embeddings.backend):
+      google - Gemini text-embedding API
+      local  - sentence-transformers on CPU (no network once the model is downloaded)
+    """
+    cfg = cfg if cfg is not None else load_rules().get("embeddings", {})
+    backend_name = cfg.get("backend", "google")
+    batch_size = int(cfg.get("batch_size", 32))
+
+    if backend_name == "local":
+        model_id = cfg.get("local_model", "sentence-transformers/all-MiniLM-L6-v2")
+        backend = LocalEmbeddings(model_id, device=cfg.get("device", "cpu"), batch_size=batch_size)
+    else:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        model_id = cfg.get("google_model", "models/text-embedding-004")
+        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        backend = GoogleGenerativeAIEmbeddings(model=model_id, google_api_key=api_key)
+    logger.info(f"Embeddings: {backend_name} ({model_id})")
+
+    cache = None
+    if cfg.get("cache", True):
+        ttl_hours = cfg.get("cache_ttl_hours")
+        cache = DiskCache(
+            cfg.get("cache_path") or DEFAULT_CACHE_PATH,
+            namespace="embedding_cache",
+            ttl_seconds=ttl_hours * 3600 if ttl_hours else None,
+            max_entries=int(cfg.get("cache_max_entries", 50000)),
+        )
+    return CachedEmbeddings(backend, model_id, batch_size=batch_size, cache=cache)
@@ -0,0 +1,95 @@
+import random
+import re
+from persona.persona_agent import load_rules
+from rag_agents.hybrid_search import tokenize
+from utils.metrics import get_metrics
+
+metrics = get_metrics("rag_gates")
+
+# Words that only make sense with the previous turns
+REFERENCE_WORDS = re.compile(
+    r"\b(it|its|they|them|their|that|those|this|these|he|she|him|her|same|above|previous|former|latter|"
+    r"one|ones|there|then|again|else|other|another)\b", re.I
+)
+FOLLOW_UP_START = re.compile(r"^\s*(and|or|but|also|so|what about|how about|why|and what|same for|ok|okay)\b", re.I)
+# A subject of its own: an invoice / PO number or a longer number anywhere, or a CamelCase
+# name ("BlueOcean") after the first word. A capitalised first word is just the sentence start.
+ID_ENTITY = re.compile(r"\b[A-Za-z]{2,}[-_#]?\d+|\b\d{3,}\b")
+NAME_ENTITY = re.compile(r"\b[A-Z][a-z]+[A-Z]\w*")
+# "What is the vendor?" / "Show the line items": a short question about "the" thing discussed before
+DEFINITE_REFERENCE = re.compile(r"\bthe\b", re.I)
+SMALL_TALK = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|good (morning|afternoon|evening)|bye|ok|okay|cool|great)\b[\s!.?]*$", re.I)
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+def _cfg() -> dict:
+    return load_rules().get("rag_gates", {})
+
+def has_entity(question: str) -> bool:
+    if ID_ENTITY.search(question or ""):
+        return True
+    rest = (question or "").strip().split(None, 1)
+    return len(rest) > 1 and NAME_ENTITY.search(rest[1]) is not None
+
+def needs_rephrase(question: str, history: list) -> tuple:
+    """(needed, reason): only follow-ups that lean on earlier turns get the LLM rewrite."""
+    if not history:
+        return False, "no_history"
+    if not _cfg().get("enabled", True):
+        return True, "gates_disabled"
+    if SMALL_TALK.match(question):
+        return False, "small_talk"
+    if FOLLOW_UP_START.search(question):
+        return True, "follow_up"
+    if REFERENCE_WORDS.search(question):
+        return True, "reference"
+    if has_entity(question):
+        return False, "standalone"
+    # Very short questions without their own subject ("and last month?") are fragments
+    if len(question.split()) <= 4:
+        return True, "fragment"
+    if len(question.split()) <= 6 and DEFINITE_REFERENCE.search(question):
+        return True, "definite_reference"
+    return False, "standalone"
+
+def _numbers(text: str) -> set:
+    """'1,617.00' and '1617' compare equal; '100' and '1' don't."""
+    return {f"{float(n.replace(',', '')):.2f}" for n in NUMBER.findall(text or "")}
+
+def grounding_score(answer: str, context: str) -> float:
+    """Share of the answer's content words found in the context; 0 if it has numbers the context doesn't."""
+    if not _numbers(answer) <= _numbers(context):
+        return 0.0
+    words = set(tokenize(answer))
+    if not words:
+        return 1.0
+    context_words = set(tokenize(context))
+    return len(words & context_words) / len(words)
+
+def should_reflect(question: str, answer: str, context: str, fixed_answers=()) -> tuple:
+    """
+    (reflect, reason, local_score). Skips the grading LLM call when it can't change anything
+    (small talk, canned "not found" answers) and samples answers that are clearly grounded.
+    """
+    cfg = _cfg()
+    if not cfg.get("enabled", True):
+        return True, "gates_disabled", None
+    if SMALL_TALK.match(question or ""):
+        return False, "small_talk", 1.0
+    if (answer or "").strip() in fixed_answers or re.match(r"^\s*i don'?t know\b", answer or "", re.I):
+        return False, "no_answer", 1.0
+    if not context or context == "No documents found.":
+        return False, "no_context", 1.0
+
+    score = grounding_score(answer, context)
+    if score >= float(cfg.get("min_overlap", 0.6)):
+        if random.random() >= float(cfg.get("grounded_sample_rate", 0.1)):
+            return False, "grounded", round(score, 2)
+        return True, "sampled", round(score, 2)
+    return True, "ungrounded", round(score, 2)
+
+def record_gate(stage: str, called: bool, reason: str):
+    """Counts called vs skipped LLM calls per gate (rag_gates metrics)."""
+    metrics.incr(f"{stage}.{'called' if called else 'skipped'}")
+    metrics.incr(f"{stage}.reason.{reason}")
+    if not called:
+        metrics.incr("llm_calls_saved")
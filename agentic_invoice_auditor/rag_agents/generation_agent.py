@@ -1,6 +1,28 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from rag_agents.rag_llms import rag_llm
+from utils.token_usage import record_prompt, record_response
+
+GENERATION_PROMPT = ChatPromptTemplate.from_template(
+    """You are an AI Invoice Assistant.
+    Always Greet the user if they say hi or hello.
+      Use the following context to answer the question.
+    
+    CONTEXT:
+    {context}
+    
+    QUESTION: 
+    {question}
+    
+    If the answer is not in the context, say "I don't know".
+    Keep the answer concise and professional.
+    ANSWER:"""
+)
+NO_CONTEXT_ANSWER = "I could not find any relevant information in the processed invoices."
+
+def generation_chain():
+    """prompt | llm | parser - shared by the blocking node and the streaming endpoint."""
+    return GENERATION_PROMPT | rag_llm | StrOutputParser()
 
 def generation_node(state: dict) -> dict:
     """
@@ -12,25 +34,12 @@ def generation_node(state: dict) -> dict:
     context = state.get("context_text", "")
     
     if not context:
-        return {"answer": "I could not find any relevant information in the processed invoices."}
+        return {"answer": NO_CONTEXT_ANSWER}
 
-    prompt = ChatPromptTemplate.from_template(
-        """You are an AI Invoice Assistant.
-        Always Greet the user if they say hi or hello.
-          Use the following context to answer the question.
-        
-        CONTEXT:
-        {context}
-        
-        QUESTION: 
-        {question}
-        
-        If the answer is not in the context, say "I don't know".
-        Keep the answer concise and professional.
-        ANSWER:"""
-    )
+    inputs = {"context": context, "question": question}
+    record_prompt("rag.generate", GENERATION_PROMPT.format(**inputs))
     
-    chain = prompt | rag_llm | StrOutputParser()
-    answer = chain.invoke({"context": context, "question": question})
+    answer = generation_chain().invoke(inputs)
+    record_response("rag.generate", answer)
     
-    return {"answer": answer}
\ No newline at end of file
+    return {"answer": answer}
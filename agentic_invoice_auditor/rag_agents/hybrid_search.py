@@ -0,0 +1,382 @@
+import math
+import re
+import time
+from bisect import bisect_left, bisect_right
+from calendar import monthrange
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from rag_agents.index_builder import selector_params
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+from utils.text_parsing import parse_number
+
+logger = get_logger("HYBRID_SEARCH")
+metrics = get_metrics("vector_index")
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "from", "by", "with", "is", "are",
+    "was", "were", "be", "it", "this", "that", "what", "which", "who", "how", "many", "much", "show",
+    "me", "list", "all", "any", "did", "do", "does", "we", "our", "i", "my", "invoice", "invoices",
+}
+MONTHS = {m: i for i, m in enumerate(
+    ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"], 1
+)}
+# Loose status words only boost the ranking ("does INV-1001 have any issues?" must still find a passed invoice)
+FAIL_WORDS = re.compile(r"\b(fail(ed|ing|s|ure)?|rejected|flagged|invalid|problems?|issues?|discrepanc(y|ies))\b", re.I)
+PASS_WORDS = re.compile(r"\b(pass(ed|ing)?|approved|valid|clean)\b", re.I)
+# Explicit phrasing ("failed invoices", "invoices that were rejected") becomes a status filter
+_INVOICE_NOUN = r"(invoices?|bills?|ones)"
+FAILED_INVOICES = re.compile(
+    rf"\b(failed|failing|rejected|flagged|invalid)\s+{_INVOICE_NOUN}\b|\b{_INVOICE_NOUN}\s+(that|which)\s+(have\s+|had\s+)?(failed|were\s+rejected|were\s+flagged)\b", re.I
+)
+PASSED_INVOICES = re.compile(
+    rf"\b(passed|approved|valid|clean)\s+{_INVOICE_NOUN}\b|\b{_INVOICE_NOUN}\s+(that|which)\s+(have\s+|had\s+)?(passed|were\s+approved)\b", re.I
+)
+# "may" is only the month next to a year or after a preposition ("in May", "May 2025", not "what may I ask")
+MAY_MONTH = re.compile(r"\b(in|during|of|since|from|for|by|until|through|before|after|last|this|early|late|mid)\s+may\b|\bmay\s+\d{4}\b", re.I)
+AMOUNT_MIN = re.compile(r"\b(over|above|more than|greater than|at least)\s*[$€£¥₹]?\s*([\d][\d,.]*)", re.I)
+AMOUNT_MAX = re.compile(r"\b(under|below|less than|at most)\s*[$€£¥₹]?\s*([\d][\d,.]*)", re.I)
+
+def tokenize(text: str) -> list:
+    return [t for t in re.findall(r"\w+", (text or "").lower()) if t not in STOPWORDS and len(t) > 1]
+
+class LexicalIndex:
+    """
+    BM25 postings plus a structured-metadata index over the positions of one index generation.
+    Exact fields (status, vendor, invoice_no, currency) are inverted sets;
+    date and amount are sorted lists for range filters.
+    """
+    EXACT_FIELDS = ("status", "vendor", "invoice_no", "currency")
+
+    def __init__(self, docs: list, k1: float = 1.5, b: float = 0.75):
+        """docs: [(position, Document), ...]"""
+        self.k1, self.b = k1, b
+        self.postings = defaultdict(dict) # term -> {position: tf}
+        self.lengths = {}
+        self.exact = {f: defaultdict(set) for f in self.EXACT_FIELDS}
+        self.dates, self.amounts = [], []
+        self.vendor_names = {}
+        self.unstructured = set() # Legacy documents with no structured fields: never excluded by a filter
+
+        for pos, doc in docs:
+            terms = Counter(tokenize(doc.page_content))
+            self.lengths[pos] = sum(terms.values())
+            for term, tf in terms.items():
+                self.postings[term][pos] = tf
+            meta = doc.metadata or {}
+            for field in self.EXACT_FIELDS:
+                if meta.get(field):
+                    self.exact[field][str(meta[field]).strip().lower()].add(pos)
+            if meta.get("vendor"):
+                self.vendor_names[str(meta["vendor"]).strip().lower()] = meta["vendor"]
+            if meta.get("date"):
+                self.dates.append((meta["date"], pos))
+            if isinstance(meta.get("amount"), (int, float)):
+                self.amounts.append((float(meta["amount"]), pos))
+            if not any(meta.get(f) for f in self.EXACT_FIELDS + ("date", "amount")):
+                self.unstructured.add(pos)
+
+        self.dates.sort()
+        self.amounts.sort()
+        self.n = len(self.lengths)
+        self.total_len = sum(self.lengths.values())
+        self.avg_len = (self.total_len / self.n) if self.n else 0.0
+
+    @property
+    def invoice_nos(self):
+        return self.exact["invoice_no"].keys()
+
+    def positions(self) -> set:
+        """Every live position in this generation."""
+        return set(self.lengths)
+
+    # --- Filters ---
+    def filter(self, filters: dict):
+        """Returns the set of positions matching every filter, or None when there are no filters."""
+        if not filters:
+            return None
+        result = None
+        for field in self.EXACT_FIELDS:
+            values = filters.get(field)
+            if values:
+                matched = set().union(*(self.exact[field].get(str(v).lower(), set()) for v in values))
+                result = matched if result is None else result & matched
+        if filters.get("date_from") or filters.get("date_to"):
+            keys = [d for d, _ in self.dates]
+            lo = bisect_left(keys, filters.get("date_from") or "0000-00-00")
+            hi = bisect_right(keys, filters.get("date_to") or "9999-99-99")
+            matched = {pos for _, pos in self.dates[lo:hi]}
+            result = matched if result is None else result & matched
+        if filters.get("amount_min") is not None or filters.get("amount_max") is not None:
+            keys = [a for a, _ in self.amounts]
+            lo = bisect_left(keys, filters["amount_min"]) if filters.get("amount_min") is not None else 0
+            hi = bisect_right(keys, filters["amount_max"]) if filters.get("amount_max") is not None else len(keys)
+            matched = {pos for _, pos in self.amounts[lo:hi]}
+            result = matched if result is None else result & matched
+        return result | self.unstructured if result is not None else None
+
+    # --- BM25 ---
+    def bm25(self, query: str, candidates=None, limit: int = 20, stats: tuple = None, with_scores: bool = False) -> list:
+        """
+        Positions ranked by BM25 (only those in candidates, when given).
+        stats (see corpus_stats) replaces this index's own document count, average length and
+        document frequencies, so scores from several shards are on one scale.
+        """
+        n, avg_len, df = stats or (self.n, self.avg_len, {})
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            freq = df.get(term, len(postings))
+            idf = math.log(1 + (n - freq + 0.5) / (freq + 0.5))
+            for pos, tf in postings.items():
+                if candidates is not None and pos not in candidates:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[pos] / (avg_len or 1))
+                scores[pos] += idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(scores.items(), key=lambda x: -x[1])[:limit]
+        return ranked if with_scores else [pos for pos, _ in ranked]
+
+class Vocabulary:
+    """Vendor names and invoice numbers known to several lexical indexes (e.g. every shard), for parse_filters."""
+    def __init__(self, lexicals: list):
+        self.vendor_names, invoice_nos = {}, set()
+        for lexical in lexicals:
+            self.vendor_names.update(lexical.vendor_names)
+            invoice_nos.update(lexical.invoice_nos)
+        self.invoice_nos = invoice_nos
+
+def corpus_stats(lexicals: list, question: str) -> tuple:
+    """BM25 statistics of several lexical indexes taken as one corpus: (n, avg_len, {term: document frequency})."""
+    n = sum(lexical.n for lexical in lexicals)
+    total_len = sum(lexical.total_len for lexical in lexicals)
+    df = {term: sum(len(lexical.postings.get(term, ())) for lexical in lexicals) for term in set(tokenize(question))}
+    return n, (total_len / n) if n else 0.0, df
+
+def _month_range(year: int, month: int) -> tuple:
+    return date(year, month, 1).isoformat(), date(year, month, monthrange(year, month)[1]).isoformat()
+
+def parse_date_filter(question: str, today: date = None) -> tuple:
+    """'last month', 'this quarter', 'Q1 2025', 'last 30 days', 'March 2025', '2025-03' -> (date_from, date_to) or (None, None)."""
+    today = today or date.today()
+    q = question.lower()
+    if "yesterday" in q:
+        d = (today - timedelta(days=1)).isoformat()
+        return d, d
+    if "today" in q:
+        return today.isoformat(), today.isoformat()
+    m = re.search(r"\b(?:last|past)\s+(\d+)\s+days?\b", q)
+    if m:
+        return (today - timedelta(days=int(m.group(1)))).isoformat(), today.isoformat()
+    if re.search(r"\blast week\b", q):
+        start = today - timedelta(days=today.weekday() + 7)
+        return start.isoformat(), (start + timedelta(days=6)).isoformat()
+    if re.search(r"\bthis week\b", q):
+        return (today - timedelta(days=today.weekday())).isoformat(), today.isoformat()
+    if re.search(r"\blast month\b", q):
+        prev = today.replace(day=1) - timedelta(days=1)
+        return _month_range(prev.year, prev.month)
+    if re.search(r"\bthis month\b", q):
+        return today.replace(day=1).isoformat(), today.isoformat()
+    quarter = (today.month - 1) // 3
+    if re.search(r"\bthis quarter\b", q):
+        return date(today.year, quarter * 3 + 1, 1).isoformat(), today.isoformat()
+    if re.search(r"\blast quarter\b", q):
+        year, quarter = (today.year, quarter - 1) if quarter else (today.year - 1, 3)
+        return date(year, quarter * 3 + 1, 1).isoformat(), _month_range(year, quarter * 3 + 3)[1]
+    m = re.search(r"\bq([1-4])(?:\s+(\d{4}))?\b", q)
+    if m:
+        year = int(m.group(2)) if m.group(2) else today.year
+        first = (int(m.group(1)) - 1) * 3 + 1
+        return date(year, first, 1).isoformat(), _month_range(year, first + 2)[1]
+    if re.search(r"\blast year\b", q):
+        return f"{today.year - 1}-01-01", f"{today.year - 1}-12-31"
+    if re.search(r"\bthis year\b", q):
+        return f"{today.year}-01-01", today.isoformat()
+    m = re.search(r"\b(\d{4})-(\d{2})\b", q)
+    if m and 1 <= int(m.group(2)) <= 12:
+        return _month_range(int(m.group(1)), int(m.group(2)))
+    m = re.search(r"\b(" + "|".join(MONTHS) + r")\b(?:\s+(\d{4}))?", q)
+    if m and m.group(1) == "may" and not MAY_MONTH.search(q):
+        m = re.search(r"\b(" + "|".join(k for k in MONTHS if k != "may") + r")\b(?:\s+(\d{4}))?", q)
+    if m:
+        month = MONTHS[m.group(1)]
+        year = int(m.group(2)) if m.group(2) else (today.year if month <= today.month else today.year - 1)
+        return _month_range(year, month)
+    return None, None
+
+def status_hint(question: str):
+    """'FAIL' / 'PASS' when the question leans one way (a ranking boost, not a filter), else None."""
+    failed, passed = FAIL_WORDS.search(question), PASS_WORDS.search(question)
+    if failed and not passed:
+        return "FAIL"
+    if passed and not failed:
+        return "PASS"
+    return None
+
+def parse_filters(question: str, vocabulary, today: date = None) -> dict:
+    """
+    Hard filters implied by a chat question. Vendors / invoice numbers only match values known
+    to the vocabulary (a LexicalIndex or a Vocabulary over shards); status only on explicit
+    phrasing ("failed invoices"), see status_hint otherwise.
+    """
+    q = question.lower()
+    filters = {}
+
+    failed, passed = FAILED_INVOICES.search(q), PASSED_INVOICES.search(q)
+    if failed and not passed:
+        filters["status"] = ["FAIL"]
+    elif passed and not failed:
+        filters["status"] = ["PASS"]
+
+    vendors = []
+    for key, name in vocabulary.vendor_names.items():
+        first = re.split(r"\W+", key)[0]
+        if key in q or (len(first) >= 4 and re.search(rf"\b{re.escape(first)}\b", q)):
+            vendors.append(name)
+    if vendors:
+        filters["vendor"] = vendors
+
+    invoice_nos = [n for n in vocabulary.invoice_nos if len(n) >= 3 and re.search(rf"(?<!\w){re.escape(n)}(?!\w)", q)]
+    if invoice_nos:
+        filters["invoice_no"] = invoice_nos
+
+    date_from, date_to = parse_date_filter(question, today)
+    if date_from:
+        filters["date_from"], filters["date_to"] = date_from, date_to
+
+    m = AMOUNT_MIN.search(question)
+    if m and parse_number(m.group(2)) is not None:
+        filters["amount_min"] = parse_number(m.group(2))
+    m = AMOUNT_MAX.search(question)
+    if m and parse_number(m.group(2)) is not None:
+        filters["amount_max"] = parse_number(m.group(2))
+    return filters
+
+def vector_ranks(db, query_vector, limit: int, candidates=None, brute_force_max: int = 5000, with_scores: bool = False) -> list:
+    """
+    ANN positions for a query, restricted to candidates *before* the search:
+    small candidate sets are scored exactly, larger ones use a FAISS IDSelector.
+    with_scores returns [(position, distance)], smaller is closer (inner products negated),
+    so hits from indexes built with the same embeddings compare directly.
+    """
+    import numpy as np
+    import faiss
+    index = db.index
+    x = np.asarray([query_vector], dtype="float32")
+    sign = -1.0 if index.metric_type == faiss.METRIC_INNER_PRODUCT else 1.0
+    hits = None
+    if candidates is None:
+        distances, ids = index.search(x, min(limit, index.ntotal))
+        hits = [(int(i), sign * float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+    elif not candidates:
+        hits = []
+    else:
+        ids = np.fromiter(sorted(candidates), dtype="int64")
+        if len(ids) <= brute_force_max:
+            try:
+                vectors = index.reconstruct_batch(ids)
+                if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                    distances = -(vectors @ x[0])
+                else:
+                    distances = ((vectors - x[0]) ** 2).sum(axis=1)
+                hits = [(int(ids[i]), float(distances[i])) for i in np.argsort(distances)[:limit]]
+            except Exception:
+                pass # Index can't reconstruct vectors (e.g. IVF without direct map) - use a selector
+        if hits is None:
+            distances, found = index.search(x, min(limit, len(ids)), params=selector_params(index, ids))
+            hits = [(int(i), sign * float(d)) for i, d in zip(found[0], distances[0]) if i >= 0]
+    return hits if with_scores else [pos for pos, _ in hits]
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60, with_scores: bool = False) -> list:
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, pos in enumerate(ranking):
+            scores[pos] += 1.0 / (k + rank + 1)
+    fused = sorted(scores.items(), key=lambda x: -x[1])
+    return fused if with_scores else [pos for pos, _ in fused]
+
+def resolve_filters(question: str, vocabulary, lexicals: list) -> dict:
+    """Filters for a question, or {} (an unfiltered search) when they match nothing in any of the indexes."""
+    filters = parse_filters(question, vocabulary)
+    if not filters:
+        return filters
+    matched = sum(len(lexical.filter(filters)) for lexical in lexicals)
+    logger.info(f"Filters {filters} -> {matched} candidate(s)")
+    metrics.incr("filtered_queries")
+    if not matched:
+        metrics.incr("filter_fallbacks")
+        return {}
+    return filters
+
+def _document(db, pos: int):
+    doc_id = db.index_to_docstore_id.get(pos)
+    doc = db.docstore.search(doc_id) if doc_id is not None else None
+    return None if doc is None or isinstance(doc, str) else doc
+
+def hybrid_rankings(db, lexical: LexicalIndex, question: str, query_vector, filters: dict, cfg: dict = None,
+                    stats: tuple = None, bm25: bool = True) -> tuple:
+    """
+    One index's share of a hybrid search over the positions matching (already resolved) filters:
+    ([(Document, distance)] nearest first, [(Document, BM25 score)] best first).
+    Both scales are comparable across indexes (see vector_ranks, corpus_stats).
+    """
+    cfg = cfg or {}
+    candidates = lexical.filter(filters)
+    if candidates is None and lexical.n < db.index.ntotal:
+        # Tombstoned (replaced / deleted) vectors are still in the index until compaction
+        candidates = lexical.positions()
+    fetch_k = max(1, int(cfg.get("fetch_k", 20)))
+    vector = vector_ranks(db, query_vector, fetch_k, candidates, int(cfg.get("brute_force_max", 5000)), with_scores=True)
+    lexical_hits = lexical.bm25(question, candidates, fetch_k, stats=stats, with_scores=True) if bm25 else []
+    resolve = lambda hits: [(doc, score) for doc, score in ((_document(db, pos), score) for pos, score in hits) if doc is not None]
+    return resolve(vector), resolve(lexical_hits)
+
+def fuse_rankings(question: str, vector_hits: list, lexical_hits: list, filters: dict, k: int = 3, cfg: dict = None,
+                  hint: bool = True) -> list:
+    """
+    Reciprocal rank fusion of vector and BM25 hits, from one index or gathered from many:
+    each kind is ranked by its own score first. A loose status word ("issues", "approved")
+    adds a ranking that favours invoices with that status. Returns [(Document, fused score)].
+    """
+    cfg = cfg or {}
+    fetch_k = max(k, int(cfg.get("fetch_k", 20)))
+    docs = {}
+
+    def ranking(hits):
+        keys = []
+        for doc, _ in hits:
+            key = (doc.metadata or {}).get("doc_id") or id(doc)
+            docs.setdefault(key, doc)
+            keys.append(key)
+        return keys
+
+    rankings = [
+        ranking(sorted(vector_hits, key=lambda hit: hit[1])[:fetch_k]),
+        ranking(sorted(lexical_hits, key=lambda hit: -hit[1])[:fetch_k]),
+    ]
+    status = status_hint(question) if hint and not filters.get("status") else None
+    if status:
+        rankings.append([key for key in dict.fromkeys(rankings[0] + rankings[1])
+                         if str((docs[key].metadata or {}).get("status") or "").upper() == status])
+    fused = reciprocal_rank_fusion(rankings, int(cfg.get("rrf_k", 60)), with_scores=True)[:k]
+    return [(docs[key], score) for key, score in fused]
+
+def hybrid_search(db, lexical: LexicalIndex, embeddings, question: str, k: int = 3, cfg: dict = None,
+                  query_vector=None, with_scores: bool = False, filters: dict = None) -> list:
+    """
+    Metadata pre-filter -> (vector ANN, BM25) over the candidates -> reciprocal rank fusion.
+    A filter that leaves nothing falls back to the unfiltered search. filters (from
+    resolve_filters) skips parsing the question, e.g. when it was parsed once for every shard.
+    """
+    cfg = cfg or {}
+    started = time.time()
+    if filters is None:
+        filters = resolve_filters(question, lexical, [lexical])
+    if query_vector is None:
+        query_vector = embeddings.embed_query(question)
+    vector_hits, lexical_hits = hybrid_rankings(db, lexical, question, query_vector, filters, cfg)
+    docs = fuse_rankings(question, vector_hits, lexical_hits, filters, k, cfg)
+    metrics.observe("hybrid_search_ms", (time.time() - started) * 1000)
+    return docs if with_scores else [doc for doc, _ in docs]
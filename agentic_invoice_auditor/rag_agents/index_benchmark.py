@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+from pathlib import Path
+from persona.persona_agent import load_rules
+from rag_agents.index_builder import build_trained_index, tune_index
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_PATH = BASE_DIR / "outputs" / "benchmarks" / "index_benchmark.json"
+
+DEFAULT_TYPES = ["Flat", "HNSW32", "IVF1024,Flat", "IVF1024,SQ8", "IVF1024,PQ32"]
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0):
+    """Clustered, normalized vectors - closer to real embeddings than uniform noise."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(8, n // 500), dim)).astype("float32")
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+def index_vectors():
+    """Vectors of the published invoice index (for benchmarking on real data)."""
+    from rag_agents.index_service import read_current
+    from rag_agents.index_builder import read_vectors
+    from rag_agents.resident_index import load_snapshot
+    from rag_agents.retrieval_agent import embeddings, DB_PATH
+    _, snapshot = read_current(DB_PATH)
+    if snapshot is None:
+        raise SystemExit("No published index generation to benchmark")
+    return read_vectors(load_snapshot(snapshot, embeddings), embeddings)
+
+def benchmark(vectors, queries, factories: list, k: int = 10, cfg: dict = None) -> list:
+    """recall@k against exact search, p50/p99 single-query latency and memory per 1M vectors for each index type."""
+    import faiss
+    import numpy as np
+    cfg = cfg or {}
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for factory in factories:
+        started = time.time()
+        try:
+            index = tune_index(build_trained_index(vectors, factory, faiss.METRIC_L2, int(cfg.get("max_train_vectors", 100000))), cfg)
+        except Exception as e:
+            results.append({"index_type": factory, "error": str(e)})
+            continue
+        build_seconds = time.time() - started
+
+        latencies, hits = [], 0
+        for i in range(len(queries)):
+            t0 = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += len(set(found[0]) & set(truth[i]))
+
+        size = len(faiss.serialize_index(index))
+        results.append({
+            "index_type": factory,
+            f"recall@{k}": round(hits / (k * len(queries)), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "mb_per_1m_vectors": round(size / len(vectors) * 1_000_000 / 2**20, 1),
+            "build_seconds": round(build_seconds, 2),
+        })
+    return results
+
+def main():
+    """
+    python -m rag_agents.index_benchmark --n 200000 --dim 768
+    python -m rag_agents.index_benchmark --source index --types Flat HNSW32
+    """
+    import numpy as np
+    cfg = load_rules().get("vector_index", {})
+    parser = argparse.ArgumentParser(description="Compare FAISS index types: recall@k, latency and memory")
+    parser.add_argument("--source", choices=["synthetic", "index"], default="synthetic")
+    parser.add_argument("--n", type=int, default=100000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=cfg.get("benchmark_types", DEFAULT_TYPES))
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.n, args.dim) if args.source == "synthetic" else index_vectors()
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors, like questions close to indexed invoices
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + 0.05 * rng.normal(size=(args.queries, vectors.shape[1])).astype("float32")
+    queries = queries.astype("float32")
+
+    print(f"Benchmarking {len(vectors)} x {vectors.shape[1]} vectors, {len(queries)} queries, k={args.k}")
+    results = benchmark(vectors, queries, args.types, args.k, cfg)
+    for r in results:
+        if "error" in r:
+            print(f"  {r['index_type']:<16} ERROR: {r['error']}")
+            continue
+        print(
+            f"  {r['index_type']:<16} recall@{args.k}={r[f'recall@{args.k}']:.3f}  p50={r['p50_ms']:.2f}ms  "
+            f"p99={r['p99_ms']:.2f}ms  {r['mb_per_1m_vectors']:.0f} MB/1M  build={r['build_seconds']:.1f}s"
+        )
+
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
+        json.dump({"n": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "created_at": time.time(), "results": results}, f, indent=2)
+    print(f"Saved to {RESULTS_PATH}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import time
+from utils.logger import get_logger
+
+logger = get_logger("INDEX_BUILDER")
+
+# vector_index.index_type takes any faiss index_factory string, e.g.
+#   "Flat"          exact brute force, full float32 vectors (default)
+#   "HNSW32"        graph index, no training, fast queries, more memory than Flat
+#   "IVF1024,Flat"  inverted lists, needs training, exact vectors in each list
+#   "IVF1024,PQ32"  inverted lists + product quantization (32 bytes per vector)
+#   "IVF1024,SQ8"   inverted lists + 8-bit scalar quantization
+
+def is_exact_storage(index) -> bool:
+    """True when the index keeps the original vectors (so they can be read back for a rebuild)."""
+    import faiss
+    return isinstance(index, (faiss.IndexFlat, faiss.IndexHNSWFlat))
+
+def build_trained_index(vectors, factory: str, metric=None, max_train_vectors: int = 100000):
+    """Creates a faiss index from an index_factory string, trains it if needed and adds the vectors in order."""
+    import faiss
+    import numpy as np
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    metric = faiss.METRIC_L2 if metric is None else metric
+    index = faiss.index_factory(vectors.shape[1], factory, metric)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > max_train_vectors:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), max_train_vectors, replace=False)]
+        started = time.time()
+        index.train(sample)
+        logger.info(f"Trained {factory} on {len(sample)} vectors in {time.time() - started:.1f}s")
+    index.add(vectors)
+    return index
+
+def tune_index(index, cfg: dict):
+    """Applies query-time knobs (vector_index.nprobe / ef_search) where the index type has them."""
+    import faiss
+    params = faiss.ParameterSpace()
+    for name, key in (("nprobe", "nprobe"), ("efSearch", "ef_search")):
+        if cfg.get(key):
+            try:
+                params.set_index_parameter(index, name, int(cfg[key]))
+            except Exception:
+                pass # Not applicable to this index type
+    # IVF can't read vectors back without a direct map; filtered searches over
+    # small candidate sets need it to score candidates exactly
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and cfg.get("ivf_direct_map", True):
+        ivf.make_direct_map()
+    return index
+
+def selector_params(index, ids):
+    """SearchParameters restricting a search to ids, of the subclass the index type expects."""
+    import faiss
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def read_vectors(db, embeddings, positions=None):
+    """
+    Vectors of a LangChain FAISS store in position order, all or only the given positions
+    (re-embedded via the cache if the index is lossy).
+    """
+    import numpy as np
+    index = db.index
+    if is_exact_storage(index):
+        if positions is None:
+            return index.reconstruct_n(0, index.ntotal)
+        return index.reconstruct_batch(np.asarray(positions, dtype="int64"))
+    positions = range(index.ntotal) if positions is None else positions
+    texts = [db.docstore.search(db.index_to_docstore_id[pos]).page_content for pos in positions]
+    return np.asarray(embeddings.embed_documents(texts), dtype="float32")
+
+def rebuild(db, embeddings, factory: str, cfg: dict = None):
+    """Replaces db.index with a freshly trained index of another type. Positions (and the docstore mapping) are kept."""
+    cfg = cfg or {}
+    started = time.time()
+    vectors = read_vectors(db, embeddings)
+    index = build_trained_index(vectors, factory, db.index.metric_type, int(cfg.get("max_train_vectors", 100000)))
+    db.index = tune_index(index, cfg)
+    logger.info(f"Rebuilt index as {factory} ({index.ntotal} vectors) in {time.time() - started:.1f}s")
+    return db
+
+def live_documents(db) -> list:
+    """[(position, docstore id, Document)] of a store, skipping tombstoned positions."""
+    live = []
+    for pos in sorted(db.index_to_docstore_id):
+        doc = db.docstore.search(db.index_to_docstore_id[pos])
+        if not isinstance(doc, str):
+            live.append((pos, db.index_to_docstore_id[pos], doc))
+    return live
+
+def compact(db, embeddings, factory: str, cfg: dict = None):
+    """
+    A new store holding only the live documents of db (tombstoned positions, whose
+    docstore entry was deleted, are dropped), rebuilt as the given index type.
+    Docstore ids are kept. Returns None if nothing is live.
+    """
+    from langchain_community.vectorstores import FAISS
+    started = time.time()
+    live = live_documents(db)
+    if not live:
+        return None
+    vectors = read_vectors(db, embeddings, [pos for pos, _, _ in live])
+    compacted = FAISS.from_embeddings(
+        [(doc.page_content, list(vector)) for (_, _, doc), vector in zip(live, vectors)],
+        embeddings,
+        metadatas=[doc.metadata for _, _, doc in live],
+        ids=[store_id for _, store_id, _ in live],
+        distance_strategy=db.distance_strategy,
+    )
+    if factory != "Flat":
+        rebuild(compacted, embeddings, factory, cfg)
+    logger.info(f"Compacted {db.index.ntotal} -> {len(live)} vectors in {time.time() - started:.1f}s")
+    return compacted
+
+def main():
+    """
+    Offline rebuild (stop the API first - it owns the index writer):
+        python -m rag_agents.index_builder --type "IVF1024,PQ32"
+        python -m rag_agents.index_builder --compact
+    """
+    from persona.persona_agent import load_rules
+    from rag_agents.index_service import get_index_service
+    parser = argparse.ArgumentParser(description="Rebuild the invoice vector index with another FAISS index type")
+    parser.add_argument("--type", help="faiss index_factory string (default: vector_index.index_type); a different type stays pinned")
+    parser.add_argument("--compact", action="store_true", help="only drop tombstoned vectors, keeping the current index type")
+    args = parser.parse_args()
+
+    service = get_index_service()
+    if args.compact:
+        if not service.compact():
+            print("Nothing to compact.")
+        service.close()
+        return
+    configured = load_rules().get("vector_index", {}).get("index_type", "Flat")
+    factory = args.type or configured
+    # A type other than the configured one is pinned, or the next flush would switch back
+    pinned = factory != configured
+    service.rebuild(factory, pin=pinned)
+    print(f"Index rebuilt as {factory}" + (f" (pinned; run without --type to return to {configured})" if pinned else ""))
+    service.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,547 @@
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from langchain_community.vectorstores import FAISS
+from persona.persona_agent import load_rules
+try:
+    import fcntl
+except ImportError: # Windows: only the in-process lock applies
+    fcntl = None
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("INDEX_SERVICE")
+metrics = get_metrics("vector_index")
+
+# On-disk layout (root = faiss_index):
+#   CURRENT          -> name of the latest published snapshot, e.g. "gen_7"
+#   gen_N/           -> immutable FAISS snapshot (index.faiss, index.pkl, meta.json)
+#   wal.jsonl        -> upserts / deletes since the latest snapshot
+#   LOCK             -> flock'd by the one process that owns the writer
+CURRENT_FILE = "CURRENT"
+WAL_FILE = "wal.jsonl"
+LOCK_FILE = "LOCK"
+SNAPSHOT_META = "meta.json"
+
+def read_current(root) -> tuple:
+    """Returns (generation, snapshot_path) of the published snapshot, or (0, None)."""
+    root = Path(root)
+    current = root / CURRENT_FILE
+    if current.exists():
+        name = current.read_text().strip()
+        if name and (root / name).exists():
+            return int(name.split("_")[-1]), root / name
+    # Layout from before generations: a single index saved straight into the root
+    if (root / "index.faiss").exists():
+        return 0, root
+    return 0, None
+
+KEY_SEP = "::"
+
+def _norm(value) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+def invoice_key(metadata: dict):
+    """
+    Stable key of the invoice a document describes: vendor plus invoice number (numbers only
+    have to be unique per vendor), else the source file name.
+    """
+    metadata = metadata or {}
+    number, vendor = _norm(metadata.get("invoice_no")), _norm(metadata.get("vendor"))
+    if number:
+        return f"{vendor}{KEY_SEP}{number}" if vendor else number
+    return _norm(Path(str(metadata["source"])).stem) if metadata.get("source") else None
+
+def superseded_keys(metadata: dict) -> list:
+    """
+    Older keys the same invoice may be live under: its source file name (extracted before the
+    invoice number was found) and the bare invoice number (indexes keyed before vendors were).
+    """
+    metadata = metadata or {}
+    key = invoice_key(metadata)
+    number = _norm(metadata.get("invoice_no"))
+    stem = _norm(Path(str(metadata["source"])).stem) if metadata.get("source") else None
+    return [k for k in dict.fromkeys((stem if number else None, number)) if k and k != key]
+
+def document_id(text: str, metadata: dict) -> str:
+    """Stable document id: invoice key plus content hash (same invoice, same text -> same id)."""
+    digest = hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+    key = invoice_key(metadata)
+    return f"{key}:{digest}" if key else digest
+
+class IndexLocked(RuntimeError):
+    """Another process owns the index writer."""
+
+class WriterLock:
+    """
+    Exclusive OS file lock (flock) held for a writer's whole lifetime, so two processes
+    (uvicorn workers, the folder watcher, the CLI) never append to the same log or race
+    on gen_N / CURRENT. Released automatically if the process dies.
+    """
+    def __init__(self, path: Path, timeout: float = 30.0):
+        self.path = Path(path)
+        self._file = open(self.path, "a+")
+        if fcntl is None:
+            return
+        deadline = time.time() + float(timeout)
+        while True:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    self._file.close()
+                    raise IndexLocked(f"{self.path.parent} is being written by another process")
+                time.sleep(0.1)
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+
+    def release(self):
+        if self._file.closed:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+
+def _write_atomic(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class IndexService:
+    """
+    Single writer for the invoice vector index.
+    The index stays in memory; every upsert / delete is appended to a write-ahead log
+    before it is applied, and snapshots are flushed in batches (every N documents
+    or on a timer) as new immutable generations. On start-up the latest
+    snapshot is loaded and the log is replayed, so a crash loses nothing.
+
+    Only one process at a time can own the writer (see WriterLock).
+
+    There is one live document per invoice key. Replacing or deleting it tombstones
+    the old vector (its docstore entry is removed; FAISS positions stay put so
+    the docstore mapping and lexical positions remain valid) and compaction
+    rebuilds the index without tombstones once they pass a share of the index.
+    """
+    def __init__(self, root, embeddings, flush_every_docs=20, flush_interval_seconds=5.0, keep_generations=2, index_cfg=None):
+        self.root = Path(root)
+        self.index_cfg = index_cfg or {}
+        self.index_type = self.index_cfg.get("index_type", "Flat")
+        self.built_type = "Flat" # Type of the in-memory index (new stores start flat until there is enough to train on)
+        self.pinned_type = None # Chosen with index_builder --type; overrides index_type until unpinned
+        self.embeddings = embeddings
+        self.flush_every_docs = int(flush_every_docs)
+        self.flush_interval_seconds = float(flush_interval_seconds)
+        self.keep_generations = max(1, int(keep_generations))
+        self.compact_ratio = float(self.index_cfg.get("compact_tombstone_ratio", 0.2))
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._listeners = []
+        self.db = None
+        self.generation = 0
+        self.last_seq = 0
+        self.pending = 0
+        self.live = {} # invoice key -> (document id, docstore id) of its current version
+        self.tombstones = 0
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._file_lock = WriterLock(self.root / LOCK_FILE, self.index_cfg.get("writer_lock_timeout_seconds", 30))
+        self._recover()
+        self._timer = threading.Thread(target=self._flush_loop, name="index-flush", daemon=True)
+        self._timer.start()
+        atexit.register(self.close)
+
+    # --- Recovery ---
+    def _recover(self):
+        self.generation, snapshot = read_current(self.root)
+        snapshot_seq = 0
+        if snapshot is not None:
+            self.db = FAISS.load_local(str(snapshot), self.embeddings, allow_dangerous_deserialization=True)
+            meta_path = snapshot / SNAPSHOT_META
+            if meta_path.exists():
+                meta = json.loads(meta_path.read_text())
+                snapshot_seq = meta.get("last_seq", 0)
+                self.built_type = meta.get("index_type", "Flat")
+                self.pinned_type = meta.get("pinned_type")
+                model = getattr(self.embeddings, "model_id", None)
+                if meta.get("embedding_model") and model and meta["embedding_model"] != model:
+                    logger.warning(f"Index was built with {meta['embedding_model']} but embeddings are {model} - rebuild the index")
+        self.last_seq = snapshot_seq
+        duplicates = self._load_live()
+
+        records = [r for r in self._read_wal() if r["seq"] > snapshot_seq] # Older ones are already in the snapshot
+        for record in records:
+            self._apply(record)
+            self.last_seq = record["seq"]
+        replayed = self.pending = len(records)
+        if duplicates:
+            self.pending = max(self.pending, 1) # Publish the de-duplicated index on the next flush
+            logger.info(f"Tombstoned {duplicates} duplicate document(s) from before upserts")
+        # Rewrite the log without torn/stale records so new appends start on a clean line
+        _write_atomic(self.root / WAL_FILE, "".join(json.dumps(r) + "\n" for r in records))
+
+        metrics.set_gauge("generation", self.generation)
+        metrics.set_gauge("pending_docs", self.pending)
+        metrics.set_gauge("tombstones", self.tombstones)
+        if replayed:
+            metrics.incr("wal_replayed", replayed)
+            logger.info(f"Recovered {replayed} document(s) from the write-ahead log")
+        logger.info(f"Index loaded: generation {self.generation}, {self.size()} vectors")
+
+    def _load_live(self):
+        """Rebuilds the key -> live document map from the snapshot; older copies of a key become tombstones."""
+        self.live, self.tombstones = {}, 0
+        duplicates = 0
+        if self.db is None:
+            return duplicates
+        for pos in sorted(self.db.index_to_docstore_id):
+            store_id = self.db.index_to_docstore_id[pos]
+            doc = self.db.docstore.search(store_id)
+            if isinstance(doc, str): # Already tombstoned
+                self.tombstones += 1
+                continue
+            key = doc.metadata.get("invoice_key") or invoice_key(doc.metadata)
+            if key is None:
+                continue
+            # Indexes written before upserts can hold several copies of an invoice: the newest wins
+            if key in self.live:
+                self.db.docstore.delete([self.live[key][1]])
+                self.tombstones += 1
+                duplicates += 1
+            self.live[key] = (doc.metadata.get("doc_id") or document_id(doc.page_content, doc.metadata), store_id)
+        return duplicates
+
+    def _read_wal(self):
+        wal = self.root / WAL_FILE
+        if not wal.exists():
+            return
+        with open(wal, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append: it was never acknowledged
+                    logger.warning("Skipping incomplete write-ahead log record")
+
+    # --- Writes ---
+    def _apply(self, record):
+        metadata = record.get("metadata") or {}
+        key = record.get("key") or invoice_key(metadata)
+        if key is not None:
+            self._tombstone(key)
+        if record.get("op") == "delete":
+            return
+        # Docstore ids are unique per write, so a tombstoned position never resolves to a newer version
+        store_id = f"{record.get('doc_id') or document_id(record['text'], metadata)}@{record['seq']}"
+        pair = [(record["text"], record["vector"])]
+        if self.db is None:
+            self.db = FAISS.from_embeddings(pair, self.embeddings, metadatas=[metadata], ids=[store_id])
+        else:
+            self.db.add_embeddings(pair, metadatas=[metadata], ids=[store_id])
+        if key is not None:
+            self.live[key] = (metadata.get("doc_id"), store_id)
+
+    def _tombstone(self, key: str) -> bool:
+        live = self.live.pop(key, None)
+        if live is None:
+            return False
+        self.db.docstore.delete([live[1]])
+        self.tombstones += 1
+        return True
+
+    def _log(self, records: list):
+        with open(self.root / WAL_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            self._apply(record)
+        self.last_seq = records[-1]["seq"]
+        self.pending += len(records)
+        metrics.set_gauge("pending_docs", self.pending)
+        metrics.set_gauge("tombstones", self.tombstones)
+        if self.pending >= self.flush_every_docs:
+            self.flush()
+
+    def upsert(self, text: str, metadata: dict) -> str:
+        """Durably indexes one document, replacing the previous version of its invoice. Returns its document id."""
+        return self.upsert_many([(text, metadata)])[0]
+
+    def upsert_many(self, docs: list, vectors: list = None) -> list:
+        """
+        Durably indexes [(text, metadata), ...] with one batched embedding call
+        (or the given vectors, e.g. when moving documents between indexes).
+        A document whose invoice already has identical content is skipped (re-uploads, reruns);
+        otherwise it replaces that invoice's live document. Returns the document ids.
+        """
+        if not docs:
+            return []
+        prepared = []
+        for i, (text, metadata) in enumerate(docs):
+            metadata = dict(metadata or {})
+            metadata["doc_id"] = document_id(text, metadata)
+            metadata["invoice_key"] = invoice_key(metadata)
+            prepared.append((text, metadata, vectors[i] if vectors is not None else None))
+        ids = [metadata["doc_id"] for _, metadata, _ in prepared]
+
+        # Last copy wins within a batch; duplicates of the live version aren't embedded at all
+        batch = {}
+        for text, metadata, vector in prepared:
+            batch[metadata["invoice_key"] or metadata["doc_id"]] = (text, metadata, vector)
+        fresh = [item for item in batch.values() if not self._is_live(item[1])]
+        skipped = len(prepared) - len(fresh)
+        if skipped:
+            metrics.incr("duplicates_skipped", skipped)
+        if not fresh:
+            return ids
+
+        # Embedding is the slow part, so it happens outside the writer lock
+        if vectors is None:
+            vectors = self.embeddings.embed_documents([text for text, _, _ in fresh])
+        else:
+            vectors = [vector for _, _, vector in fresh]
+        fresh = [(text, metadata) for text, metadata, _ in fresh]
+        with self._lock:
+            records, retired = [], set()
+            for (text, metadata), vector in zip(fresh, vectors):
+                if self._is_live(metadata): # Raced with an identical upsert
+                    continue
+                for alias in self._superseded(metadata):
+                    if alias not in retired:
+                        retired.add(alias)
+                        records.append({"seq": self.last_seq + len(records) + 1, "op": "delete", "key": alias})
+                records.append({
+                    "seq": self.last_seq + len(records) + 1,
+                    "op": "upsert",
+                    "key": metadata["invoice_key"],
+                    "doc_id": metadata["doc_id"],
+                    "text": text,
+                    "metadata": metadata,
+                    "vector": [float(x) for x in vector],
+                })
+            if records:
+                self._log(records)
+                metrics.incr("docs_upserted", len(records))
+        return ids
+
+    def _is_live(self, metadata: dict) -> bool:
+        key = metadata.get("invoice_key")
+        return key is not None and self.live.get(key, (None,))[0] == metadata["doc_id"]
+
+    def _live_metadata(self, key: str) -> dict:
+        return self.db.docstore.search(self.live[key][1]).metadata
+
+    def _superseded(self, metadata: dict) -> list:
+        """Live keys holding an older copy of this invoice under a superseded key (see superseded_keys)."""
+        found = []
+        number, vendor = _norm(metadata.get("invoice_no")), _norm(metadata.get("vendor"))
+        for alias in superseded_keys(metadata):
+            if alias not in self.live:
+                continue
+            live = self._live_metadata(alias)
+            if alias == number:
+                # Only a copy keyed before vendors were, and of the same vendor
+                same = KEY_SEP not in (live.get("invoice_key") or "") and _norm(live.get("vendor")) in ("", vendor)
+            else:
+                # Keyed by file name because its invoice number was missing
+                same = not _norm(live.get("invoice_no"))
+            if same:
+                found.append(alias)
+        return found
+
+    def retire_superseded(self, metadata: dict) -> bool:
+        """Durably removes older copies of this invoice that live under a superseded key."""
+        with self._lock:
+            aliases = self._superseded(metadata)
+            if not aliases:
+                return False
+            self._log([{"seq": self.last_seq + i + 1, "op": "delete", "key": alias} for i, alias in enumerate(aliases)])
+            metrics.incr("docs_deleted", len(aliases))
+        return True
+
+    def delete(self, invoice_id: str) -> bool:
+        """Durably removes the live document of an invoice (by key, invoice number or source file name)."""
+        with self._lock:
+            target = _norm(invoice_id)
+            stem = _norm(Path(target).stem)
+            keys = [k for k in self.live if k in (target, stem)] or [k for k in self.live if k.endswith(KEY_SEP + target)]
+            if not keys: # Keyed by invoice number but asked for by file name
+                keys = [k for k in self.live if _norm(Path(str(self._live_metadata(k).get("source") or "")).stem) == stem]
+            if not keys:
+                return False
+            self._log([{"seq": self.last_seq + i + 1, "op": "delete", "key": key} for i, key in enumerate(keys)])
+            metrics.incr("docs_deleted", len(keys))
+        return True
+
+    # --- Snapshots ---
+    def flush(self) -> bool:
+        """Publishes the in-memory index as a new generation and truncates the log."""
+        with self._lock:
+            if not self.pending or self.db is None:
+                return False
+            started = time.time()
+            if self.tombstones and self.tombstones >= self.compact_ratio * self.size():
+                self.compact(flush=False)
+            self._maybe_upgrade()
+            on_disk = [int(p.name.split("_")[-1]) for p in self.root.glob("gen_*") if p.is_dir()]
+            generation = max([self.generation] + on_disk) + 1
+            name = f"gen_{generation}"
+            tmp = self.root / f".{name}.tmp"
+            if tmp.exists():
+                shutil.rmtree(tmp)
+
+            self.db.save_local(str(tmp))
+            _write_atomic(tmp / SNAPSHOT_META, json.dumps({
+                "generation": generation,
+                "last_seq": self.last_seq,
+                "embedding_model": getattr(self.embeddings, "model_id", None),
+                "index_type": self.built_type,
+                "pinned_type": self.pinned_type,
+                "created_at": time.time(),
+            }))
+            os.replace(tmp, self.root / name)
+            _write_atomic(self.root / CURRENT_FILE, name)
+            # Everything in the log is now in the published snapshot
+            _write_atomic(self.root / WAL_FILE, "")
+
+            self.generation = generation
+            self.pending = 0
+            self._prune()
+
+            metrics.incr("flushes")
+            metrics.observe("flush_ms", (time.time() - started) * 1000)
+            metrics.set_gauge("generation", generation)
+            metrics.set_gauge("pending_docs", 0)
+            metrics.set_gauge("vectors", self.size())
+            metrics.set_gauge("tombstones", self.tombstones)
+            logger.info(f"Published index generation {generation} ({self.size()} vectors)")
+
+        for listener in list(self._listeners):
+            try:
+                listener(generation, self.root / name)
+            except Exception as e:
+                logger.error(f"Generation listener failed: {e}")
+        return True
+
+    def _maybe_upgrade(self):
+        """Switches to the configured index type once there are enough vectors to train it (unless one is pinned)."""
+        target = self.pinned_type or self.index_type
+        if target == self.built_type or self.size() < int(self.index_cfg.get("min_train_vectors", 10000)):
+            return
+        self.rebuild(target, flush=False)
+
+    def rebuild(self, factory: str, flush: bool = True, pin: bool = None):
+        """
+        Re-creates the in-memory index as another FAISS type (training it) and publishes it.
+        pin=True keeps that type across later flushes even if it differs from
+        vector_index.index_type (stored in the snapshot's meta.json); pin=False unpins.
+        """
+        from rag_agents.index_builder import rebuild
+        with self._lock:
+            if pin is not None:
+                self.pinned_type = factory if pin else None
+                self.pending = max(self.pending, 1) # Persist the pin even if nothing else changes
+            if self.db is None:
+                return
+            if self.tombstones:
+                self.built_type = factory
+                self.compact(flush=flush)
+                return
+            rebuild(self.db, self.embeddings, factory, self.index_cfg)
+            self.built_type = factory
+            metrics.incr("rebuilds")
+            if flush:
+                self.pending = max(self.pending, 1) # Force a new generation
+                self.flush()
+
+    def compact(self, flush: bool = True) -> bool:
+        """Rebuilds the in-memory index from live documents only, dropping tombstoned vectors."""
+        from rag_agents.index_builder import compact
+        with self._lock:
+            if self.db is None or not self.tombstones:
+                return False
+            started = time.time()
+            before = self.size()
+            db = compact(self.db, self.embeddings, self.built_type, self.index_cfg)
+            if db is None: # Every document was deleted; keep serving the old snapshot shape
+                return False
+            self.db, dropped, self.tombstones = db, self.tombstones, 0
+            metrics.incr("compactions")
+            metrics.observe("compact_ms", (time.time() - started) * 1000)
+            logger.info(f"Compacted index: {before} -> {self.size()} vectors ({dropped} tombstone(s) dropped)")
+            if flush:
+                self.pending = max(self.pending, 1) # Force a new generation
+                self.flush()
+        return True
+
+    def _prune(self):
+        """Keeps the newest generations only (readers may still hold the previous one)."""
+        gens = sorted((int(p.name.split("_")[-1]), p) for p in self.root.glob("gen_*") if p.is_dir())
+        for _, path in gens[:-self.keep_generations]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def on_publish(self, listener):
+        """Registers listener(generation, snapshot_path), called after every flush."""
+        self._listeners.append(listener)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Background flush failed: {e}")
+
+    def size(self) -> int:
+        return self.db.index.ntotal if self.db is not None else 0
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final flush failed: {e}")
+        finally:
+            self._file_lock.release()
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_index_service():
+    """The process-wide index writer (created on first use); sharded by date if vector_index.shard_by is set."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            from rag_agents.retrieval_agent import embeddings, DB_PATH
+            cfg = load_rules().get("vector_index", {})
+            writer_cfg = {
+                "flush_every_docs": cfg.get("flush_every_docs", 20),
+                "flush_interval_seconds": cfg.get("flush_interval_seconds", 5),
+                "keep_generations": cfg.get("keep_generations", 2),
+            }
+            if cfg.get("shard_by", "none") in ("month", "quarter"):
+                from rag_agents.sharded_index import ShardedIndexService
+                _service = ShardedIndexService(
+                    DB_PATH,
+                    embeddings,
+                    granularity=cfg["shard_by"],
+                    retention_months=cfg.get("retention_months", 0),
+                    writer_cfg=writer_cfg,
+                    index_cfg=cfg,
+                    max_open_writers=cfg.get("max_open_shard_writers", 4),
+                    writer_idle_seconds=cfg.get("shard_writer_idle_seconds", 300),
+                )
+            else:
+                _service = IndexService(DB_PATH, embeddings, index_cfg=cfg, **writer_cfg)
+        return _service
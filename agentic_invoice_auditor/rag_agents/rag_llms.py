@@ -1,7 +1,6 @@
 import os
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
+from utils.llm_gateway import get_chat_model
 
 load_dotenv()
 
@@ -9,26 +8,30 @@ def get_llm(temperature=0.0):
     """
     Factory function to return the configured LLM.
     Switches between OpenAI and Gemini based on what keys you have.
+    Every model goes through the shared LLM gateway (limits, retries, hedging).
     """
     openai_key = os.getenv("OPENAI_API_KEY")
     gemini_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
 
     # Priority 1: Use OpenAI if available (Robust for RAG)
     if openai_key:
-        return ChatOpenAI(
-            model="gpt-4o-mini", # Cost-effective standard
+        return get_chat_model(
+            "gpt-4o-mini", # Cost-effective standard
             temperature=temperature,
             api_key=openai_key
         )
     
     # Priority 2: Use Google Gemini
     elif gemini_key:
-        return ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
+        return get_chat_model(
+            "gemini-2.0-flash",
             temperature=temperature,
             google_api_key=gemini_key
         )
     
+    elif os.getenv("LLM_STAND_IN_URL"):
+        return get_chat_model("gpt-4o-mini", temperature=temperature)
+
     else:
         raise ValueError("CRITICAL: No API keys found in .env for RAG Agents.")
 
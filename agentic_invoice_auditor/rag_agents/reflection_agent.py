@@ -2,52 +2,64 @@ import json
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from rag_agents.rag_llms import reflection_llm
+from rag_agents.gates import should_reflect, record_gate
+from rag_agents.generation_agent import NO_CONTEXT_ANSWER
+from utils.token_usage import record_prompt, record_response
 
-def reflection_node(state: dict) -> dict:
-    """
-    Critiques the generated answer for hallucination and relevance.
-    """
-    print(" [RAG] Reflector: Grading answer quality...")
+REFLECTION_PROMPT = ChatPromptTemplate.from_template(
+    """You are a RAG Quality Auditor.
+    1. Check if the ANSWER is grounded in the CONTEXT.
+    2. Check if the ANSWER addresses the QUESTION.
     
-    answer = state.get("answer", "")
-    question = state["question"]
-    context = state.get("context_text", "")
-
-    prompt = ChatPromptTemplate.from_template(
-        """You are a RAG Quality Auditor.
-        1. Check if the ANSWER is grounded in the CONTEXT.
-        2. Check if the ANSWER addresses the QUESTION.
-        
-        QUESTION: {question}
-        CONTEXT: {context}
-        PROPOSED ANSWER: {answer}
-        
-        Return a JSON with a score (0.0 to 1.0) and a boolean 'is_safe'.
-        JSON FORMAT:
-        {{
-            "score": 0.9,
-            "is_safe": true,
-            "reason": "The answer directly cites the invoice total."
-        }}
-        """
-    )
+    QUESTION: {question}
+    CONTEXT: {context}
+    PROPOSED ANSWER: {answer}
     
-    chain = prompt | reflection_llm | StrOutputParser()
+    Return a JSON with a score (0.0 to 1.0) and a boolean 'is_safe'.
+    JSON FORMAT:
+    {{
+        "score": 0.9,
+        "is_safe": true,
+        "reason": "The answer directly cites the invoice total."
+    }}
+    """
+)
+
+def grade_answer(question: str, context: str, answer: str) -> dict:
+    """One reflection LLM call -> {"score", "is_safe", "reason"}. Defaults to safe if grading fails."""
+    chain = REFLECTION_PROMPT | reflection_llm | StrOutputParser()
+    inputs = {"question": question, "context": context, "answer": answer}
     
     try:
-        result_str = chain.invoke({
-            "question": question, 
-            "context": context, 
-            "answer": answer
-        })
+        record_prompt("rag.reflect", REFLECTION_PROMPT.format(**inputs))
+        result_str = chain.invoke(inputs)
+        record_response("rag.reflect", result_str)
         # Clean markdown if present
         result_str = result_str.replace("```json", "").replace("```", "").strip()
         score_data = json.loads(result_str)
         
         print(f"   - Score: {score_data.get('score')} ({score_data.get('reason')})")
-        return {"reflection_score": score_data}
+        return score_data
         
     except Exception as e:
         print(f"   - Reflection Error: {e}")
         # Default to safe if scoring fails, but warn
-        return {"reflection_score": {"is_safe": True, "score": 0.5}}
\ No newline at end of file
+        return {"is_safe": True, "score": 0.5}
+
+def reflect(question: str, context: str, answer: str) -> dict:
+    """grade_answer behind the local gate: small talk, canned answers and clearly grounded answers skip the LLM."""
+    needed, reason, local_score = should_reflect(question, answer, context, fixed_answers=(NO_CONTEXT_ANSWER,))
+    record_gate("reflect", needed, reason)
+    if not needed:
+        print(f"   - Reflection skipped ({reason})")
+        return {"is_safe": True, "score": local_score, "reason": f"Skipped: {reason}", "skipped": True}
+    return grade_answer(question, context, answer)
+
+def reflection_node(state: dict) -> dict:
+    """
+    Critiques the generated answer for hallucination and relevance.
+    """
+    print(" [RAG] Reflector: Grading answer quality...")
+    
+    score_data = reflect(state["question"], state.get("context_text", ""), state.get("answer", ""))
+    return {"reflection_score": score_data}
@@ -1,6 +1,8 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from rag_agents.rag_llms import rephrase_llm
+from rag_agents.gates import needs_rephrase, record_gate
+from utils.token_usage import record_prompt, record_response
 
 def rephrase_node(state: dict) -> dict:
     """
@@ -9,8 +11,10 @@ def rephrase_node(state: dict) -> dict:
     question = state["question"]
     chat_history = state.get("chat_history", [])
     
-    # If no history, no need to rephrase
-    if not chat_history:
+    # Standalone questions (or no history) don't need the LLM rewrite
+    needed, reason = needs_rephrase(question, chat_history)
+    record_gate("rephrase", needed, reason)
+    if not needed:
         return {"question": question}
 
     print(" [RAG] Rephraser: Refining query based on history...")
@@ -29,8 +33,12 @@ def rephrase_node(state: dict) -> dict:
         Standalone Question:"""
     )
     
+    inputs = {"chat_history": chat_history, "question": question}
+    record_prompt("rag.rephrase", prompt.format(**inputs))
+    
     chain = prompt | rephrase_llm | StrOutputParser()
-    new_question = chain.invoke({"chat_history": chat_history, "question": question})
+    new_question = chain.invoke(inputs)
+    record_response("rag.rephrase", new_question)
     
     print(f"   - Original: {question}")
     print(f"   - Rephrased: {new_question}")
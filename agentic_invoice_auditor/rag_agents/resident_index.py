@@ -0,0 +1,143 @@
+import pickle
+import threading
+import time
+from pathlib import Path
+from langchain_community.vectorstores import FAISS
+from persona.persona_agent import load_rules
+from rag_agents.index_service import read_current, CURRENT_FILE
+from rag_agents.hybrid_search import LexicalIndex, hybrid_search, vector_ranks
+from rag_agents.index_builder import tune_index
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("RESIDENT_INDEX")
+metrics = get_metrics("vector_index")
+
+def load_snapshot(snapshot: Path, embeddings, index_cfg: dict = None) -> FAISS:
+    """Loads a published snapshot, memory-mapping the FAISS file when the faiss build supports it."""
+    try:
+        import faiss
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(str(snapshot / "index.faiss"), flags)
+        with open(snapshot / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        db = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    except Exception as e:
+        logger.warning(f"mmap load unavailable ({e}), reading snapshot into memory")
+        db = FAISS.load_local(str(snapshot), embeddings, allow_dangerous_deserialization=True)
+    try:
+        tune_index(db.index, index_cfg or {}) # nprobe / efSearch for IVF / HNSW snapshots
+    except ImportError:
+        pass
+    return db
+
+class ResidentIndex:
+    """
+    Read side of the vector index for /api/chat.
+    Keeps the latest published generation resident and swaps the reference in
+    one assignment when the writer publishes a new one, so queries never read
+    from disk and never see a half-written index. A background thread watches
+    the CURRENT pointer (it is tiny), which also picks up other processes' writes.
+    """
+    def __init__(self, root, embeddings, poll_seconds=1.0, index_cfg=None, watch=True):
+        self.root = Path(root)
+        self.index_cfg = index_cfg or {}
+        self.embeddings = embeddings
+        self.poll_seconds = float(poll_seconds)
+        self.search_cfg = load_rules().get("hybrid_search", {})
+        self._current = (None, None, None) # (generation, FAISS, LexicalIndex) - replaced, never mutated
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refresh()
+        if watch: # Shards are watched by their ShardedResidentIndex instead
+            self._watcher = threading.Thread(target=self._watch, name="index-watch", daemon=True)
+            self._watcher.start()
+
+    def refresh(self) -> bool:
+        """Loads the published generation if it is newer than the resident one."""
+        generation, snapshot = read_current(self.root)
+        if snapshot is None or generation == self._current[0]:
+            return False
+        with self._swap_lock:
+            if generation == self._current[0]:
+                return False
+            started = time.time()
+            db = load_snapshot(snapshot, self.embeddings, self.index_cfg)
+            # BM25 + metadata index for this generation, built before it goes live
+            docs = [(pos, db.docstore.search(doc_id)) for pos, doc_id in db.index_to_docstore_id.items()]
+            lexical = LexicalIndex([(pos, doc) for pos, doc in docs if not isinstance(doc, str)])
+            self._current = (generation, db, lexical)
+        metrics.incr("reader_swaps")
+        metrics.observe("reader_load_ms", (time.time() - started) * 1000)
+        metrics.set_gauge("reader_generation", generation)
+        logger.info(f"Serving index generation {generation} ({db.index.ntotal} vectors)")
+        return True
+
+    def _watch(self):
+        current = self.root / CURRENT_FILE
+        last_mtime = None
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                mtime = current.stat().st_mtime if current.exists() else None
+                if mtime != last_mtime:
+                    last_mtime = mtime
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Generation refresh failed: {e}")
+
+    def search(self, query: str, k: int = 3, query_vector=None, with_scores: bool = False) -> list:
+        """
+        Hybrid (metadata filter + BM25 + vector) search, or plain vector search if disabled.
+        with_scores returns [(Document, score)]; plain vector results are scored by rank
+        on the same 1 / (rrf_k + rank) scale as fused ones.
+        """
+        generation, db, lexical = self._current # One snapshot for the whole query
+        if db is None:
+            return []
+        started = time.time()
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        if self.search_cfg.get("enabled", True):
+            results = hybrid_search(db, lexical, self.embeddings, query, k=k, cfg=self.search_cfg, query_vector=query_vector, with_scores=True)
+        else:
+            # Tombstoned vectors (docstore entries gone) are skipped until compaction
+            candidates = lexical.positions() if lexical.n < db.index.ntotal else None
+            ranks = vector_ranks(db, query_vector, k, candidates, int(self.search_cfg.get("brute_force_max", 5000)))
+            rrf_k = int(self.search_cfg.get("rrf_k", 60))
+            results = [(db.docstore.search(db.index_to_docstore_id[pos]), 1.0 / (rrf_k + rank + 1)) for rank, pos in enumerate(ranks)]
+        metrics.observe("search_ms", (time.time() - started) * 1000)
+        return results if with_scores else [doc for doc, _ in results]
+
+    @property
+    def snapshot(self) -> tuple:
+        """(generation, FAISS, LexicalIndex) being served, for a caller that queries it several times."""
+        return self._current
+
+    @property
+    def generation(self):
+        return self._current[0]
+
+    def close(self):
+        self._stop.set()
+
+_resident = None
+_resident_lock = threading.Lock()
+
+def get_resident_index():
+    """The process-wide resident reader (created on first use); fans out over shards if the index is sharded."""
+    global _resident
+    with _resident_lock:
+        if _resident is None:
+            from rag_agents.retrieval_agent import embeddings, DB_PATH
+            cfg = load_rules().get("vector_index", {})
+            if cfg.get("shard_by", "none") in ("month", "quarter"):
+                from rag_agents.sharded_index import ShardedResidentIndex
+                _resident = ShardedResidentIndex(
+                    DB_PATH, embeddings,
+                    poll_seconds=cfg.get("reader_poll_seconds", 1),
+                    index_cfg=cfg,
+                    search_workers=cfg.get("search_workers", 8),
+                )
+            else:
+                _resident = ResidentIndex(DB_PATH, embeddings, poll_seconds=cfg.get("reader_poll_seconds", 1), index_cfg=cfg)
+        return _resident
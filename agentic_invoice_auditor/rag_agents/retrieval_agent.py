@@ -1,13 +1,13 @@
-import os
-from langchain_community.vectorstores import FAISS
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
+from rag_agents.embeddings import build_embeddings
+from rag_agents.resident_index import get_resident_index
+from utils.prompt_compactor import compact_text
+from utils.token_usage import record_compaction
 
 load_dotenv()
-API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
 
-# Use Google Embeddings (Reliable and Free-tier friendly)
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=API_KEY)
+# Google or local CPU embeddings (rules.yaml -> embeddings), behind a content-hash cache
+embeddings = build_embeddings()
 DB_PATH = "faiss_index"
 
 def retrieval_node(state):
@@ -15,9 +15,14 @@ def retrieval_node(state):
     print(f" [RAG] Retrieving context for: {question}")
     
     try:
-        db = FAISS.load_local(DB_PATH, embeddings, allow_dangerous_deserialization=True)
-        docs = db.similarity_search(question, k=3)
-        context = "\n\n".join([d.page_content for d in docs])
+        # Resident index: the latest published generation, already in memory
+        docs = get_resident_index().search(question, k=3)
+        if not docs:
+            return {"context_text": "No documents found.", "context": []}
+        raw_context = "\n\n".join([d.page_content for d in docs])
+        # Compact before the context is pasted into the generate + reflect prompts
+        context = compact_text(raw_context)
+        record_compaction("rag.context", raw_context, context)
         return {"context_text": context, "context": docs}
     except Exception as e:
         print(f" [RAG] Retrieval Error: {e}")
@@ -0,0 +1,406 @@
+import argparse
+import calendar
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from persona.persona_agent import load_rules
+from rag_agents.index_service import IndexService, WriterLock, LOCK_FILE, KEY_SEP, read_current, invoice_key, superseded_keys
+from rag_agents.resident_index import ResidentIndex
+from rag_agents.hybrid_search import Vocabulary, corpus_stats, fuse_rankings, hybrid_rankings, parse_date_filter, resolve_filters
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("SHARDED_INDEX")
+metrics = get_metrics("vector_index")
+
+# On-disk layout (root = faiss_index):
+#   shards/2025-Q1/  -> one IndexService root per period (CURRENT, gen_N/, wal.jsonl)
+#   shards/catalog.db -> invoice key -> shard, so an upsert can retire the copy in another shard
+SHARDS_DIR = "shards"
+CATALOG_FILE = "catalog.db"
+
+def shard_name(invoice_date: str, granularity: str = "quarter") -> str:
+    """'2025-02-14' -> '2025-Q1' (quarter) or '2025-02' (month). Undated documents go to today's shard."""
+    try:
+        d = date.fromisoformat(invoice_date)
+    except (TypeError, ValueError):
+        d = date.today()
+    if granularity == "month":
+        return f"{d.year}-{d.month:02d}"
+    return f"{d.year}-Q{(d.month - 1) // 3 + 1}"
+
+def shard_range(name: str) -> tuple:
+    """'2025-Q1' -> ('2025-01-01', '2025-03-31'); '2025-02' -> ('2025-02-01', '2025-02-28')."""
+    year, part = name.split("-")
+    year = int(year)
+    first, last = (int(part[1:]) * 3 - 2, int(part[1:]) * 3) if part.startswith("Q") else (int(part), int(part))
+    return date(year, first, 1).isoformat(), date(year, last, calendar.monthrange(year, last)[1]).isoformat()
+
+def _is_shard(path: Path) -> bool:
+    try:
+        shard_range(path.name)
+        return path.is_dir()
+    except ValueError:
+        return False
+
+class ShardCatalog:
+    """Invoice key -> shard name (SQLite, shared by writer restarts and the CLI)."""
+    def __init__(self, path: Path):
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, shard TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS keys_shard ON keys (shard)")
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT shard FROM keys WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, shard: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO keys (key, shard) VALUES (?, ?)", (key, shard))
+
+    def find(self, invoice_id: str) -> list:
+        """[(key, shard)] for an invoice asked for by key, invoice number (any vendor) or source file name."""
+        target = " ".join(str(invoice_id or "").split()).lower()
+        stem = Path(target).stem
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, shard FROM keys WHERE key IN (?, ?) OR substr(key, -?) = ?",
+                (target, stem, len(KEY_SEP + target), KEY_SEP + target),
+            ).fetchall()
+
+    def remove(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM keys WHERE key = ?", (key,))
+
+    def drop_shard(self, shard: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM keys WHERE shard = ?", (shard,))
+
+class ShardedIndexService:
+    """
+    Writer for a time-sharded vector index: one IndexService (WAL + generations) per
+    month / quarter of invoice date. The current shard's writer stays open; writers of
+    older shards are kept in a small LRU and closed (published) once idle, so a run of
+    back-dated uploads doesn't reopen and republish a shard per document, while old
+    shards are otherwise untouched files that readers memory-map. Retention drops whole
+    shards. Same write API as IndexService.
+    """
+    def __init__(self, root, embeddings, granularity="quarter", retention_months=0, writer_cfg=None, index_cfg=None,
+                 max_open_writers=4, writer_idle_seconds=300):
+        self.root = Path(root)
+        self.shards_root = self.root / SHARDS_DIR
+        self.embeddings = embeddings
+        self.granularity = granularity
+        self.retention_months = int(retention_months or 0)
+        self.writer_cfg = writer_cfg or {}
+        self.index_cfg = index_cfg or {}
+        self.max_open_writers = max(1, int(max_open_writers))
+        self.writer_idle_seconds = float(writer_idle_seconds)
+        self._writers = OrderedDict() # name -> IndexService, least recently used first
+        self._last_used = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+        migrate = not self.shards_root.exists() and read_current(self.root)[1] is not None
+        self.shards_root.mkdir(parents=True, exist_ok=True)
+        # Catalog, migration and retention belong to the one writer process (each shard also locks itself)
+        self._file_lock = WriterLock(self.shards_root / LOCK_FILE, self.index_cfg.get("writer_lock_timeout_seconds", 30))
+        self.catalog = ShardCatalog(self.shards_root / CATALOG_FILE)
+        if migrate:
+            self._migrate()
+        self.apply_retention()
+        self._writer(self.current_shard())
+
+    def current_shard(self) -> str:
+        return shard_name(None, self.granularity)
+
+    def shards(self) -> list:
+        return sorted(p.name for p in self.shards_root.iterdir() if _is_shard(p))
+
+    # --- Writers ---
+    def _writer(self, name: str) -> IndexService:
+        with self._lock:
+            writer = self._writers.get(name)
+            if writer is None:
+                writer = IndexService(self.shards_root / name, self.embeddings, index_cfg=self.index_cfg, **self.writer_cfg)
+                for listener in self._listeners:
+                    writer.on_publish(listener)
+                self._writers[name] = writer
+            self._writers.move_to_end(name)
+            self._last_used[name] = time.time()
+            return writer
+
+    def _evict(self, keep=()):
+        """Publishes and closes past-shard writers that are idle or beyond max_open_writers (never the current one)."""
+        current = self.current_shard()
+        with self._lock:
+            past = [name for name in self._writers if name != current and name not in keep]
+            idle = [name for name in past if time.time() - self._last_used.get(name, 0) >= self.writer_idle_seconds]
+            excess = past[:max(0, len(self._writers) - self.max_open_writers)]
+            for name in dict.fromkeys(idle + excess):
+                self._writers.pop(name).close()
+                self._last_used.pop(name, None)
+                metrics.incr("shard_writers_closed")
+
+    def upsert(self, text: str, metadata: dict) -> str:
+        return self.upsert_many([(text, metadata)])[0]
+
+    def upsert_many(self, docs: list, vectors: list = None) -> list:
+        """Routes each document to the shard of its invoice date; a copy in another shard is deleted."""
+        if not docs:
+            return []
+        routed = {}
+        for i, (text, metadata) in enumerate(docs):
+            routed.setdefault(shard_name((metadata or {}).get("date"), self.granularity), []).append(i)
+
+        ids = [None] * len(docs)
+        touched = set(routed)
+        with self._lock:
+            for name, positions in routed.items():
+                batch = [docs[i] for i in positions]
+                batch_vectors = [vectors[i] for i in positions] if vectors is not None else None
+                for i, doc_id in zip(positions, self._writer(name).upsert_many(batch, batch_vectors)):
+                    ids[i] = doc_id
+                for _, metadata in batch:
+                    key = invoice_key(metadata)
+                    if key is None:
+                        continue
+                    previous = self.catalog.get(key)
+                    if previous and previous != name and (self.shards_root / previous).exists():
+                        # The invoice date changed (e.g. corrected in a rerun): retire the old copy
+                        self._writer(previous).delete(key)
+                        touched.add(previous)
+                        metrics.incr("shard_moves")
+                    self.catalog.put(key, name)
+                    # An older copy under its file name (or a vendor-less key) in any shard is the same invoice
+                    for alias in superseded_keys(metadata):
+                        holder = self.catalog.get(alias)
+                        if holder is None:
+                            continue
+                        if holder != name and (self.shards_root / holder).exists():
+                            self._writer(holder).retire_superseded(metadata)
+                            touched.add(holder)
+                        if holder not in self._writers or alias not in self._writers[holder].live:
+                            self.catalog.remove(alias)
+            self._evict(keep=touched)
+        return ids
+
+    def delete(self, invoice_id: str) -> bool:
+        found = self.catalog.find(invoice_id)
+        names = sorted({shard for _, shard in found}) or self.shards()
+        deleted = False
+        with self._lock:
+            for name in names:
+                deleted = self._writer(name).delete(invoice_id) or deleted
+            for key, _ in found:
+                self.catalog.remove(key)
+            self._evict(keep=names)
+        return deleted
+
+    # --- Maintenance (applied shard by shard) ---
+    def _each_shard(self, action):
+        results = []
+        for name in self.shards():
+            with self._lock:
+                results.append(action(self._writer(name)))
+                self._evict(keep=[name])
+        return results
+
+    def flush(self) -> bool:
+        with self._lock:
+            flushed = any([writer.flush() for writer in list(self._writers.values())])
+            self._evict()
+            return flushed
+
+    def compact(self, flush: bool = True) -> bool:
+        return any(self._each_shard(lambda writer: writer.compact(flush=flush)))
+
+    def rebuild(self, factory: str, flush: bool = True, pin: bool = None):
+        self._each_shard(lambda writer: writer.rebuild(factory, flush=flush, pin=pin))
+
+    def apply_retention(self) -> list:
+        """Drops shards whose whole period is older than retention_months (0 keeps everything)."""
+        if not self.retention_months:
+            return []
+        today = date.today()
+        months = today.year * 12 + today.month - 1 - self.retention_months
+        cutoff = date(months // 12, months % 12 + 1, 1).isoformat()
+        dropped = [name for name in self.shards() if shard_range(name)[1] < cutoff]
+        for name in dropped:
+            self.drop_shard(name)
+        return dropped
+
+    def drop_shard(self, name: str):
+        with self._lock:
+            writer = self._writers.pop(name, None)
+            self._last_used.pop(name, None)
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(self.shards_root / name, ignore_errors=True)
+            self.catalog.drop_shard(name)
+        metrics.incr("shards_dropped")
+        logger.info(f"Dropped shard {name} (retention {self.retention_months} months)")
+
+    def _migrate(self):
+        """Splits an unsharded index (faiss_index/gen_N) into shards, reusing its vectors."""
+        from rag_agents.index_builder import live_documents, read_vectors
+        started = time.time()
+        legacy = IndexService(self.root, self.embeddings, flush_interval_seconds=3600, index_cfg=self.index_cfg)
+        try:
+            live = live_documents(legacy.db) if legacy.db is not None else []
+            if live:
+                vectors = read_vectors(legacy.db, self.embeddings, [pos for pos, _, _ in live])
+                self.upsert_many([(doc.page_content, doc.metadata) for _, _, doc in live], list(vectors))
+                self.flush()
+        finally:
+            legacy.close()
+        logger.info(f"Migrated {len(live)} document(s) into {len(self.shards())} shard(s) in {time.time() - started:.1f}s")
+
+    def on_publish(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+            for writer in self._writers.values():
+                writer.on_publish(listener)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(writer.size() for writer in self._writers.values())
+
+    def close(self):
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            self._file_lock.release()
+
+class ShardedResidentIndex:
+    """
+    Read side of the sharded index: every shard's latest generation stays resident
+    (memory-mapped). Filters are parsed once against the vocabulary of all shards, the
+    query is pruned to the shards its date filter overlaps and fanned out over a thread
+    pool (FAISS releases the GIL). Per-shard vector distances and BM25 scores (with
+    corpus-wide statistics) are merged by score and fused once, as for a single index.
+    """
+    def __init__(self, root, embeddings, poll_seconds=1.0, index_cfg=None, search_workers=8):
+        self.shards_root = Path(root) / SHARDS_DIR
+        self.embeddings = embeddings
+        self.poll_seconds = float(poll_seconds)
+        self.index_cfg = index_cfg or {}
+        self.search_cfg = load_rules().get("hybrid_search", {})
+        self._shards = {} # name -> ResidentIndex; replaced, never mutated
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=int(search_workers), thread_name_prefix="shard-search")
+        self.refresh()
+        self._watcher = threading.Thread(target=self._watch, name="shard-watch", daemon=True)
+        self._watcher.start()
+
+    def refresh(self) -> bool:
+        """Picks up new shards and generations, and forgets dropped shards."""
+        names = sorted(p.name for p in self.shards_root.iterdir() if _is_shard(p)) if self.shards_root.exists() else []
+        changed = False
+        with self._lock:
+            shards = dict(self._shards)
+            for name in names:
+                if name in shards:
+                    changed = shards[name].refresh() or changed
+                elif read_current(self.shards_root / name)[1] is not None:
+                    shards[name] = ResidentIndex(self.shards_root / name, self.embeddings, index_cfg=self.index_cfg, watch=False)
+                    changed = True
+            for name in set(shards) - set(names):
+                del shards[name]
+                changed = True
+            self._shards = shards
+        metrics.set_gauge("reader_shards", len(shards))
+        return changed
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Shard refresh failed: {e}")
+
+    def search(self, query: str, k: int = 3) -> list:
+        # One snapshot per shard for the whole query
+        views = {name: index.snapshot for name, index in self._shards.items()}
+        views = {name: view for name, view in views.items() if view[1] is not None}
+        hybrid = self.search_cfg.get("enabled", True)
+        if hybrid:
+            lexicals = [lexical for _, _, lexical in views.values()]
+            filters = resolve_filters(query, Vocabulary(lexicals), lexicals)
+            date_from, date_to = filters.get("date_from"), filters.get("date_to")
+        else:
+            filters = {}
+            date_from, date_to = parse_date_filter(query)
+        selected = [
+            name for name in views
+            if not date_from or (shard_range(name)[0] <= date_to and shard_range(name)[1] >= date_from)
+        ]
+        metrics.incr("shards_searched", len(selected))
+        metrics.incr("shards_pruned", len(views) - len(selected))
+        if not selected:
+            return []
+
+        started = time.time()
+        query_vector = self.embeddings.embed_query(query) # Embedded once for every shard
+        stats = corpus_stats([views[name][2] for name in selected], query) if hybrid else None
+        futures = [
+            self._pool.submit(hybrid_rankings, views[name][1], views[name][2], query, query_vector, filters, self.search_cfg, stats, hybrid)
+            for name in selected
+        ]
+        vector_hits, lexical_hits = [], []
+        for future in futures:
+            vector, lexical = future.result()
+            vector_hits += vector
+            lexical_hits += lexical
+        docs = fuse_rankings(query, vector_hits, lexical_hits, filters, k, self.search_cfg, hint=hybrid)
+        metrics.observe("fanout_search_ms", (time.time() - started) * 1000)
+        return [doc for doc, _ in docs]
+
+    @property
+    def generation(self):
+        """Changes whenever any shard publishes a generation or a shard appears / disappears."""
+        return tuple(sorted((name, index.generation) for name, index in self._shards.items()))
+
+    def close(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+def main():
+    """
+    Shard maintenance (stop the API first - it owns the index writers):
+        python -m rag_agents.sharded_index --list
+        python -m rag_agents.sharded_index --retention
+        python -m rag_agents.sharded_index --drop 2024-Q1
+    """
+    from rag_agents.index_service import get_index_service
+    parser = argparse.ArgumentParser(description="Inspect and age out shards of the invoice vector index")
+    parser.add_argument("--list", action="store_true", help="list shards with their published generation")
+    parser.add_argument("--retention", action="store_true", help="drop shards older than vector_index.retention_months")
+    parser.add_argument("--drop", help="drop one shard, e.g. 2024-Q1")
+    args = parser.parse_args()
+
+    service = get_index_service()
+    if not isinstance(service, ShardedIndexService):
+        print("vector_index.shard_by is 'none': the index is not sharded.")
+        return
+    if args.retention:
+        print(f"Dropped: {service.apply_retention() or 'nothing'}")
+    if args.drop:
+        service.drop_shard(args.drop)
+    if args.list or not (args.retention or args.drop):
+        for name in service.shards():
+            generation, _ = read_current(service.shards_root / name)
+            print(f"{name}  generation {generation}  {shard_range(name)[0]} .. {shard_range(name)[1]}")
+    service.close()
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from rag_agents.rephrase_agent import rephrase_node
 from rag_agents.retrieval_agent import retrieval_node
 from rag_agents.generation_agent import generation_node
 from rag_agents.reflection_agent import reflection_node
+from rag_agents.analytics_agent import analytics_node, route_question
 
 # Define State
 class RagState(TypedDict):
@@ -16,6 +17,7 @@ class RagState(TypedDict):
     answer: str
     reflection_score: dict
     final_answer: str
+    route: str
 
 def rag_routing(state):
     """
@@ -35,10 +37,20 @@ def build_rag_graph():
     workflow.add_node("retrieve", retrieval_node)
     workflow.add_node("generate", generation_node)
     workflow.add_node("reflect", reflection_node)
+    workflow.add_node("analytics", analytics_node)
 
     # Build Edge Connections
     workflow.set_entry_point("rephrase")
-    workflow.add_edge("rephrase", "retrieve")
+    # Aggregate questions (counts, spend, averages) are computed exactly from the analytics store
+    workflow.add_conditional_edges(
+        "rephrase",
+        route_question,
+        {
+            "analytics": "analytics",
+            "rag": "retrieve"
+        }
+    )
+    workflow.add_edge("analytics", END)
     workflow.add_edge("retrieve", "generate")
     workflow.add_edge("generate", "reflect")
 
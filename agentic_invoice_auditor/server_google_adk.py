@@ -1,9 +1,13 @@
 import os
 import json
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 from fastmcp import FastMCP
-from persona.persona_agent import load_prompts
+from persona.persona_agent import load_prompts, load_rules, CONFIG_DIR
+from tools.chunked_extraction import split_into_chunks, reduce_extraction
+from utils.llm_cache import LLMResponseCache
+from utils.llm_gateway import get_chat_model
+from utils.prompt_compactor import compact_text
+from utils.token_usage import record_prompt, record_response, record_compaction
 from utils.logger import get_logger
 
 # Initialize Logger
@@ -21,8 +25,107 @@ load_dotenv()
 
 # Initialize Server & Models
 mcp = FastMCP("Google ADK Tools")
-gemini_model = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
-prompts = load_prompts() # Load YAML prompts
+MODEL_NAME = "gemini-2.0-flash"
+# Routed through the shared gateway (concurrency, rate limits, retries, hedging)
+gemini_model = get_chat_model(MODEL_NAME)
+PROMPTS_PATH = CONFIG_DIR / "persona_invoice_agent.yaml"
+
+# Persistent response cache (re-uploads / reruns skip the LLM)
+llm_cache = LLMResponseCache()
+prompts = {}
+_prompts_mtime = None
+
+def get_prompts():
+    """Loads the YAML prompts, reloading (and invalidating cached responses) when the file changes."""
+    global prompts, _prompts_mtime
+    mtime = PROMPTS_PATH.stat().st_mtime if PROMPTS_PATH.exists() else None
+    if mtime != _prompts_mtime:
+        prompts = load_prompts()
+        _prompts_mtime = mtime
+        llm_cache.sync_prompts(prompts)
+    return prompts
+
+get_prompts()
+
+def _clean_json(content: str) -> str:
+    return content.replace("```json", "").replace("```", "").strip()
+
+def _compact(stage: str, text: str) -> str:
+    """Prompt compaction for OCR text (whitespace, repeated headers/footers, boilerplate)."""
+    compacted = compact_text(text)
+    saved = record_compaction(stage, text, compacted)
+    if saved:
+        logger.info(f"✂️ Compacted {stage} input by ~{saved} tokens")
+    return compacted
+
+def _invoke(stage: str, full_prompt: str):
+    """Single Gemini call with token accounting."""
+    record_prompt(stage, full_prompt)
+    response = gemini_model.invoke(full_prompt)
+    record_response(stage, response)
+    return response
+
+def _invoke_json_batch(jobs, max_concurrency=4):
+    """
+    Runs several (agent, input_text) extractions concurrently via gemini_model.batch.
+    Each parsed response is cached on its own, so a re-scan only re-asks the chunks that changed.
+    """
+    current = get_prompts()
+    results = [None] * len(jobs)
+    pending = []
+    for i, (agent, text) in enumerate(jobs):
+        cached = llm_cache.get(MODEL_NAME, agent, text)
+        if cached:
+            results[i] = json.loads(cached)
+        else:
+            pending.append(i)
+    
+    if pending:
+        full_prompts = [
+            f"{current.get(jobs[i][0], {}).get('system_prompt', 'Extract JSON.')}\n\n--- INPUT TEXT ---\n{jobs[i][1]}"
+            for i in pending
+        ]
+        for i, full_prompt in zip(pending, full_prompts):
+            record_prompt(jobs[i][0], full_prompt)
+        responses = gemini_model.batch(full_prompts, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+        for i, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                results[i] = {"error": str(response)}
+                continue
+            record_response(jobs[i][0], response)
+            try:
+                parsed = json.loads(_clean_json(response.content))
+            except json.JSONDecodeError:
+                results[i] = {"error": "Invalid JSON from LLM"}
+                continue
+            llm_cache.put(MODEL_NAME, jobs[i][0], jobs[i][1], json.dumps(parsed))
+            results[i] = parsed
+    return results
+
+def _translate_chunked(raw_text: str, cfg: dict) -> str:
+    """
+    Map-reduce extraction for long invoices: header + per-chunk line items run
+    concurrently, then a deterministic reducer merges them and checks the totals.
+    """
+    chunks = split_into_chunks(raw_text, int(cfg.get("max_chunk_chars", 4000)))
+    logger.info(f"🧩 Chunked extraction: {len(chunks)} chunks")
+    
+    # Header fields live on the first page, totals usually on the last one
+    header_text = chunks[0] if len(chunks) == 1 else f"{chunks[0]}\n...\n{chunks[-1]}"
+    jobs = [("header_extraction_agent", header_text)] + [("line_item_extraction_agent", c) for c in chunks]
+    results = _invoke_json_batch(jobs, max_concurrency=int(cfg.get("max_concurrency", 4)))
+    
+    errors = [r["error"] for r in results if "error" in r]
+    if errors:
+        logger.error(f"❌ ERROR: {len(errors)} chunk(s) failed: {errors[0]}")
+        return json.dumps({"error": errors[0]})
+    
+    tolerance = load_rules().get("validation_rules", {}).get("price_tolerance_percent", 5.0)
+    data = reduce_extraction(results[0], [r.get("line_items", []) for r in results[1:]], tolerance, chunk_texts=chunks)
+    for warning in data.get("extraction_warnings", []):
+        logger.warning(f"⚠️ {warning}")
+    logger.info(f"✅ SUCCESS: Reduced {len(data['line_items'])} line items from {len(chunks)} chunks")
+    return json.dumps(data)
 
 @mcp.tool()
 def translate_invoice(raw_text: str) -> str:
@@ -32,12 +135,26 @@ def translate_invoice(raw_text: str) -> str:
     logger.info(f"📨 REQUEST: Translation ({len(raw_text)} chars)")
     
     # 1. Get Prompt from YAML
-    sys_prompt = prompts.get("translation_agent", {}).get("system_prompt", "Extract JSON.")
+    sys_prompt = get_prompts().get("translation_agent", {}).get("system_prompt", "Extract JSON.")
+    raw_text = _compact("translation_agent", raw_text)
+    
+    cached = llm_cache.get(MODEL_NAME, "translation_agent", raw_text)
+    if cached:
+        return cached
+    
+    # Long invoices: split by page and extract the chunks concurrently
+    chunk_cfg = load_rules().get("chunked_extraction", {})
+    if chunk_cfg.get("enabled", True) and len(raw_text) > int(chunk_cfg.get("min_chars", 8000)):
+        try:
+            return _translate_chunked(raw_text, chunk_cfg)
+        except Exception as e:
+            logger.error(f"❌ ERROR: {e}")
+            return json.dumps({"error": str(e)})
     
     try:
         # 2. Call Gemini
         full_prompt = f"{sys_prompt}\n\n--- INPUT TEXT ---\n{raw_text}"
-        response = gemini_model.invoke(full_prompt)
+        response = _invoke("translation_agent", full_prompt)
         
         # 3. Clean Output (Remove markdown ```json blocks)
         clean_text = response.content.replace("```json", "").replace("```", "").strip()
@@ -47,7 +164,9 @@ def translate_invoice(raw_text: str) -> str:
         logger.info(f"✅ SUCCESS: Extracted {len(parsed.keys())} fields")
         
         # Return as string (FastMCP handles simple types best)
-        return json.dumps(parsed)
+        result = json.dumps(parsed)
+        llm_cache.put(MODEL_NAME, "translation_agent", raw_text, result)
+        return result
         
     except json.JSONDecodeError:
         logger.error("❌ ERROR: Gemini returned invalid JSON")
@@ -56,6 +175,58 @@ def translate_invoice(raw_text: str) -> str:
         logger.error(f"❌ ERROR: {e}")
         return json.dumps({"error": str(e)})
 
+@mcp.tool()
+def translate_header(header_text: str) -> str:
+    """
+    Uses Google Gemini to extract only the header fields (no line items).
+    Used when line items were already read from the PDF table geometry.
+    """
+    logger.info(f"📨 REQUEST: Header Translation ({len(header_text)} chars)")
+    
+    sys_prompt = get_prompts().get("header_extraction_agent", {}).get("system_prompt", "Extract header JSON.")
+    header_text = _compact("header_extraction_agent", header_text)
+    
+    cached = llm_cache.get(MODEL_NAME, "header_extraction_agent", header_text)
+    if cached:
+        return cached
+    
+    try:
+        full_prompt = f"{sys_prompt}\n\n--- INPUT TEXT ---\n{header_text}"
+        response = _invoke("header_extraction_agent", full_prompt)
+        
+        parsed = json.loads(_clean_json(response.content))
+        parsed.pop("line_items", None) # Table extraction owns the line items
+        logger.info(f"✅ SUCCESS: Extracted {len(parsed.keys())} header fields")
+        
+        result = json.dumps(parsed)
+        llm_cache.put(MODEL_NAME, "header_extraction_agent", header_text, result)
+        return result
+        
+    except json.JSONDecodeError:
+        logger.error("❌ ERROR: Gemini returned invalid JSON")
+        return json.dumps({"error": "Invalid JSON from LLM"})
+    except Exception as e:
+        logger.error(f"❌ ERROR: {e}")
+        return json.dumps({"error": str(e)})
+
+@mcp.tool()
+def extract_line_items(chunk_text: str) -> str:
+    """
+    Uses Google Gemini to extract only the line items of one invoice part (page/chunk).
+    Used by the streaming pipeline as pages arrive.
+    """
+    logger.info(f"📨 REQUEST: Line Items ({len(chunk_text)} chars)")
+    
+    try:
+        chunk_text = _compact("line_item_extraction_agent", chunk_text)
+        result = _invoke_json_batch([("line_item_extraction_agent", chunk_text)])[0]
+        if "error" not in result:
+            logger.info(f"✅ SUCCESS: Extracted {len(result.get('line_items', []))} line items")
+        return json.dumps(result)
+    except Exception as e:
+        logger.error(f"❌ ERROR: {e}")
+        return json.dumps({"error": str(e)})
+
 @mcp.tool()
 def generate_report(report_data: str) -> str:
     """
@@ -63,12 +234,16 @@ def generate_report(report_data: str) -> str:
     """
     logger.info(f"📨 REQUEST: Report Generation")
     
-    sys_prompt = prompts.get("reporting_agent", {}).get("system_prompt", "Generate HTML.")
+    sys_prompt = get_prompts().get("reporting_agent", {}).get("system_prompt", "Generate HTML.")
+    
+    cached = llm_cache.get(MODEL_NAME, "reporting_agent", report_data)
+    if cached:
+        return cached
     
     try:
         # Call Gemini
         full_prompt = f"{sys_prompt}\n\nDATA: {report_data}"
-        response = gemini_model.invoke(full_prompt)
+        response = _invoke("reporting_agent", full_prompt)
         
         # Clean Output
         html_content = response.content.replace("```html", "").replace("```", "").strip()
@@ -76,12 +251,43 @@ def generate_report(report_data: str) -> str:
         logger.info(f"✅ SUCCESS: Generated {len(html_content)} bytes of HTML")
         
         # Wrap in JSON for transport
-        return json.dumps({"html": html_content})
+        result = json.dumps({"html": html_content})
+        llm_cache.put(MODEL_NAME, "reporting_agent", report_data, result)
+        return result
         
     except Exception as e:
         logger.error(f"❌ ERROR: {e}")
         return json.dumps({"html": f"<b>Error Generating Report: {e}</b>"})
 
+@mcp.tool()
+def summarize_report(report_data: str) -> str:
+    """
+    Uses Google Gemini to write a short narrative summary for the audit report.
+    The HTML itself is rendered locally by the ReportingAgent.
+    """
+    logger.info(f"📨 REQUEST: Report Narrative")
+    
+    sys_prompt = get_prompts().get("report_narrative_agent", {}).get("system_prompt", "Summarize this invoice audit.")
+    
+    cached = llm_cache.get(MODEL_NAME, "report_narrative_agent", report_data)
+    if cached:
+        return cached
+    
+    try:
+        full_prompt = f"{sys_prompt}\n\nDATA: {report_data}"
+        response = _invoke("report_narrative_agent", full_prompt)
+        summary = response.content.strip()
+        
+        logger.info(f"✅ SUCCESS: Generated {len(summary)} chars of narrative")
+        
+        result = json.dumps({"summary": summary})
+        llm_cache.put(MODEL_NAME, "report_narrative_agent", report_data, result)
+        return result
+        
+    except Exception as e:
+        logger.error(f"❌ ERROR: {e}")
+        return json.dumps({"summary": None, "error": str(e)})
+
 if __name__ == "__main__":
     logger.info("🚀 STARTING Google ADK FastMCP Server on Port 8002...")
     mcp.run(transport="sse", port=8002)
\ No newline at end of file
@@ -41,6 +41,37 @@ def ocr_extract(file_path: str) -> str:
         logger.critical(f"🔥 CRASH: {e}")
         return json.dumps({"status": "error", "message": str(e)})
 
+@mcp.tool()
+def ocr_page_count(file_path: str) -> str:
+    """
+    Returns the number of pages of an invoice (used by the streaming pipeline).
+    """
+    try:
+        return json.dumps({"status": "success", "pages": ocr_tool.page_count(file_path)})
+    except Exception as e:
+        logger.error(f"❌ FAIL: {e}")
+        return json.dumps({"status": "error", "message": str(e)})
+
+@mcp.tool()
+def ocr_extract_page(file_path: str, page_index: int) -> str:
+    """
+    Extracts a single page (0-based) so the caller can start on page 1
+    while later pages are still being OCR'd.
+    """
+    logger.info(f"📨 REQUEST: OCR page {page_index} of {file_path}")
+    
+    try:
+        result = ocr_tool.extract_page(file_path, int(page_index))
+        if result.get("status") == "success":
+            logger.info(f"✅ SUCCESS: Page {page_index} -> {len(result.get('text', ''))} chars ({result.get('method')})")
+        else:
+            logger.error(f"❌ FAIL: {result.get('message')}")
+        return json.dumps(result)
+        
+    except Exception as e:
+        logger.critical(f"🔥 CRASH: {e}")
+        return json.dumps({"status": "error", "message": str(e)})
+
 @mcp.tool()
 def validate_business_data(validation_type: str, key: str) -> str:
     """
@@ -0,0 +1,124 @@
+import re
+from collections import Counter
+from utils.text_parsing import parse_number
+
+# DataHarvesterTool ends every page with a form feed
+PAGE_BREAK = "\f"
+
+def split_pages(raw_text: str) -> list:
+    pages = [p for p in (raw_text or "").split(PAGE_BREAK) if p.strip()]
+    return pages or [raw_text or ""]
+
+def split_into_chunks(raw_text: str, max_chars: int) -> list:
+    """
+    Splits OCR text into chunks of whole pages (at most max_chars each).
+    Pages that are too long on their own are split at blank lines, then at line breaks.
+    """
+    pieces = []
+    for page in split_pages(raw_text):
+        if len(page) <= max_chars:
+            pieces.append(page)
+            continue
+        # Oversized page: fall back to sections, then lines
+        for section in re.split(r"\n\s*\n", page):
+            if len(section) <= max_chars:
+                pieces.append(section)
+            else:
+                pieces.extend(_pack(section.splitlines(), max_chars, "\n"))
+
+    return _pack(pieces, max_chars, "\n")
+
+def _pack(parts, max_chars, sep):
+    chunks, current = [], ""
+    for part in parts:
+        if current and len(current) + len(sep) + len(part) > max_chars:
+            chunks.append(current)
+            current = part
+        else:
+            current = f"{current}{sep}{part}" if current else part
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+def _item_key(item: dict):
+    return (
+        str(item.get("description") or "").strip().lower(),
+        parse_number(str(item.get("qty"))) if item.get("qty") is not None else None,
+        parse_number(str(item.get("total"))) if item.get("total") is not None else None,
+        str(item.get("item_code") or "").strip().lower(),
+    )
+
+def boundary_overlap(previous_text: str, next_text: str) -> str:
+    """
+    Text both chunks share at their boundary: the longest run of leading lines of
+    next_text that repeats the trailing lines of previous_text (a table header or
+    row carried over a page break). Lowercased; "" when the chunks don't overlap.
+    """
+    prev_lines = [l.strip().lower() for l in (previous_text or "").splitlines() if l.strip()]
+    next_lines = [l.strip().lower() for l in (next_text or "").splitlines() if l.strip()]
+    for size in range(min(len(prev_lines), len(next_lines)), 0, -1):
+        if prev_lines[-size:] == next_lines[:size]:
+            return "\n".join(next_lines[:size])
+    return ""
+
+def merge_line_items(chunk_items: list, chunk_texts: list = None) -> list:
+    """
+    Concatenates per-chunk line items in document order.
+    A row is only dropped as a repeat if it matches a row of the previous chunk
+    and its description lies in the text the two chunks share at their boundary
+    (see boundary_overlap). Genuine identical rows on both sides of a boundary are kept.
+    """
+    merged = []
+    previous = Counter()
+    for index, items in enumerate(chunk_items):
+        overlap = ""
+        if chunk_texts and 0 < index < len(chunk_texts):
+            overlap = boundary_overlap(chunk_texts[index - 1], chunk_texts[index])
+        current = Counter()
+        for item in items or []:
+            key = _item_key(item)
+            current[key] += 1
+            if overlap and key[0] and key[0] in overlap and previous[key] > 0:
+                previous[key] -= 1 # Each previous row absorbs at most one repeat
+                continue
+            merged.append(dict(item))
+        previous = current
+    return merged
+
+def reduce_extraction(header: dict, chunk_items: list, tolerance_percent: float = 5.0, chunk_texts: list = None) -> dict:
+    """
+    Deterministic reducer: header fields + merged line items, with a totals check.
+    The check accepts the invoice total matching the line items either exactly
+    or with tax/charges on top (i.e. never below the line item sum).
+    chunk_texts (the text each entry of chunk_items was extracted from) lets the
+    merge recognise rows repeated across a chunk boundary.
+    """
+    data = dict(header or {})
+    data.pop("line_items", None)
+    po_number = data.get("po_number")
+
+    items = merge_line_items(chunk_items, chunk_texts)
+    for item in items:
+        if po_number and not item.get("po_number"):
+            item["po_number"] = po_number
+    data["line_items"] = items
+
+    items_sum = round(sum(parse_number(str(i.get("total"))) or 0.0 for i in items), 2)
+    total = parse_number(str(data.get("total_amount"))) if data.get("total_amount") is not None else None
+    warnings = []
+
+    if total is None:
+        if items_sum:
+            data["total_amount"] = items_sum
+            warnings.append("total_amount missing in header, using sum of line items")
+    elif items_sum:
+        tolerance = abs(total) * tolerance_percent / 100
+        if items_sum - total > tolerance:
+            warnings.append(f"Line items sum ({items_sum}) exceeds invoice total ({total})")
+        elif total - items_sum > max(tolerance, abs(total) * 0.5):
+            warnings.append(f"Line items sum ({items_sum}) is far below invoice total ({total}) - rows may be missing")
+
+    if warnings:
+        data["extraction_warnings"] = warnings
+        data["translation_confidence"] = round(min(float(data.get("translation_confidence") or 1.0), 0.6), 2)
+    return data
@@ -1,5 +1,6 @@
 import os
 import shutil
+import uuid
 from pathlib import Path
 from protocols.mcp import BaseTool
 
@@ -32,4 +33,16 @@ class InvoiceWatcherTool(BaseTool):
             "found": True,
             "file_path": str(dest_file),
             "file_name": target_file.name
-        }
\ No newline at end of file
+        }
+
+    def move_to_processed(self, current_path_str: str) -> str:
+        """Archives a finished file into the processed folder. Returns the new path."""
+        current = Path(current_path_str)
+        dest_file = self.process_path / current.name
+        
+        # Never overwrite an earlier upload with the same name
+        if dest_file.exists():
+            dest_file = self.process_path / f"{uuid.uuid4().hex[:8]}_{current.name}"
+        
+        shutil.move(str(current), str(dest_file))
+        return str(dest_file)
@@ -4,6 +4,9 @@ import easyocr
 import numpy as np
 from pdf2image import convert_from_path
 from protocols.mcp import BaseTool
+from persona.persona_agent import load_rules
+from tools.table_extractor import extract_page_tables
+from tools.chunked_extraction import PAGE_BREAK
 from pathlib import Path
 
 class DataHarvesterTool(BaseTool):
@@ -15,6 +18,7 @@ class DataHarvesterTool(BaseTool):
         print(" [Init] Loading EasyOCR models... (This happens only once)")
         # We load English, Spanish, German
         self.reader = easyocr.Reader(['en', 'es', 'de'], gpu=False)
+        self.table_mode = load_rules().get("table_extraction", {}).get("enabled", True)
 
     def _redact_pii(self, text: str) -> str:
         """Responsible AI: Redact Email Addresses and Phone Numbers"""
@@ -22,16 +26,86 @@ class DataHarvesterTool(BaseTool):
         text = re.sub(r'[\w\.-]+@[\w\.-]+', '[EMAIL_REDACTED]', text)
         return text
 
+    def _ocr_image(self, img) -> str:
+        img_array = np.array(img)
+        # detail=0 returns a simple list of strings
+        ocr_result = self.reader.readtext(img_array, detail=0)
+        return " ".join(ocr_result)
+
+    def page_count(self, file_path: str) -> int:
+        path = Path(file_path)
+        if path.suffix.lower() == '.pdf':
+            with pdfplumber.open(path) as pdf:
+                return len(pdf.pages)
+        return 1 # Images are a single page
+
+    def extract_page(self, file_path: str, page_index: int) -> dict:
+        """
+        Extracts ONE page (0-based) so callers can stream pages as they finish.
+        Same strategies as execute(), decided per page: digital text (+ tables) first,
+        Vision OCR of just that page when it has no text layer.
+        """
+        path = Path(file_path)
+        if not path.exists():
+            return {"status": "error", "message": "File not found"}
+
+        page_text = ""
+        header_text = None
+        line_items = []
+        method = "unknown"
+
+        try:
+            if path.suffix.lower() == '.pdf':
+                with pdfplumber.open(path) as pdf:
+                    if page_index >= len(pdf.pages):
+                        return {"status": "error", "message": f"Page {page_index} out of range"}
+                    page = pdf.pages[page_index]
+                    page_text = page.extract_text() or ""
+                    if page_text.strip():
+                        method = "pdfplumber (Digital)"
+                        if self.table_mode:
+                            tables = extract_page_tables(page)
+                            line_items = tables["line_items"]
+                            header_text = tables["header_text"]
+
+            if not page_text.strip():
+                method = "EasyOCR (Vision)"
+                if path.suffix.lower() == '.pdf':
+                    # Rasterize only this page
+                    images = convert_from_path(str(path), first_page=page_index + 1, last_page=page_index + 1)
+                else:
+                    import PIL.Image
+                    images = [PIL.Image.open(str(path))]
+                page_text = self._ocr_image(images[0]) if images else ""
+
+            result = {
+                "status": "success",
+                "page": page_index,
+                "text": self._redact_pii(page_text),
+                "method": method
+            }
+            if line_items:
+                result["line_items"] = line_items
+                result["header_text"] = self._redact_pii(header_text or "")
+            return result
+
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
     def execute(self, file_path: str) -> dict:
         """
         Input: Path to the PDF/Image file.
         Output: Dictionary with 'raw_text' and 'method_used'.
+                For digital PDFs in table mode also 'line_items' (parsed from the
+                table geometry) and 'header_text' (everything outside the table).
         """
         path = Path(file_path)
         if not path.exists():
             return {"status": "error", "message": "File not found"}
 
         extracted_text = ""
+        header_text = ""
+        line_items = []
         method = "unknown"
 
         try:
@@ -41,10 +115,16 @@ class DataHarvesterTool(BaseTool):
                     for page in pdf.pages:
                         page_text = page.extract_text()
                         if page_text:
-                            extracted_text += page_text + "\n"
+                            extracted_text += page_text + "\n" + PAGE_BREAK
+                        
+                        # Table mode: read line items straight from the page geometry
+                        if self.table_mode and page_text:
+                            tables = extract_page_tables(page)
+                            line_items.extend(tables["line_items"])
+                            header_text += tables["header_text"] + "\n"
                 
                 if extracted_text.strip():
-                    method = "pdfplumber (Digital)"
+                    method = "pdfplumber (Digital + Tables)" if line_items else "pdfplumber (Digital)"
             
             # Strategy 2: Fallback to Optical Character Recognition (EasyOCR)
             # Runs if file is an image OR if PDFPlumber found nothing (scanned PDF)
@@ -61,19 +141,20 @@ class DataHarvesterTool(BaseTool):
                     images = [PIL.Image.open(str(path))]
 
                 for img in images:
-                    img_array = np.array(img)
-                    # detail=0 returns a simple list of strings
-                    ocr_result = self.reader.readtext(img_array, detail=0)
-                    extracted_text += " ".join(ocr_result) + "\n"
+                    extracted_text += self._ocr_image(img) + "\n" + PAGE_BREAK
 
             # Apply Guardrails
             clean_text = self._redact_pii(extracted_text)
 
-            return {
+            result = {
                 "status": "success",
                 "text": clean_text,
                 "method": method
             }
+            if line_items:
+                result["line_items"] = line_items
+                result["header_text"] = self._redact_pii(header_text)
+            return result
 
         except Exception as e:
             return {"status": "error", "message": str(e)}
\ No newline at end of file
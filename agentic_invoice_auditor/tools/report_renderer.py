@@ -0,0 +1,124 @@
+from html import escape
+from string import Template
+from protocols.mcp import BaseTool
+
+# Compiled once at import; rendering is plain string substitution
+PAGE_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Invoice Audit Report - $invoice_no</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        .container { width: 80%; margin: auto; }
+        .status-box { padding: 10px; text-align: center; font-weight: bold; margin-bottom: 20px; border-radius: 5px; }
+        .pass { background-color: #d4edda; color: #155724; }
+        .fail { background-color: #f8d7da; color: #721c24; }
+        .discrepancies, .narrative { margin-bottom: 20px; }
+        table { width: 100%; border-collapse: collapse; margin-bottom: 20px; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        td.num { text-align: right; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Invoice Audit Report</h1>
+
+        <div class="status-box $status_class">
+            Status: $status
+        </div>
+$narrative
+        <div class="discrepancies">
+            <h2>Discrepancies</h2>
+$discrepancies
+        </div>
+
+        <h2>Invoice Data</h2>
+        <table>
+            <thead>
+                <tr><th>Field</th><th>Value</th></tr>
+            </thead>
+            <tbody>
+$header_rows
+            </tbody>
+        </table>
+
+        <h3>Line Items</h3>
+        <table>
+            <thead>
+                <tr><th>Description</th><th>Quantity</th><th>Unit Price</th><th>Total</th><th>PO Number</th><th>Item Code</th></tr>
+            </thead>
+            <tbody>
+$item_rows
+            </tbody>
+        </table>
+    </div>
+</body>
+</html>
+""")
+
+NARRATIVE_TEMPLATE = Template("""
+        <div class="narrative">
+            <h2>Auditor Summary</h2>
+            <p>$text</p>
+        </div>
+""")
+
+HEADER_FIELDS = [
+    ("invoice_no", "Invoice Number"),
+    ("invoice_date", "Invoice Date"),
+    ("vendor_name", "Vendor Name"),
+    ("currency", "Currency"),
+    ("total_amount", "Total Amount"),
+    ("po_number", "PO Number"),
+]
+ITEM_FIELDS = ["description", "qty", "unit_price", "total", "po_number", "item_code"]
+NUMERIC_FIELDS = {"qty", "unit_price", "total"}
+PASS_STATUSES = {"PASS", "Approved", "SUCCESS"}
+
+def _cell(value) -> str:
+    return escape("" if value is None else str(value))
+
+class ReportRendererTool(BaseTool):
+    """
+    Renders the HTML audit report locally from structured_data, validation_status
+    and discrepancies. Deterministic layout, no LLM round trip.
+    """
+    def __init__(self):
+        super().__init__(name="report_renderer", description="Renders the HTML invoice audit report from validated data.")
+
+    def execute(self, report_data: dict, narrative: str = None) -> str:
+        status = report_data.get("validation_status", "Unknown")
+        discrepancies = report_data.get("discrepancies") or []
+
+        if discrepancies:
+            disc_html = "            <ul>\n" + "\n".join(
+                f"                <li>{_cell(d)}</li>" for d in discrepancies
+            ) + "\n            </ul>"
+        else:
+            disc_html = "            <p>None</p>"
+
+        header_rows = "\n".join(
+            f"                <tr><td>{label}</td><td>{_cell(report_data.get(field))}</td></tr>"
+            for field, label in HEADER_FIELDS
+            if report_data.get(field) not in (None, "")
+        )
+        item_rows = "\n".join(
+            "                <tr>" + "".join(
+                f'<td class="num">{_cell(item.get(f))}</td>' if f in NUMERIC_FIELDS else f"<td>{_cell(item.get(f))}</td>"
+                for f in ITEM_FIELDS
+            ) + "</tr>"
+            for item in report_data.get("line_items") or []
+        )
+
+        return PAGE_TEMPLATE.substitute(
+            invoice_no=_cell(report_data.get("invoice_no")),
+            status=_cell(status),
+            status_class="pass" if status in PASS_STATUSES else "fail",
+            narrative=NARRATIVE_TEMPLATE.substitute(text=_cell(narrative)) if narrative else "",
+            discrepancies=disc_html,
+            header_rows=header_rows,
+            item_rows=item_rows,
+        )
@@ -0,0 +1,146 @@
+import re
+from utils.text_parsing import parse_number
+
+# Header keywords (EN / ES / DE) -> line item column
+COLUMN_KEYWORDS = {
+    "item_code": ["item code", "sku", "code", "part no", "artikelnr", "art.-nr", "código", "codigo", "ref"],
+    "description": ["description", "item", "product", "service", "details", "beschreibung", "bezeichnung", "artikel", "descripción", "descripcion", "concepto"],
+    "qty": ["qty", "quantity", "units", "menge", "anzahl", "cantidad", "cant."],
+    "unit_price": ["unit price", "price", "rate", "unit cost", "einzelpreis", "preis", "precio unitario", "precio"],
+    "total": ["total", "amount", "line total", "net", "betrag", "gesamt", "importe"],
+}
+NUMERIC_COLUMNS = ("qty", "unit_price", "total")
+
+# Words closer than this (in PDF points) vertically are on the same visual row
+ROW_TOLERANCE = 3
+# Header words closer than this horizontally belong to the same column title
+PHRASE_GAP = 8
+
+def _match_column(header_cell: str):
+    """Maps a header cell ('Unit Price (USD)') to a line item field, most specific keyword first."""
+    text = (header_cell or "").strip().lower()
+    if not text:
+        return None
+    best, best_len = None, 0
+    for field, keywords in COLUMN_KEYWORDS.items():
+        for kw in keywords:
+            if kw in text and len(kw) > best_len:
+                best, best_len = field, len(kw)
+    return best
+
+def _header_mapping(row):
+    """Returns {column_index: field} if the row looks like a line item header, else None."""
+    mapping = {}
+    for idx, cell in enumerate(row):
+        field = _match_column(cell)
+        if field and field not in mapping.values():
+            mapping[idx] = field
+    if "description" in mapping.values() and sum(f in mapping.values() for f in NUMERIC_COLUMNS) >= 2:
+        return mapping
+    return None
+
+def _build_item(values: dict):
+    item = {"description": (values.get("description") or "").strip()}
+    for field in NUMERIC_COLUMNS:
+        item[field] = parse_number(values.get(field) or "")
+    item["item_code"] = (values.get("item_code") or "").strip() or None
+    item["po_number"] = None # Filled from the header by the translator
+
+    # Derive a single missing numeric column from the other two
+    qty, price, total = item["qty"], item["unit_price"], item["total"]
+    if total is None and qty is not None and price is not None:
+        item["total"] = round(qty * price, 2)
+    elif price is None and qty and total is not None:
+        item["unit_price"] = round(total / qty, 4)
+
+    if not item["description"] or item["total"] is None:
+        return None # Subtotal / tax / empty rows
+    if re.match(r"^(sub\s*total|total|tax|vat|gst|iva|mwst)\b", item["description"], re.I):
+        return None
+    return item
+
+def items_from_table(rows):
+    """Line items from a pdfplumber table (list of rows of cell strings)."""
+    for h_idx, row in enumerate(rows):
+        mapping = _header_mapping(row)
+        if not mapping:
+            continue
+        items = []
+        for data_row in rows[h_idx + 1:]:
+            values = {field: (data_row[idx] if idx < len(data_row) else None) for idx, field in mapping.items()}
+            item = _build_item(values)
+            if item:
+                items.append(item)
+        return items
+    return []
+
+def _group_rows(words):
+    rows = []
+    for word in sorted(words, key=lambda w: (round(w["top"]), w["x0"])):
+        if rows and abs(rows[-1][0]["top"] - word["top"]) <= ROW_TOLERANCE:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+    return [sorted(r, key=lambda w: w["x0"]) for r in rows]
+
+def items_from_words(words):
+    """
+    Line items from word positions, for tables drawn without ruling lines.
+    Finds the header row, uses each header word's x-position as a column anchor
+    and assigns every word below it to the nearest column.
+    Returns (items, (top, bottom)) where the span covers the table rows.
+    """
+    rows = _group_rows(words)
+    for h_idx, row in enumerate(rows):
+        # Group header words into phrases ("Unit" + "Price") before mapping them to columns
+        phrases = []
+        for word in row:
+            if phrases and word["x0"] - phrases[-1]["x1"] < PHRASE_GAP:
+                phrases[-1].update(text=f"{phrases[-1]['text']} {word['text']}", x1=word["x1"])
+            else:
+                phrases.append({"text": word["text"], "x0": word["x0"], "x1": word["x1"]})
+        columns = [dict(p, field=_match_column(p["text"])) for p in phrases]
+        columns = [c for c in columns if c["field"]]
+        fields = [c["field"] for c in columns]
+        if "description" not in fields or sum(f in fields for f in NUMERIC_COLUMNS) < 2 or len(set(fields)) != len(fields):
+            continue
+
+        items, last_bottom = [], row[0]["top"]
+        for data_row in rows[h_idx + 1:]:
+            values = {}
+            for word in data_row:
+                # Text columns start at the header's left edge, numbers align to its right edge
+                col = min(columns, key=lambda c: abs(c["x1"] - word["x1"]) if c["field"] in NUMERIC_COLUMNS else abs(c["x0"] - word["x0"]))
+                values[col["field"]] = f"{values.get(col['field'], '')} {word['text']}".strip()
+            item = _build_item(values)
+            if not item:
+                if items:
+                    break # First non-item row after the table (subtotal, notes, ...)
+                continue
+            items.append(item)
+            last_bottom = data_row[0]["bottom"]
+        if items:
+            return items, (row[0]["top"], last_bottom)
+    return [], None
+
+def extract_page_tables(page):
+    """
+    Table-aware extraction for one digital PDF page.
+    Returns {"line_items": [...], "header_text": page text outside the line item table}.
+    """
+    # 1. Ruled tables: pdfplumber finds the cell grid for us
+    for table in page.find_tables():
+        items = items_from_table(table.extract())
+        if items:
+            outside = page.outside_bbox(table.bbox)
+            return {"line_items": items, "header_text": outside.extract_text() or ""}
+
+    # 2. Whitespace-aligned tables: rebuild the columns from word positions
+    items, span = items_from_words(page.extract_words(keep_blank_chars=False, use_text_flow=False))
+    if items:
+        top, bottom = span
+        bbox = (0, max(top - 1, 0), page.width, min(bottom + 1, page.height))
+        outside = page.outside_bbox(bbox)
+        return {"line_items": items, "header_text": outside.extract_text() or ""}
+
+    return {"line_items": [], "header_text": page.extract_text() or ""}
@@ -0,0 +1,356 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from protocols.mcp import BaseTool
+from persona.persona_agent import load_rules
+from utils.metrics import get_metrics
+from utils.text_parsing import parse_number
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEMPLATES_PATH = BASE_DIR / "data" / "templates" / "vendor_templates.json"
+
+metrics = get_metrics("template_extractor")
+
+# Value patterns used when rebuilding a field from its learned anchor
+NUMBER_PATTERN = r"[-+]?\d[\d,.']*"
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d.%m.%Y", "%d-%m-%Y", "%Y/%m/%d", "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y"]
+DATE_PATTERN = r"\d{1,4}[./-]\d{1,2}[./-]\d{1,4}|\d{1,2} [A-Za-z]{3,9} \d{4}|[A-Za-z]{3,9} \d{1,2}, \d{4}"
+CODE_PATTERN = r"[A-Za-z0-9][A-Za-z0-9\-/_.]*[A-Za-z0-9]"
+
+HEADER_FIELDS = {
+    "invoice_no": CODE_PATTERN,
+    "po_number": CODE_PATTERN,
+    "invoice_date": DATE_PATTERN,
+    "total_amount": NUMBER_PATTERN,
+}
+ITEM_NUMERIC_FIELDS = ["qty", "unit_price", "total"]
+
+# Anchors are the label text in front of a value on the same line ("Invoice No:")
+MAX_ANCHOR_CHARS = 32
+ANCHOR_PATTERN = r"[A-Za-zÀ-ÿ][A-Za-zÀ-ÿ #.:/()°$€£¥₹]*$"
+
+def parse_date(token: str, fmt: str = None):
+    formats = [fmt] if fmt else DATE_FORMATS
+    for f in formats:
+        try:
+            return datetime.strptime(token.strip(), f).strftime("%Y-%m-%d"), f
+        except ValueError:
+            continue
+    return None, None
+
+def _close(a, b, tolerance=0.01):
+    try:
+        return abs(float(a) - float(b)) <= max(tolerance * abs(float(b)), 0.005)
+    except (TypeError, ValueError):
+        return False
+
+class VendorTemplateTool(BaseTool):
+    """
+    Fast-path extractor for vendors with fixed layouts.
+    Learns anchor + regex templates from successful LLM extractions and
+    replays them locally, so known vendors skip the translate_invoice round trip.
+    """
+    def __init__(self, templates_path: Path = TEMPLATES_PATH):
+        super().__init__(
+            name="vendor_template_extractor",
+            description="Extracts invoice JSON locally using per-vendor templates learned from past LLM runs."
+        )
+        self.templates_path = Path(templates_path)
+        cfg = load_rules().get("template_extractor", {})
+        self.enabled = cfg.get("enabled", True)
+        self.min_confidence = float(cfg.get("min_confidence", 0.9))
+        self.min_samples = int(cfg.get("min_samples", 2))
+
+    # --- PUBLIC API ---
+
+    def execute(self, raw_text: str) -> dict:
+        """
+        Returns {"matched": True, "structured_data": {...}, "confidence": x, "vendor": name}
+        or {"matched": False, "reason": "..."} when the LLM should be used instead.
+        """
+        if not self.enabled or not raw_text:
+            return {"matched": False, "reason": "Template extractor disabled"}
+
+        template = self._find_template(raw_text)
+        if not template:
+            return self._fallback("No template for vendor")
+        if template.get("samples", 0) < self.min_samples:
+            return self._fallback(f"Template for {template['vendor_name']} still learning ({template.get('samples', 0)}/{self.min_samples} samples)")
+
+        data, confidence = self._apply(template, raw_text)
+        if confidence < self.min_confidence:
+            return self._fallback(f"Low confidence {confidence:.2f} for {template['vendor_name']}")
+
+        metrics.incr("llm_avoided")
+        self._update_rate()
+        return {
+            "matched": True,
+            "vendor": template["vendor_name"],
+            "confidence": confidence,
+            "structured_data": data,
+        }
+
+    def learn(self, raw_text: str, structured_data: dict) -> bool:
+        """
+        Builds (or refreshes) the vendor template from a trusted LLM extraction.
+        The template is only kept if it reproduces the same extraction from the same text.
+        """
+        vendor = (structured_data or {}).get("vendor_name")
+        if not raw_text or not vendor or vendor.lower() not in raw_text.lower():
+            return False
+
+        template = self._build_template(raw_text, structured_data)
+        if not template:
+            return False
+
+        # Self-check: the template must reproduce the LLM result on its own source text
+        replay, confidence = self._apply(template, raw_text)
+        if confidence < self.min_confidence or not self._same_extraction(replay, structured_data):
+            metrics.incr("learn_rejected")
+            return False
+
+        with _store_lock:
+            templates = self._load()
+            key = vendor.lower()
+            previous = templates.get(key)
+            if previous and previous.get("fingerprint") == template["fingerprint"]:
+                template["samples"] = previous.get("samples", 0) + 1
+            else:
+                template["samples"] = 1 # Layout changed (or new vendor): start over
+            templates[key] = template
+            self._save(templates)
+
+        metrics.incr("templates_learned")
+        return True
+
+    # --- TEMPLATE BUILDING ---
+
+    def _build_template(self, raw_text: str, data: dict):
+        lines = raw_text.splitlines()
+        fields = {}
+
+        for field, pattern in HEADER_FIELDS.items():
+            value = data.get(field)
+            if value in (None, "", "null"):
+                # Header PO is often only present on the line items
+                if field == "po_number":
+                    value = next((i.get("po_number") for i in data.get("line_items", []) if i.get("po_number")), None)
+                if value in (None, "", "null"):
+                    continue
+            spec = self._learn_field(lines, field, value, pattern)
+            if spec:
+                fields[field] = spec
+
+        # Invoice number and total are the minimum for a usable template
+        if "invoice_no" not in fields or "total_amount" not in fields:
+            return None
+
+        row = self._learn_row(lines, data.get("line_items", []))
+        items = data.get("line_items", [])
+        item_sum = sum(float(i.get("total") or 0) for i in items)
+
+        template = {
+            "vendor_name": data["vendor_name"],
+            "currency": data.get("currency"),
+            "fields": fields,
+            "line_item_row": row,
+            "po_on_items": bool(items) and all(i.get("po_number") for i in items),
+            # e.g. 1.1 when totals include 10% tax on top of the line items
+            "total_ratio": round(float(data["total_amount"]) / item_sum, 6) if item_sum else None,
+            "learned_at": datetime.now().isoformat(),
+        }
+        template["fingerprint"] = json.dumps(
+            {"fields": {k: v["anchor"] for k, v in fields.items()}, "row": row and row["columns"]}, sort_keys=True
+        )
+        return template
+
+    def _learn_field(self, lines, field, value, pattern):
+        for line in lines:
+            for match in re.finditer(pattern, line):
+                token = match.group(0)
+                fmt = None
+                if field == "total_amount":
+                    if not _close(parse_number(token), value, tolerance=0.0001):
+                        continue
+                elif field == "invoice_date":
+                    parsed, fmt = parse_date(token)
+                    if parsed != str(value):
+                        continue
+                elif token != str(value):
+                    continue
+
+                # The anchor is the label right before the value, without any earlier values on the line
+                label = re.search(ANCHOR_PATTERN, line[:match.start()].rstrip())
+                anchor = label.group(0)[-MAX_ANCHOR_CHARS:].strip() if label else ""
+                if not re.search(r"[A-Za-zÀ-ÿ]{2,}", anchor):
+                    continue
+                spec = {"anchor": anchor, "pattern": pattern}
+                if fmt:
+                    spec["date_format"] = fmt
+                return spec
+        return None
+
+    def _learn_row(self, lines, items):
+        """Learns the column order of a line-item row, e.g. [item_code, description, qty, unit_price, total]."""
+        if not items:
+            return None
+        columns = None
+        for item in items:
+            desc = str(item.get("description") or "").strip()
+            line = next((l for l in lines if desc and desc.lower() in l.lower()), None)
+            if not line:
+                return None
+            row_cols = self._row_columns(line, item)
+            if not row_cols or (columns and row_cols != columns):
+                return None
+            columns = row_cols
+        return {"columns": columns}
+
+    def _row_columns(self, line, item):
+        desc = str(item.get("description")).strip()
+        start = line.lower().index(desc.lower())
+        positions = [(start, "description")]
+
+        code = item.get("item_code")
+        if code and code in line:
+            positions.append((line.index(code), "item_code"))
+
+        tail = line[start + len(desc):]
+        remaining = list(ITEM_NUMERIC_FIELDS)
+        for match in re.finditer(NUMBER_PATTERN, tail):
+            number = parse_number(match.group(0))
+            for field in remaining:
+                if _close(number, item.get(field), tolerance=0.0001):
+                    positions.append((start + len(desc) + match.start(), field))
+                    remaining.remove(field)
+                    break
+        if remaining:
+            return None
+        return [name for _, name in sorted(positions)]
+
+    # --- TEMPLATE REPLAY ---
+
+    def _apply(self, template, raw_text):
+        data = {
+            "invoice_no": None,
+            "invoice_date": None,
+            "vendor_name": template["vendor_name"],
+            "currency": template.get("currency"),
+            "total_amount": None,
+            "line_items": [],
+        }
+        found, expected = 0, len(template["fields"])
+
+        for field, spec in template["fields"].items():
+            regex = re.escape(spec["anchor"]) + r"\s*(" + spec["pattern"] + ")"
+            match = re.search(regex, raw_text)
+            if not match:
+                continue
+            token = match.group(1)
+            if field == "total_amount":
+                value = parse_number(token)
+            elif field == "invoice_date":
+                value, _ = parse_date(token, spec.get("date_format"))
+            else:
+                value = token
+            if value is not None:
+                data[field] = value
+                found += 1
+
+        po_number = data.get("po_number")
+        row = template.get("line_item_row")
+        if row:
+            data["line_items"] = self._extract_rows(raw_text, row["columns"], po_number if template.get("po_on_items") else None)
+
+        confidence = found / expected if expected else 0.0
+        if row:
+            # Line items must add up the same way they did when the template was learned
+            item_sum = sum(i["total"] for i in data["line_items"])
+            ratio = template.get("total_ratio") or 1.0
+            if not data["line_items"] or not _close(item_sum * ratio, data["total_amount"] or 0):
+                confidence *= 0.5
+
+        data["translation_confidence"] = round(confidence, 3)
+        return data, confidence
+
+    def _extract_rows(self, raw_text, columns, po_number):
+        parts = []
+        for col in columns:
+            if col == "description":
+                parts.append(r"(?P<description>.+?)")
+            elif col == "item_code":
+                parts.append(r"(?P<item_code>" + CODE_PATTERN + ")")
+            else:
+                parts.append(r"[^\d\s-]{0,3}(?P<" + col + ">" + NUMBER_PATTERN + ")")
+        row_regex = re.compile(r"^\s*" + r"\s+".join(parts) + r"\s*$")
+
+        items = []
+        for line in raw_text.splitlines():
+            match = row_regex.match(line)
+            if not match:
+                continue
+            qty = parse_number(match.group("qty"))
+            unit_price = parse_number(match.group("unit_price"))
+            total = parse_number(match.group("total"))
+            if None in (qty, unit_price, total) or not _close(qty * unit_price, total):
+                continue # Not a real row (header, subtotal line, ...)
+            items.append({
+                "description": match.group("description").strip(),
+                "qty": qty,
+                "unit_price": unit_price,
+                "total": total,
+                "po_number": po_number,
+                "item_code": match.group("item_code") if "item_code" in columns else None,
+            })
+        return items
+
+    @staticmethod
+    def _same_extraction(replay, original):
+        for field in ["invoice_no", "invoice_date", "vendor_name"]:
+            if original.get(field) and str(replay.get(field)) != str(original.get(field)):
+                return False
+        if not _close(replay.get("total_amount") or 0, original.get("total_amount") or 0):
+            return False
+        return len(replay.get("line_items", [])) == len(original.get("line_items", []))
+
+    # --- STORAGE & STATS ---
+
+    def _find_template(self, raw_text):
+        haystack = raw_text.lower()
+        # Longest vendor name first, so "Global Logistics Ltd" beats "Global"
+        for key, template in sorted(self._load().items(), key=lambda kv: -len(kv[0])):
+            if key in haystack:
+                return template
+        return None
+
+    def _fallback(self, reason):
+        metrics.incr("llm_fallbacks")
+        self._update_rate()
+        return {"matched": False, "reason": reason}
+
+    @staticmethod
+    def _update_rate():
+        avoided = metrics.get("llm_avoided")
+        total = avoided + metrics.get("llm_fallbacks")
+        metrics.set_gauge("llm_avoidance_rate", round(avoided / total, 4) if total else 0.0)
+
+    def _load(self) -> dict:
+        if not self.templates_path.exists():
+            return {}
+        try:
+            with open(self.templates_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, templates: dict):
+        self.templates_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.templates_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(templates, f, indent=2)
+        os.replace(tmp, self.templates_path)
+
+_store_lock = threading.Lock()
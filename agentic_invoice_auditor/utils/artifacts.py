@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import os
+import threading
+from pathlib import Path
+from persona.persona_agent import load_rules
+from utils.metrics import get_metrics
+
+try:
+    import brotli # Optional: without it only gzip variants are written
+except ImportError:
+    brotli = None
+
+metrics = get_metrics("artifacts")
+
+# Content-Encoding -> (file suffix, compressor), in server preference order
+ENCODERS = {"gzip": (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))}
+if brotli is not None:
+    ENCODERS = {"br": (".br", lambda data: brotli.compress(data, quality=11)), **ENCODERS}
+
+def artifact_settings() -> dict:
+    cfg = load_rules().get("report_artifacts", {})
+    return {
+        "encodings": [e for e in cfg.get("precompress", ["br", "gzip"]) if e in ENCODERS],
+        "min_bytes": int(cfg.get("min_bytes", 1024)),
+        "cache_control": cfg.get("cache_control", "private, no-cache"),
+    }
+
+def _atomic_write(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def variant_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + ENCODERS[encoding][0])
+
+def precompress(path, data: bytes = None) -> list:
+    """
+    Writes <file>.br / <file>.gz next to an artifact (once, at write time), so serving a
+    compressed report is a plain file read. Returns the encodings written.
+    """
+    path = Path(path)
+    data = path.read_bytes() if data is None else data
+    settings = artifact_settings()
+    if len(data) < settings["min_bytes"]:
+        return []
+    written = []
+    for encoding in settings["encodings"]:
+        compressed = ENCODERS[encoding][1](data)
+        if len(compressed) >= len(data):
+            continue
+        _atomic_write(variant_path(path, encoding), compressed)
+        metrics.incr(f"saved_bytes_{encoding}", len(data) - len(compressed))
+        written.append(encoding)
+    return written
+
+def write_artifact(path, text: str) -> Path:
+    """Atomically writes a text artifact (e.g. an HTML report) together with its compressed variants."""
+    path = Path(path)
+    data = text.encode("utf-8")
+    _atomic_write(path, data)
+    precompress(path, data)
+    metrics.incr("written")
+    return path
+
+_hashes = {} # path -> (mtime_ns, size, sha256)
+_hashes_lock = threading.Lock()
+
+def content_hash(path: Path) -> str:
+    """sha256 of an artifact, recomputed only when its mtime or size changes."""
+    stat = path.stat()
+    key = str(path)
+    with _hashes_lock:
+        cached = _hashes.get(key)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    with _hashes_lock:
+        _hashes[key] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Accept-Encoding header -> {coding: q}."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+def negotiate(path: Path, accept_encoding: str):
+    """
+    Picks the representation to send: (file, Content-Encoding or None).
+    A variant is only used if it is at least as new as the artifact; missing or stale
+    variants (e.g. reports written before precompression) are rebuilt on first request.
+    """
+    settings = artifact_settings()
+    accepted = accepted_encodings(accept_encoding)
+    candidates = [e for e in settings["encodings"] if accepted.get(e, accepted.get("*", 0)) > 0]
+    stat = path.stat()
+    if not candidates or stat.st_size < settings["min_bytes"]:
+        return path, None
+    source_mtime = stat.st_mtime_ns
+    fresh = lambda e: variant_path(path, e).exists() and variant_path(path, e).stat().st_mtime_ns >= source_mtime
+    if not any(fresh(e) for e in candidates):
+        precompress(path)
+        metrics.incr("lazy_precompress")
+    candidates = sorted((e for e in candidates if fresh(e)), key=lambda e: -accepted.get(e, accepted.get("*", 0)))
+    if not candidates:
+        return path, None
+    return variant_path(path, candidates[0]), candidates[0]
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
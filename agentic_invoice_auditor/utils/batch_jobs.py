@@ -0,0 +1,416 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from persona.persona_agent import load_rules
+from utils.blob_store import UploadRejected, upload_limits
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("BATCH_JOBS")
+metrics = get_metrics("batch_uploads")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DB_PATH = BASE_DIR / "outputs" / "store" / "batches.db"
+
+# Per-file states; the last three are final
+QUEUED, PROCESSING, COMPLETED, FAILED, REJECTED, SKIPPED = "queued", "processing", "completed", "failed", "rejected", "skipped"
+FINAL = (COMPLETED, FAILED, REJECTED, SKIPPED)
+# Fields of invoice_result() copied onto skipped duplicates
+RESULT_FIELDS = ("invoice_no", "vendor_name", "total_amount", "is_valid", "discrepancies")
+
+def batch_limits() -> dict:
+    cfg = load_rules().get("batch_uploads", {})
+    return {
+        "max_files": int(cfg.get("max_files", 1000)),
+        "max_batch_bytes": int(float(cfg.get("max_batch_mb", 500)) * 1024 * 1024),
+        "max_concurrency": int(cfg.get("max_concurrency", 4)),
+        "max_batches_kept": int(cfg.get("max_batches_kept", 50)),
+    }
+
+def zip_members(archive):
+    """Invoice entries of a ZIP archive (folders, hidden files and macOS resource forks skipped)."""
+    for info in archive.infolist():
+        parts = PurePosixPath(info.filename).parts
+        if info.is_dir() or not parts or "__MACOSX" in parts or parts[-1].startswith("."):
+            continue
+        yield info
+
+def invoice_result(final_state: dict) -> dict:
+    """Per-file result of one workflow run, small enough to poll."""
+    data = final_state.get("structured_data") or {}
+    result = {
+        "invoice_no": data.get("invoice_no"),
+        "vendor_name": data.get("vendor_name"),
+        "total_amount": data.get("total_amount"),
+        "is_valid": final_state.get("is_valid"),
+        "discrepancies": final_state.get("discrepancies") or [],
+    }
+    if final_state.get("status") == "FAILED":
+        result["error"] = final_state.get("error_message") or "Workflow failed"
+    return result
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class BatchStore:
+    """
+    Batch and per-file progress in SQLite (next to the report store), so every uvicorn
+    worker can answer a status poll and batches survive restarts. Each batch records the
+    process running its files; files a dead process left queued or processing are claimed
+    and requeued by another (see BatchRunner.recover).
+    """
+    def __init__(self, path=None):
+        self.path = Path(path or DEFAULT_DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                started REAL NOT NULL,
+                finished_at TEXT,
+                sealed INTEGER NOT NULL DEFAULT 0, -- no more files will be added
+                owner INTEGER -- pid of the process running its files
+            );
+            CREATE INDEX IF NOT EXISTS batches_finished ON batches (finished_at, started);
+            CREATE TABLE IF NOT EXISTS files (
+                batch_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                filename TEXT,
+                sha256 TEXT,
+                size INTEGER,
+                path TEXT,
+                status TEXT NOT NULL,
+                duplicate_of TEXT,
+                duration_ms INTEGER,
+                result TEXT, -- invoice_result() fields, or {"error": ...}
+                PRIMARY KEY (batch_id, seq)
+            );
+            CREATE INDEX IF NOT EXISTS files_sha ON files (batch_id, sha256);
+            """
+        )
+        self._conn.commit()
+
+    def _write(self, change):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE") # Serializes writers across threads and worker processes
+            try:
+                result = change(self._conn)
+                self._conn.commit()
+                return result
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                raise
+
+    @staticmethod
+    def _insert(conn, batch_id: str, **entry) -> int:
+        seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM files WHERE batch_id = ?", (batch_id,)).fetchone()[0]
+        result = entry.pop("result", None)
+        columns = ["batch_id", "seq", "result"] + list(entry)
+        conn.execute(
+            f"INSERT INTO files ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [batch_id, seq, json.dumps(result or {}, default=str)] + list(entry.values()),
+        )
+        return seq
+
+    @staticmethod
+    def _check_finished(conn, batch_id: str):
+        """Marks a sealed batch whose files are all final as finished. Returns its start time if it just finished."""
+        row = conn.execute("SELECT sealed, finished_at, started FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if not row or not row[0] or row[1]:
+            return None
+        pending = conn.execute(
+            f"SELECT COUNT(*) FROM files WHERE batch_id = ? AND status NOT IN ({', '.join('?' * len(FINAL))})",
+            (batch_id,) + FINAL,
+        ).fetchone()[0]
+        if pending:
+            return None
+        conn.execute("UPDATE batches SET finished_at = ? WHERE batch_id = ?", (datetime.now().isoformat(), batch_id))
+        return row[2]
+
+    def create(self, batch_id: str, owner: int, max_batches_kept: int = 50):
+        def change(conn):
+            conn.execute(
+                "INSERT INTO batches (batch_id, created_at, started, owner) VALUES (?, ?, ?, ?)",
+                (batch_id, datetime.now().isoformat(), time.time(), owner),
+            )
+            # Forget the oldest finished batches
+            total = conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+            old = [r[0] for r in conn.execute(
+                "SELECT batch_id FROM batches WHERE finished_at IS NOT NULL ORDER BY started LIMIT ?",
+                (max(0, total - max_batches_kept),),
+            )]
+            for old_id in old:
+                conn.execute("DELETE FROM files WHERE batch_id = ?", (old_id,))
+                conn.execute("DELETE FROM batches WHERE batch_id = ?", (old_id,))
+        self._write(change)
+
+    def add(self, batch_id: str, blob: dict) -> tuple:
+        """Records a stored upload. Returns (seq, True) if it must be processed, (seq, False) for a duplicate."""
+        def change(conn):
+            first = conn.execute(
+                "SELECT filename, result FROM files WHERE batch_id = ? AND sha256 = ? AND duplicate_of IS NULL "
+                "ORDER BY seq LIMIT 1", (batch_id, blob["sha256"]),
+            ).fetchone()
+            entry = {k: blob[k] for k in ("filename", "sha256", "size", "path")}
+            if first is None:
+                return self._insert(conn, batch_id, status=QUEUED, **entry), True
+            result = json.loads(first[1] or "{}")
+            seq = self._insert(conn, batch_id, status=SKIPPED, duplicate_of=first[0],
+                               result={k: result[k] for k in RESULT_FIELDS if k in result}, **entry)
+            return seq, False
+        return self._write(change)
+
+    def reject(self, batch_id: str, filename: str, error: str):
+        self._write(lambda conn: self._insert(conn, batch_id, filename=filename, status=REJECTED, result={"error": error}))
+
+    def seal(self, batch_id: str):
+        def change(conn):
+            conn.execute("UPDATE batches SET sealed = 1 WHERE batch_id = ?", (batch_id,))
+            return self._check_finished(conn, batch_id)
+        return self._write(change)
+
+    def mark(self, batch_id: str, seq: int, status: str):
+        self._write(lambda conn: conn.execute("UPDATE files SET status = ? WHERE batch_id = ? AND seq = ?", (status, batch_id, seq)))
+
+    def finish(self, batch_id: str, seq: int, status: str, result: dict, duration_ms: int = None):
+        """Stores a file's result (copied onto its skipped duplicates). Returns the batch start time if the batch just finished."""
+        def change(conn):
+            conn.execute(
+                "UPDATE files SET status = ?, result = ?, duration_ms = ? WHERE batch_id = ? AND seq = ?",
+                (status, json.dumps(result, default=str), duration_ms, batch_id, seq),
+            )
+            # Skipped copies report the result of the file they duplicate
+            conn.execute(
+                "UPDATE files SET result = ? WHERE batch_id = ? AND status = ? AND sha256 = "
+                "(SELECT sha256 FROM files WHERE batch_id = ? AND seq = ?)",
+                (json.dumps({k: result[k] for k in RESULT_FIELDS if k in result}, default=str), batch_id, SKIPPED, batch_id, seq),
+            )
+            return self._check_finished(conn, batch_id)
+        return self._write(change)
+
+    def orphaned(self, owner: int) -> list:
+        """Unfinished batches whose owning process is gone."""
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id, owner FROM batches WHERE finished_at IS NULL").fetchall()
+        return [(batch_id, pid) for batch_id, pid in rows if pid != owner and not (pid and _alive(pid))]
+
+    def claim(self, batch_id: str, previous_owner: int, owner: int) -> list:
+        """
+        Takes over an orphaned batch (only one process wins). An upload that died midway is
+        sealed as is; its unfinished files are queued again. Returns them as blobs.
+        """
+        def change(conn):
+            claimed = conn.execute(
+                "UPDATE batches SET owner = ?, sealed = 1 WHERE batch_id = ? AND owner IS ? AND finished_at IS NULL",
+                (owner, batch_id, previous_owner),
+            ).rowcount
+            if not claimed:
+                return []
+            rows = conn.execute(
+                "SELECT seq, filename, sha256, size, path FROM files WHERE batch_id = ? AND status IN (?, ?) ORDER BY seq",
+                (batch_id, QUEUED, PROCESSING),
+            ).fetchall()
+            conn.execute("UPDATE files SET status = ? WHERE batch_id = ? AND status = ?", (QUEUED, batch_id, PROCESSING))
+            self._check_finished(conn, batch_id)
+            return [(seq, {"filename": f, "sha256": sha, "size": size, "path": path}) for seq, f, sha, size, path in rows]
+        return self._write(change)
+
+    def progress(self, batch_id: str):
+        with self._lock:
+            batch = self._conn.execute(
+                "SELECT created_at, finished_at, sealed FROM batches WHERE batch_id = ?", (batch_id,)
+            ).fetchone()
+            if batch is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT filename, sha256, size, status, duplicate_of, duration_ms, result FROM files WHERE batch_id = ? ORDER BY seq",
+                (batch_id,),
+            ).fetchall()
+        created_at, finished_at, sealed = batch
+        files = []
+        for filename, sha256, size, status, duplicate_of, duration_ms, result in rows:
+            entry = {"filename": filename, "sha256": sha256, "size": size, "status": status,
+                     "duplicate_of": duplicate_of, "duration_ms": duration_ms}
+            entry = {k: v for k, v in entry.items() if v is not None}
+            entry.update(json.loads(result or "{}"))
+            files.append(entry)
+
+        counts = {state: 0 for state in (QUEUED, PROCESSING) + FINAL}
+        for entry in files:
+            counts[entry["status"]] += 1
+        total = len(files)
+        done = sum(counts[state] for state in FINAL)
+        return {
+            "batch_id": batch_id,
+            "status": "completed" if sealed and done == total else ("receiving" if not sealed else "processing"),
+            "created_at": created_at,
+            "finished_at": finished_at,
+            "total": total,
+            "done": done,
+            "percent": round(100.0 * done / total, 1) if total else (100.0 if sealed else 0.0),
+            "counts": counts,
+            "files": files,
+        }
+
+class BatchRunner:
+    """
+    Bulk upload pipeline. Files (or ZIP members) are queued on a bounded worker pool the
+    moment they are stored, so processing starts while the rest of the upload is still
+    being extracted. Identical files within one batch are processed once.
+    Progress lives in the BatchStore, so it is visible to every worker and outlives restarts.
+    """
+    def __init__(self, process_fn, store: BatchStore, max_concurrency: int = 4, max_batches_kept: int = 50):
+        self.process_fn = process_fn # blob -> result dict (see invoice_result)
+        self.store = store
+        self.owner = os.getpid()
+        self.max_batches_kept = max_batches_kept
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(max_concurrency)), thread_name_prefix="batch")
+
+    def create(self) -> str:
+        batch_id = uuid.uuid4().hex[:12]
+        self.store.create(batch_id, self.owner, self.max_batches_kept)
+        metrics.incr("batches")
+        return batch_id
+
+    def add(self, batch_id: str, blob: dict):
+        """Queues a stored upload ({sha256, path, filename, ...} from the blob store)."""
+        seq, fresh = self.store.add(batch_id, blob)
+        metrics.incr("files")
+        if fresh:
+            self.pool.submit(self._run, batch_id, seq, blob)
+
+    def reject(self, batch_id: str, filename: str, error: str):
+        self.store.reject(batch_id, filename, error)
+        metrics.incr("rejected")
+
+    def seal(self, batch_id: str):
+        self._finished(batch_id, self.store.seal(batch_id))
+
+    def status(self, batch_id: str):
+        return self.store.progress(batch_id)
+
+    def _run(self, batch_id: str, seq: int, blob: dict):
+        self.store.mark(batch_id, seq, PROCESSING)
+        started = time.time()
+        try:
+            result = self.process_fn(blob)
+        except Exception as e:
+            logger.error(f"Batch {batch_id}: {blob['filename']} failed: {e}")
+            result = {"error": str(e)}
+        status = FAILED if result.get("error") else COMPLETED
+        self._finished(batch_id, self.store.finish(batch_id, seq, status, result, round((time.time() - started) * 1000)))
+        metrics.incr("failed" if result.get("error") else "completed")
+        metrics.observe("file_ms", (time.time() - started) * 1000)
+
+    def _finished(self, batch_id: str, started):
+        if started is not None:
+            metrics.observe("batch_ms", (time.time() - started) * 1000)
+            logger.info(f"Batch {batch_id} finished")
+
+    def recover(self) -> int:
+        """Requeues the unfinished files of batches whose process died (restart, crash). Returns how many."""
+        requeued = 0
+        for batch_id, previous_owner in self.store.orphaned(self.owner):
+            for seq, blob in self.store.claim(batch_id, previous_owner, self.owner):
+                if Path(blob["path"] or "").exists():
+                    self.pool.submit(self._run, batch_id, seq, blob)
+                    requeued += 1
+                else:
+                    self._finished(batch_id, self.store.finish(batch_id, seq, FAILED, {"error": "Stored upload is gone"}))
+        if requeued:
+            metrics.incr("requeued", requeued)
+            logger.info(f"Requeued {requeued} file(s) of interrupted batches")
+        return requeued
+
+    def ingest_zip(self, batch_id: str, fileobj, store, max_files: int, max_bytes: int) -> tuple:
+        """
+        Streams each member of a ZIP archive into the blob store and queues it (blocking; run it
+        off the event loop). Members are read chunk by chunk, so the archive is never unpacked in
+        memory; the file count and the total uncompressed size are capped against ZIP bombs.
+        Returns (files queued, bytes stored).
+        """
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise UploadRejected(415, "Not a valid ZIP archive")
+        queued, total_bytes = 0, 0
+        with archive:
+            for info in zip_members(archive):
+                name = PurePosixPath(info.filename).name
+                if queued >= max_files:
+                    self.reject(batch_id, name, f"Batch is limited to {max_files} files")
+                    continue
+                remaining = max_bytes - total_bytes
+                # Declared sizes can lie, so the remaining budget is also enforced while streaming
+                if info.file_size > remaining or remaining <= 0:
+                    self.reject(batch_id, name, "Archive exceeds the batch size limit")
+                    continue
+                try:
+                    with archive.open(info) as member:
+                        blob = store.ingest_file(member, name, max_bytes=min(remaining, upload_limits()["max_bytes"]))
+                except UploadRejected as e:
+                    self.reject(batch_id, name, str(e))
+                    continue
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError) as e: # Corrupt, encrypted, unsupported compression
+                    self.reject(batch_id, name, f"Unreadable archive member: {e}")
+                    continue
+                total_bytes += blob["size"]
+                self.add(batch_id, blob)
+                queued += 1
+        return queued, total_bytes
+
+_store = None
+_store_lock = threading.Lock()
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_batch_store() -> BatchStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BatchStore()
+        return _store
+
+def get_batch_runner() -> BatchRunner:
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            from main_workflow import build_graph
+            workflow = build_graph() # Compiled once, shared by every worker thread
+
+            def process(blob: dict) -> dict:
+                final_state = workflow.invoke({
+                    "status": "STARTING",
+                    "file_name": blob["filename"],
+                    "file_path": blob["path"],
+                    "file_sha256": blob["sha256"],
+                })
+                return invoice_result(final_state)
+
+            limits = batch_limits()
+            _runner = BatchRunner(process, get_batch_store(), limits["max_concurrency"], limits["max_batches_kept"])
+        return _runner
+
+def resume_batches() -> int:
+    """Picks up batches a dead process left unfinished (API startup); the workflow is only built if there are any."""
+    if not get_batch_store().orphaned(os.getpid()):
+        return 0
+    return get_batch_runner().recover()
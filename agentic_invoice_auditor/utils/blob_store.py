@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from persona.persona_agent import load_rules
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("BLOB_STORE")
+metrics = get_metrics("uploads")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BLOB_DIR = BASE_DIR / "data" / "blobs"
+
+# Leading bytes of each accepted type; the stored extension is the canonical one
+MAGIC = {
+    ".pdf": (b"%PDF-", ".pdf"),
+    ".png": (b"\x89PNG\r\n\x1a\n", ".png"),
+    ".jpg": (b"\xff\xd8\xff", ".jpg"),
+    ".jpeg": (b"\xff\xd8\xff", ".jpg"),
+}
+
+class UploadRejected(Exception):
+    """An upload broke a limit; status is the HTTP status to answer with."""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def upload_limits() -> dict:
+    cfg = load_rules().get("uploads", {})
+    return {
+        "max_bytes": int(float(cfg.get("max_file_mb", 25)) * 1024 * 1024),
+        "chunk_bytes": int(cfg.get("chunk_kb", 1024)) * 1024,
+        "extensions": [e.lower() for e in cfg.get("allowed_extensions", list(MAGIC))],
+    }
+
+class BlobStore:
+    """
+    Content-addressed storage for uploaded invoices: data/blobs/ab/<sha256>.<ext>.
+    Uploads are streamed chunk by chunk into a temp file while being hashed, so
+    limits are enforced as soon as they are crossed and an identical file is
+    recognised without reading it a second time (the temp file is just dropped).
+    """
+    def __init__(self, root=None):
+        self.root = Path(root or DEFAULT_BLOB_DIR)
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, sha256: str, ext: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}{ext}"
+
+    def contains(self, path) -> bool:
+        try:
+            Path(path).resolve().relative_to(self.root.resolve())
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def check_type(filename: str, extensions=None) -> tuple:
+        """(magic, canonical extension) for an accepted file name, else UploadRejected(415)."""
+        ext = Path(filename or "").suffix.lower()
+        if ext not in MAGIC or (extensions and ext not in extensions):
+            raise UploadRejected(415, f"Unsupported file type '{ext or filename}' (allowed: {', '.join(extensions or MAGIC)})")
+        return MAGIC[ext]
+
+    def _spool(self, filename: str, max_bytes: int = None, chunk_bytes: int = None) -> "_Spool":
+        limits = upload_limits()
+        magic, ext = self.check_type(filename, limits["extensions"])
+        return _Spool(self, filename, magic, ext, max_bytes or limits["max_bytes"], chunk_bytes or limits["chunk_bytes"])
+
+    async def ingest(self, stream, filename: str, max_bytes: int = None, chunk_bytes: int = None) -> dict:
+        """
+        Streams an async file-like object (e.g. an UploadFile) into the store.
+        Returns {sha256, path, size, duplicate, filename}. Disk writes run off the event loop.
+        """
+        spool = self._spool(filename, max_bytes, chunk_bytes)
+        try:
+            while True:
+                chunk = await stream.read(spool.chunk_bytes)
+                if not chunk:
+                    break
+                await asyncio.to_thread(spool.write, chunk)
+            return await asyncio.to_thread(spool.commit)
+        finally:
+            spool.discard()
+
+    def ingest_file(self, reader, filename: str, max_bytes: int = None, chunk_bytes: int = None) -> dict:
+        """Blocking variant of ingest() for a binary file object (e.g. a ZIP member)."""
+        spool = self._spool(filename, max_bytes, chunk_bytes)
+        try:
+            while True:
+                chunk = reader.read(spool.chunk_bytes)
+                if not chunk:
+                    break
+                spool.write(chunk)
+            return spool.commit()
+        finally:
+            spool.discard()
+
+    def _commit(self, tmp: Path, sha256: str, ext: str, size: int, filename: str) -> dict:
+        final = self.path_for(sha256, ext)
+        duplicate = final.exists()
+        if duplicate:
+            tmp.unlink(missing_ok=True) # Same bytes already stored
+            metrics.incr("duplicates")
+        else:
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp, final)
+            metrics.incr("stored")
+            metrics.incr("stored_bytes", size)
+        logger.info(f"{filename}: {size} bytes, sha256 {sha256[:12]}{' (duplicate)' if duplicate else ''}")
+        return {"sha256": sha256, "path": str(final), "size": size, "duplicate": duplicate, "filename": filename}
+
+class _Spool:
+    """One upload in flight: a temp file that is hashed and checked chunk by chunk."""
+    def __init__(self, store: BlobStore, filename: str, magic: bytes, ext: str, max_bytes: int, chunk_bytes: int):
+        self.store, self.filename, self.magic, self.ext = store, filename, magic, ext
+        self.max_bytes, self.chunk_bytes = max_bytes, chunk_bytes
+        self.tmp = store.tmp_dir / f"{uuid.uuid4().hex}.part"
+        self.digest, self.size = hashlib.sha256(), 0
+        self.f = open(self.tmp, "wb")
+
+    def write(self, chunk: bytes):
+        if self.size == 0 and not chunk.startswith(self.magic):
+            raise UploadRejected(415, f"{self.filename} is not a valid {self.ext[1:].upper()} file")
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            metrics.incr("rejected_too_large")
+            raise UploadRejected(413, f"{self.filename} exceeds the {self.max_bytes / (1024 * 1024):g} MB upload limit")
+        self.digest.update(chunk)
+        self.f.write(chunk)
+
+    def commit(self) -> dict:
+        if self.size == 0:
+            raise UploadRejected(400, f"{self.filename} is empty")
+        self.f.close()
+        return self.store._commit(self.tmp, self.digest.hexdigest(), self.ext, self.size, self.filename)
+
+    def discard(self):
+        """Drops the temp file unless commit() already moved it into place."""
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+_store = None
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from utils.metrics import get_metrics
+
+class DiskCache:
+    """
+    Small persistent key/value cache on SQLite with TTL and LRU eviction.
+    Safe to share between threads and between processes (SQLite does the locking).
+    Each entry carries a 'version' so a whole generation can be dropped at once.
+    """
+    def __init__(self, path, namespace: str, ttl_seconds: float = None, max_entries: int = 10000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.metrics = get_metrics(namespace)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB,
+                version TEXT,
+                created_at REAL,
+                last_access REAL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache (namespace, last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self._conn.commit()
+                self.metrics.incr("expired")
+                row = None
+            if row:
+                self._conn.execute(
+                    "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+                )
+                self._conn.commit()
+
+        self.metrics.incr("hits" if row else "misses")
+        self._update_hit_rate()
+        return row[0] if row else None
+
+    def put(self, key: str, value, version: str = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, version, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, value, version, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def purge_version(self, keep_version: str, prefix: str = None) -> int:
+        """Drops every entry not written under keep_version (optionally only keys starting with prefix)."""
+        with self._lock:
+            if prefix:
+                cur = self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key LIKE ? AND (version IS NULL OR version != ?)",
+                    (self.namespace, f"{prefix}%", keep_version),
+                )
+            else:
+                cur = self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND (version IS NULL OR version != ?)",
+                    (self.namespace, keep_version),
+                )
+            self._conn.commit()
+        if cur.rowcount:
+            self.metrics.incr("invalidated", cur.rowcount)
+        return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def _evict(self):
+        # Called with the lock held
+        if self.ttl_seconds:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at < ?", (self.namespace, time.time() - self.ttl_seconds)
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ? ORDER BY last_access ASC LIMIT ?
+                )""",
+                (self.namespace, self.namespace, overflow),
+            )
+            self.metrics.incr("evicted", overflow)
+
+    def _update_hit_rate(self):
+        hits = self.metrics.get("hits")
+        total = hits + self.metrics.get("misses")
+        self.metrics.set_gauge("hit_rate", round(hits / total, 4) if total else 0.0)
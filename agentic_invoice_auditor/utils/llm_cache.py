@@ -0,0 +1,65 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from persona.persona_agent import load_rules
+from utils.disk_cache import DiskCache
+from utils.logger import get_logger
+
+logger = get_logger("LLM_CACHE")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "outputs" / "cache" / "llm_cache.db"
+
+def normalize_input(text: str) -> str:
+    """Whitespace-insensitive form of the input, so re-scans of the same invoice hit the cache."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def prompt_version(prompts: dict, agent: str) -> str:
+    """Hash of one agent's section in persona_invoice_agent.yaml."""
+    section = json.dumps(prompts.get(agent, {}), sort_keys=True)
+    return hashlib.sha256(section.encode("utf-8")).hexdigest()[:16]
+
+class LLMResponseCache:
+    """
+    Disk-backed cache for LLM responses.
+    Key = sha256(model, prompt version, normalized input). When an agent's prompt
+    changes in the YAML, its old entries no longer match and are purged.
+    """
+    def __init__(self, path=None):
+        cfg = load_rules().get("llm_cache", {})
+        self.enabled = cfg.get("enabled", True)
+        ttl_hours = cfg.get("ttl_hours", 24 * 7)
+        self.cache = DiskCache(
+            path or cfg.get("path") or DEFAULT_CACHE_PATH,
+            namespace="llm_cache",
+            ttl_seconds=ttl_hours * 3600 if ttl_hours else None,
+            max_entries=int(cfg.get("max_entries", 5000)),
+        )
+        self._versions = {}
+
+    def sync_prompts(self, prompts: dict):
+        """Call whenever prompts are (re)loaded: drops entries made with outdated prompts."""
+        for agent in prompts or {}:
+            version = prompt_version(prompts, agent)
+            if self._versions.get(agent) != version:
+                dropped = self.cache.purge_version(version, prefix=f"{agent}:")
+                if dropped:
+                    logger.info(f"Prompt for '{agent}' changed: invalidated {dropped} cached responses")
+                self._versions[agent] = version
+
+    def _key(self, model: str, agent: str, text: str) -> str:
+        raw = f"{model}\x00{self._versions.get(agent, '')}\x00{normalize_input(text)}"
+        return f"{agent}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    def get(self, model: str, agent: str, text: str):
+        if not self.enabled:
+            return None
+        value = self.cache.get(self._key(model, agent, text))
+        if value is not None:
+            logger.info(f"Cache HIT for {agent} (hit rate {self.cache.metrics.get('hit_rate'):.0%})")
+        return value
+
+    def put(self, model: str, agent: str, text: str, response: str):
+        if self.enabled:
+            self.cache.put(self._key(model, agent, text), response, version=self._versions.get(agent))
@@ -0,0 +1,241 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from langchain_core.runnables import Runnable
+from persona.persona_agent import load_rules
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+
+logger = get_logger("LLM_GATEWAY")
+metrics = get_metrics("llm_gateway")
+
+DEFAULTS = {
+    "max_concurrency": 4,
+    "requests_per_second": 2.0,
+    "burst": 4,
+    "max_retries": 4,
+    "backoff_base_seconds": 0.5,
+    "backoff_max_seconds": 20.0,
+    "hedge_after_seconds": None,
+}
+
+# Error text that means "try again later" rather than "your request is wrong"
+RETRYABLE_MARKERS = ("429", "resource exhausted", "resourceexhausted", "rate limit", "quota", "503", "unavailable", "timeout", "timed out", "deadline", "connection")
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status in (429, 500, 502, 503, 504):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RETRYABLE_MARKERS)
+
+def load_gateway_config() -> dict:
+    return load_rules().get("llm_gateway", {}) or {}
+
+class TokenBucket:
+    """Classic token bucket: `rate` requests per second, bursts up to `capacity`."""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+class ModelLane:
+    """Concurrency + rate limits and retry policy for one model."""
+    def __init__(self, model: str, cfg: dict):
+        self.model = model
+        self.cfg = cfg
+        self.semaphore = threading.BoundedSemaphore(int(cfg["max_concurrency"]))
+        self.bucket = TokenBucket(cfg["requests_per_second"], cfg["burst"])
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _track(self, delta):
+        with self._lock:
+            self._in_flight += delta
+            metrics.set_gauge(f"{self.model}.in_flight", self._in_flight)
+
+    def run(self, fn, wait_for_rate=True):
+        """Runs fn() inside this lane's limits. Returns None instead of running when wait_for_rate=False and no token is free."""
+        if wait_for_rate:
+            self.bucket.acquire()
+        elif not self.bucket.try_acquire():
+            return None
+        with self.semaphore:
+            self._track(1)
+            try:
+                return fn()
+            finally:
+                self._track(-1)
+
+    def backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        ceiling = min(self.cfg["backoff_max_seconds"], self.cfg["backoff_base_seconds"] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+class LLMGateway:
+    """
+    Shared entry point for every LLM call in a process: per-model concurrency
+    semaphores, token-bucket rate limiting, jittered retries and optional
+    request hedging for tail latency.
+    """
+    def __init__(self, config: dict = None):
+        self.config = config if config is not None else load_gateway_config()
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+    def lane(self, model: str) -> ModelLane:
+        with self._lock:
+            if model not in self._lanes:
+                cfg = dict(DEFAULTS)
+                cfg.update(self.config.get("defaults") or {})
+                cfg.update((self.config.get("models") or {}).get(model) or {})
+                self._lanes[model] = ModelLane(model, cfg)
+            return self._lanes[model]
+
+    def call(self, model: str, fn):
+        """Calls fn() (one LLM request) with limits, retries and hedging. Raises the last error."""
+        lane = self.lane(model)
+        attempts = int(lane.cfg["max_retries"]) + 1
+        for attempt in range(attempts):
+            started = time.time()
+            metrics.incr(f"{model}.requests")
+            try:
+                result = self._hedged(lane, fn) if lane.cfg.get("hedge_after_seconds") else lane.run(fn)
+                metrics.observe(f"{model}.latency_ms", (time.time() - started) * 1000)
+                return result
+            except Exception as e:
+                if "429" in str(e) or "resource exhausted" in str(e).lower():
+                    metrics.incr(f"{model}.rate_limited")
+                if not is_retryable(e) or attempt == attempts - 1:
+                    metrics.incr(f"{model}.failures")
+                    raise
+                delay = lane.backoff(attempt)
+                metrics.incr(f"{model}.retries")
+                logger.warning(f"{model}: {type(e).__name__} ({e}) - retry {attempt + 1}/{attempts - 1} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _hedged(self, lane: ModelLane, fn):
+        """Sends a second copy of a slow request; the first one to succeed wins."""
+        primary = self._hedge_pool.submit(lane.run, fn)
+        done, _ = wait([primary], timeout=float(lane.cfg["hedge_after_seconds"]))
+        if done:
+            return primary.result()
+
+        # Only hedge if the rate limiter has room right now - never add load under pressure
+        metrics.incr(f"{lane.model}.hedges")
+        backup = self._hedge_pool.submit(lane.run, fn, False)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if result is None and future is backup:
+                    continue # Hedge skipped (no rate budget)
+                if future is backup:
+                    metrics.incr(f"{lane.model}.hedge_wins")
+                return result
+        raise error
+
+    def stream(self, model: str, client, input, config=None, **kwargs):
+        """Streams under the model's limits. Retries only if nothing was yielded yet."""
+        lane = self.lane(model)
+        attempts = int(lane.cfg["max_retries"]) + 1
+        for attempt in range(attempts):
+            yielded = False
+            lane.bucket.acquire()
+            metrics.incr(f"{model}.requests")
+            try:
+                with lane.semaphore:
+                    lane._track(1)
+                    try:
+                        for chunk in client.stream(input, config, **kwargs):
+                            yielded = True
+                            yield chunk
+                    finally:
+                        lane._track(-1)
+                return
+            except Exception as e:
+                if yielded or not is_retryable(e) or attempt == attempts - 1:
+                    metrics.incr(f"{model}.failures")
+                    raise
+                metrics.incr(f"{model}.retries")
+                time.sleep(lane.backoff(attempt))
+
+class GatewayChatModel(Runnable):
+    """
+    LangChain Runnable that routes a chat model through the shared gateway.
+    Drop-in for ChatOpenAI / ChatGoogleGenerativeAI in `prompt | llm | parser` chains;
+    .batch() uses the default thread fan-out, so it is bounded by the model's semaphore.
+    """
+    def __init__(self, client, model_name: str, gateway: "LLMGateway" = None):
+        self.client = client
+        self.model_name = model_name
+        self.gateway = gateway or get_gateway()
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.gateway.call(self.model_name, lambda: self.client.invoke(input, config, **kwargs))
+
+    def stream(self, input, config=None, **kwargs):
+        yield from self.gateway.stream(self.model_name, self.client, input, config, **kwargs)
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+def get_chat_model(model_name: str, temperature: float = 0.0, **client_kwargs) -> GatewayChatModel:
+    """
+    Builds a gateway-wrapped chat model. Provider SDK retries are disabled so the
+    gateway is the only place that retries. Setting LLM_STAND_IN_URL (or
+    llm_gateway.stand_in_base_url in rules.yaml) points every model at a local
+    OpenAI-compatible server instead, e.g. mock_llm_server.py.
+    """
+    stand_in = os.getenv("LLM_STAND_IN_URL") or load_gateway_config().get("stand_in_base_url")
+    if stand_in:
+        from langchain_openai import ChatOpenAI
+        client = ChatOpenAI(model=model_name, temperature=temperature, base_url=stand_in, api_key="stand-in", max_retries=0)
+    elif model_name.startswith("gpt"):
+        from langchain_openai import ChatOpenAI
+        client = ChatOpenAI(model=model_name, temperature=temperature, max_retries=0, **client_kwargs)
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        client = ChatGoogleGenerativeAI(model=model_name, temperature=temperature, max_retries=0, **client_kwargs)
+    return GatewayChatModel(client, model_name)
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+METRICS_DIR = BASE_DIR / "outputs" / "metrics"
+
+# Don't hit the disk on every counter bump
+FLUSH_INTERVAL_SECONDS = 2.0
+
+class MetricsRegistry:
+    """
+    Tiny in-process metrics store (counters, gauges, timings).
+    Each process flushes its own snapshot to outputs/metrics/<namespace>.json
+    so the API can expose metrics from the MCP servers too.
+    """
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._last_flush = 0.0
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        self._maybe_flush()
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float):
+        """Records a sample (e.g. latency in ms) as count/sum/min/max."""
+        with self._lock:
+            t = self._timings.setdefault(name, {"count": 0, "sum": 0.0, "min": value, "max": value})
+            t["count"] += 1
+            t["sum"] += value
+            t["min"] = min(t["min"], value)
+            t["max"] = max(t["max"], value)
+        self._maybe_flush()
+
+    def get(self, name: str, default: float = 0):
+        with self._lock:
+            return self._counters.get(name, self._gauges.get(name, default))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timings = {
+                k: {**v, "avg": (v["sum"] / v["count"]) if v["count"] else 0.0}
+                for k, v in self._timings.items()
+            }
+            return {
+                "namespace": self.namespace,
+                "pid": os.getpid(),
+                "updated_at": time.time(),
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings,
+            }
+
+    def flush(self):
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        path = METRICS_DIR / f"{self.namespace}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+        self._last_flush = time.time()
+
+    def _maybe_flush(self):
+        if time.time() - self._last_flush < FLUSH_INTERVAL_SECONDS:
+            return
+        try:
+            self.flush()
+        except OSError:
+            pass # Metrics must never break the pipeline
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_metrics(namespace: str) -> MetricsRegistry:
+    with _registries_lock:
+        if namespace not in _registries:
+            _registries[namespace] = MetricsRegistry(namespace)
+        return _registries[namespace]
+
+def load_all_metrics() -> dict:
+    """Reads every flushed snapshot (one per namespace/process)."""
+    # Flush our own first so the caller sees fresh numbers
+    for registry in list(_registries.values()):
+        try:
+            registry.flush()
+        except OSError:
+            pass
+
+    result = {}
+    if not METRICS_DIR.exists():
+        return result
+    for f in METRICS_DIR.glob("*.json"):
+        try:
+            with open(f, "r", encoding="utf-8") as jf:
+                result[f.stem] = json.load(jf)
+        except (OSError, ValueError):
+            pass
+    return result
@@ -0,0 +1,92 @@
+import re
+from collections import Counter
+from persona.persona_agent import load_rules
+from tools.chunked_extraction import PAGE_BREAK
+
+# Lines this far from the top/bottom of a page are header/footer candidates
+EDGE_LINES = 3
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+REDACTION_RUN = re.compile(r"(\[EMAIL_REDACTED\][ \t,;/|]*){2,}")
+PAGE_NUMBER = re.compile(r"\b(page|seite|página|pagina|pág\.?|pg\.?)\s*\d+(\s*(of|von|de|/)\s*\d+)?", re.I)
+
+def _line_signature(line: str) -> str:
+    """Exact line, except page numbers: 'Page 2 of 5' and 'Page 3 of 5' share a signature."""
+    return PAGE_NUMBER.sub("page #", line.strip().lower())
+
+def normalize_whitespace(text: str) -> str:
+    lines = [re.sub(r"[ \t ]+", " ", line).strip() for line in text.split("\n")]
+    text = "\n".join(lines)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def strip_repeated_edges(pages: list, min_share: float = 0.5) -> list:
+    """
+    Drops header/footer lines that repeat across pages. The first page keeps them,
+    since that is where the vendor/header block is actually needed.
+    """
+    if len(pages) < 2:
+        return pages
+
+    seen = Counter()
+    for page in pages:
+        lines = [l for l in page.split("\n") if l.strip()]
+        edges = {_line_signature(l) for l in lines[:EDGE_LINES] + lines[-EDGE_LINES:]}
+        seen.update(edges)
+    repeated = {sig for sig, n in seen.items() if n >= max(2, min_share * len(pages))}
+
+    cleaned = [pages[0]]
+    for page in pages[1:]:
+        lines = page.split("\n")
+        content = [i for i, l in enumerate(lines) if l.strip()]
+        edge_idx = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        cleaned.append("\n".join(l for i, l in enumerate(lines) if not (i in edge_idx and _line_signature(l) in repeated)))
+    return cleaned
+
+def drop_boilerplate(text: str, patterns: list) -> str:
+    """
+    Removes boilerplate sentences (terms, legal notes, ...) line by line; OCR pages often
+    have no blank lines, so nothing larger than a sentence is ever dropped. A matching
+    sentence that carries figures (e.g. 'Total 50.00 Thank you for your business') only
+    loses the matched phrase.
+    """
+    if not patterns:
+        return text
+    compiled = [re.compile(p, re.I) for p in patterns]
+    lines = []
+    for line in text.split("\n"):
+        if not any(c.search(line) for c in compiled):
+            lines.append(line)
+            continue
+        sentences = []
+        for sentence in SENTENCE_END.split(line):
+            if not any(c.search(sentence) for c in compiled):
+                sentences.append(sentence)
+            elif re.search(r"\d", sentence):
+                for c in compiled:
+                    sentence = c.sub("", sentence)
+                sentences.append(sentence)
+        lines.append(" ".join(s for s in sentences if s.strip()))
+    return "\n".join(lines)
+
+def compact_text(text: str, config: dict = None) -> str:
+    """
+    Shrinks OCR text before it goes into an LLM prompt without losing invoice data:
+    whitespace normalization, repeated page headers/footers, redaction noise, boilerplate.
+    Page breaks are preserved so page-based chunking keeps working.
+    """
+    if not text:
+        return text
+    cfg = config if config is not None else load_rules().get("prompt_compaction", {})
+    if not cfg.get("enabled", True):
+        return text
+
+    text = REDACTION_RUN.sub("[EMAIL_REDACTED] ", text)
+    text = re.sub(r"(?m)^\s*(\[EMAIL_REDACTED\]\s*)+$", "", text)
+
+    pages = [normalize_whitespace(p) for p in text.split(PAGE_BREAK)]
+    if cfg.get("strip_repeated_headers", True):
+        pages = strip_repeated_edges(pages)
+    pages = [normalize_whitespace(drop_boilerplate(p, cfg.get("boilerplate_patterns", []))) for p in pages]
+
+    compacted = PAGE_BREAK.join(p for p in pages if p.strip())
+    # Never hand the LLM an empty prompt for a non-empty invoice
+    return compacted if compacted.strip() else text
@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from utils.logger import get_logger
+from utils.metrics import get_metrics
+from utils.text_parsing import parse_date, parse_number
+
+logger = get_logger("REPORT_STORE")
+metrics = get_metrics("report_store")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+REPORTS_DIR = BASE_DIR / "outputs" / "reports"
+DEFAULT_DB_PATH = BASE_DIR / "outputs" / "store" / "reports.db"
+
+# Fields of audit_trail.invoice_data the dashboard list needs; the rest stays in the full record
+SUMMARY_INVOICE_FIELDS = ("vendor_name", "invoice_date", "total_amount", "currency")
+
+class VersionConflict(Exception):
+    """The report changed since the caller read it (optimistic concurrency)."""
+    def __init__(self, invoice_id: str, expected: int, current: int):
+        super().__init__(f"{invoice_id} is at version {current}, not {expected}")
+        self.invoice_id, self.expected, self.current = invoice_id, expected, current
+
+def write_json_atomic(path: Path, data: dict):
+    """Temp file + fsync + rename: readers see the old or the new file, never a truncated one."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class ReportStore:
+    """
+    Indexed store of audit reports (SQLite), written by ReportingAgent.
+    Every write gets the next change sequence number ('seq'), which orders the
+    dashboard (newest first), serves as the pagination cursor and as the
+    'since' token for delta sync. Filter columns and a summary projection are
+    kept next to the full JSON so list views never parse audit trails.
+    Safe to share between threads and processes (SQLite does the locking).
+
+    Writes are transactions under SQLite's write lock (BEGIN IMMEDIATE), so
+    read-modify-write updates from several uvicorn workers serialize instead of
+    losing each other. Each write bumps the report's version (the ETag), appends
+    to the append-only audit event log and refreshes the <invoice_id>.json file
+    atomically while still holding the lock, so the file always matches the newest version.
+    """
+    def __init__(self, path=None, reports_dir=None):
+        self.path = Path(path or DEFAULT_DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.reports_dir = Path(reports_dir or REPORTS_DIR)
+        self.reports_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                invoice_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                invoice_no TEXT,
+                status TEXT,
+                vendor TEXT,
+                invoice_date TEXT,
+                amount REAL,
+                currency TEXT,
+                summary TEXT,
+                html_report_path TEXT,
+                timestamp TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS reports_seq ON reports (seq);
+            CREATE INDEX IF NOT EXISTS reports_status ON reports (status, seq);
+            CREATE INDEX IF NOT EXISTS reports_vendor ON reports (vendor COLLATE NOCASE, seq);
+            CREATE INDEX IF NOT EXISTS reports_date ON reports (invoice_date);
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                invoice_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                actor TEXT,
+                detail TEXT,
+                at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_invoice ON events (invoice_id, id);
+            CREATE TRIGGER IF NOT EXISTS events_no_update BEFORE UPDATE ON events
+                BEGIN SELECT RAISE(ABORT, 'audit events are append-only'); END;
+            CREATE TRIGGER IF NOT EXISTS events_no_delete BEFORE DELETE ON events
+                BEGIN SELECT RAISE(ABORT, 'audit events are append-only'); END;
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(reports)")}
+        if "version" not in columns: # Stores created before versioning
+            self._conn.execute("ALTER TABLE reports ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.commit()
+        # Reports written before the store existed
+        if not self.count():
+            self.import_dir(self.reports_dir)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    # --- Writes ---
+    def put(self, report: dict, actor: str = "reporting_agent", event: str = "generated") -> dict:
+        """Inserts or replaces a report (e.g. a freshly generated one). Returns it with its new version."""
+        return self._write(report["invoice_id"], lambda current: report, None, event, actor, {"status": report.get("status")}, upsert=True)
+
+    def update(self, invoice_id: str, change, expected_version: int = None, event: str = "updated",
+               actor: str = None, detail: dict = None):
+        """
+        Transactional read-modify-write: change(report) edits the current report in place (or returns a new one).
+        Raises VersionConflict if expected_version is given and the report has moved on.
+        Returns the updated report, or None if there is no such report.
+        """
+        return self._write(invoice_id, change, expected_version, event, actor, detail)
+
+    def _write(self, invoice_id, change, expected_version, event, actor, detail, upsert=False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE") # Serializes writers across threads and worker processes
+            try:
+                row = self._conn.execute("SELECT data, version FROM reports WHERE invoice_id = ?", (invoice_id,)).fetchone()
+                if row is None and not upsert:
+                    self._conn.rollback()
+                    return None
+                version = row[1] if row else 0
+                if expected_version is not None and int(expected_version) != version:
+                    metrics.incr("version_conflicts")
+                    raise VersionConflict(invoice_id, int(expected_version), version)
+
+                current = json.loads(row[0]) if row else {}
+                report = change(current)
+                report = current if report is None else report
+                report["invoice_id"] = invoice_id
+                report["version"] = version + 1
+                seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM reports").fetchone()[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO reports (invoice_id, seq, version, invoice_no, status, vendor, invoice_date, "
+                    "amount, currency, summary, html_report_path, timestamp, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (invoice_id, seq, report["version"]) + self._columns(report),
+                )
+                self._conn.execute(
+                    "INSERT INTO events (invoice_id, version, type, actor, detail, at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (invoice_id, report["version"], event, actor, json.dumps(detail or {}, default=str), datetime.now().isoformat()),
+                )
+                # Still under the write lock, so the file can't be overwritten by an older version
+                write_json_atomic(self.reports_dir / f"{invoice_id}.json", report)
+                self._conn.commit()
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                raise
+        metrics.incr("writes")
+        return report
+
+    @staticmethod
+    def _columns(report: dict) -> tuple:
+        invoice = (report.get("audit_trail") or {}).get("invoice_data") or {}
+        amount = invoice.get("total_amount")
+        return (
+            report.get("original_invoice_no"),
+            report.get("status"),
+            invoice.get("vendor_name"),
+            parse_date(invoice.get("invoice_date")),
+            amount if isinstance(amount, (int, float)) else parse_number(str(amount or "")),
+            invoice.get("currency"),
+            report.get("human_readable_summary"),
+            report.get("html_report_path"),
+            report.get("timestamp"),
+            json.dumps(report, default=str),
+        )
+
+    def import_dir(self, reports_dir) -> int:
+        """Loads <invoice_id>.json report files, oldest first so the newest gets the highest seq."""
+        files = sorted(Path(reports_dir).glob("*.json"), key=lambda p: p.stat().st_mtime)
+        imported = 0
+        for path in files:
+            try:
+                report = json.loads(path.read_text(encoding="utf-8"))
+                report.setdefault("invoice_id", path.stem)
+                self.put(report, actor="import", event="imported")
+                imported += 1
+            except Exception as e:
+                logger.warning(f"Skipping unreadable report {path.name}: {e}")
+        if imported:
+            logger.info(f"Imported {imported} report file(s) into the report store")
+        return imported
+
+    # --- Reads ---
+    def events(self, invoice_id: str) -> list:
+        """Audit event log of one report, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, type, actor, detail, at FROM events WHERE invoice_id = ? ORDER BY id", (invoice_id,)
+            ).fetchall()
+        return [{"version": v, "type": t, "actor": a, "detail": json.loads(d or "{}"), "at": at} for v, t, a, d, at in rows]
+
+    def get(self, invoice_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM reports WHERE invoice_id = ?", (invoice_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self, status=None, vendor=None, date_from=None, date_to=None,
+             cursor: int = None, since: int = None, limit: int = None, view: str = "full") -> tuple:
+        """
+        Returns (reports, next_cursor).
+        Pages go newest first: pass the returned cursor to get the next one.
+        With 'since' (a sync token) only reports changed after it are returned, oldest first.
+        """
+        started = time.time()
+        where, params = [], []
+        if status:
+            statuses = [status] if isinstance(status, str) else list(status)
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params += statuses
+        if vendor:
+            where.append("vendor = ? COLLATE NOCASE")
+            params.append(vendor)
+        if date_from:
+            where.append("invoice_date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("invoice_date <= ?")
+            params.append(date_to)
+        if since is not None:
+            where.append("seq > ?")
+            params.append(int(since))
+        elif cursor is not None:
+            where.append("seq < ?")
+            params.append(int(cursor))
+
+        columns = "seq, data" if view == "full" else (
+            "seq, invoice_id, version, invoice_no, status, vendor, invoice_date, amount, currency, summary, html_report_path, timestamp"
+        )
+        sql = f"SELECT {columns} FROM reports"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq " + ("ASC" if since is not None else "DESC")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit) + 1) # One extra row tells whether there is a next page
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit and len(rows) > int(limit):
+            rows = rows[:int(limit)]
+            next_cursor = rows[-1][0]
+        reports = [json.loads(r[1]) if view == "full" else self._summary(r) for r in rows]
+        metrics.observe("list_ms", (time.time() - started) * 1000)
+        return reports, next_cursor
+
+    @staticmethod
+    def _summary(row) -> dict:
+        """Same shape as a full report, minus the audit trail beyond what list views show."""
+        _, invoice_id, version, invoice_no, status, vendor, invoice_date, amount, currency, summary, html_path, timestamp = row
+        invoice = dict(zip(SUMMARY_INVOICE_FIELDS, (vendor, invoice_date, amount, currency)))
+        return {
+            "invoice_id": invoice_id,
+            "version": version,
+            "original_invoice_no": invoice_no,
+            "status": status,
+            "human_readable_summary": summary,
+            "html_report_path": html_path,
+            "timestamp": timestamp,
+            "audit_trail": {"invoice_data": {k: v for k, v in invoice.items() if v is not None}},
+        }
+
+    def status_counts(self) -> dict:
+        """{status: number of reports} over the whole store (dashboard totals, independent of paging)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM reports GROUP BY status").fetchall()
+        return {status or "UNKNOWN": count for status, count in rows}
+
+    def sync_token(self) -> int:
+        """Latest change sequence number; pass it back as 'since' to get only newer changes."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM reports").fetchone()[0]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_report_store() -> ReportStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReportStore()
+        return _store
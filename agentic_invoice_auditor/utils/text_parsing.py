@@ -0,0 +1,72 @@
+import re
+from datetime import datetime
+
+# Currency symbols / codes that prefix or suffix amounts on invoices
+CURRENCY_SYMBOLS = "$€£¥₹"
+
+# Thousands separators that never mean a decimal point: spaces (also no-break / narrow no-break) and apostrophes
+GROUP_SEPARATORS = re.compile(r"[\s\u00a0\u202f'\u2019]")
+# '1.234.567': two or more dots, each followed by exactly three digits
+DOT_GROUPED = re.compile(r"-?\d{1,3}(\.\d{3}){2,}")
+
+def parse_number(token: str):
+    """'1,617.00' -> 1617.0, '1.617,00' -> 1617.0, '1 234,56' -> 1234.56, '1.234.567' -> 1234567.0, '$450' -> 450.0"""
+    token = re.sub(r"^[A-Z]{3}\s*|\s*[A-Z]{3}$", "", token.strip()).strip(CURRENCY_SYMBOLS)
+    token = GROUP_SEPARATORS.sub("", token).strip(CURRENCY_SYMBOLS)
+    if not token:
+        return None
+    if DOT_GROUPED.fullmatch(token):
+        token = token.replace(".", "")
+    if "," in token and "." in token:
+        # Whichever separator comes last is the decimal one
+        if token.rfind(",") > token.rfind("."):
+            token = token.replace(".", "").replace(",", ".")
+        else:
+            token = token.replace(",", "")
+    elif "," in token:
+        head, _, tail = token.rpartition(",")
+        token = token.replace(",", ".") if len(tail) in (1, 2) and head.count(",") == 0 else token.replace(",", "")
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d.%m.%Y", "%d-%m-%Y", "%Y/%m/%d", "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y")
+
+def parse_date(value):
+    """'2025-03-14', '14.03.2025', 'March 14, 2025' -> '2025-03-14' (None if unparseable). Day-first wins on ambiguity."""
+    if not value:
+        return None
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+# Amount formats parse_number must keep reading (python -m utils.text_parsing checks them)
+NUMBER_CASES = [
+    ("1,617.00", 1617.0),
+    ("1.617,00", 1617.0),
+    ("$450", 450.0),
+    ("EUR 1.234,56", 1234.56),
+    ("1.234.567", 1234567.0),
+    ("1.234.567,89", 1234567.89),
+    ("1 234,56", 1234.56),
+    ("1\u00a0234,56 €", 1234.56),
+    ("1\u202f234\u202f567,00", 1234567.0),
+    ("1'234'567.50", 1234567.5),
+    ("CHF 12\u2019500.00", 12500.0),
+    ("12,5", 12.5),
+    ("1.5", 1.5),
+    ("abc", None),
+    ("", None),
+]
+
+if __name__ == "__main__":
+    failures = [(token, expected, parse_number(token)) for token, expected in NUMBER_CASES if parse_number(token) != expected]
+    for token, expected, got in failures:
+        print(f"parse_number({token!r}) = {got!r}, expected {expected!r}")
+    print(f"{len(NUMBER_CASES) - len(failures)}/{len(NUMBER_CASES)} number formats OK")
+    raise SystemExit(1 if failures else 0)
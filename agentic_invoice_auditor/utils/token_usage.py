@@ -0,0 +1,45 @@
+from utils.metrics import get_metrics
+
+metrics = get_metrics("token_usage")
+
+try:
+    # Optional: exact BPE counts when tiktoken is installed
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    """Token count of a prompt (tiktoken if available, else the ~4 chars/token rule of thumb)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, round(len(text) / 4))
+
+def record_prompt(stage: str, prompt: str) -> int:
+    """Counts one LLM prompt for a pipeline stage (e.g. 'translation_agent', 'rag.generate')."""
+    tokens = count_tokens(prompt)
+    metrics.incr(f"{stage}.calls")
+    metrics.incr(f"{stage}.input_tokens", tokens)
+    metrics.incr("total.input_tokens", tokens)
+    metrics.observe(f"{stage}.prompt_tokens", tokens)
+    return tokens
+
+def record_compaction(stage: str, before: str, after: str) -> int:
+    """Tracks how many input tokens prompt compaction removed for a stage."""
+    saved = count_tokens(before) - count_tokens(after)
+    if saved > 0:
+        metrics.incr(f"{stage}.saved_tokens", saved)
+        metrics.incr("total.saved_tokens", saved)
+    return saved
+
+def record_response(stage: str, response) -> int:
+    """Counts output tokens, preferring the provider's usage metadata when present."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    tokens = usage.get("output_tokens") if isinstance(usage, dict) else None
+    if tokens is None:
+        tokens = count_tokens(getattr(response, "content", None) or str(response))
+    metrics.incr(f"{stage}.output_tokens", tokens)
+    metrics.incr("total.output_tokens", tokens)
+    return tokens
@@ -727,18 +727,107 @@ const InvoiceModal = ({ invoice, onClose }) => {
 };
 // --- 3. MAIN APPLICATION ---
 
+const PAGE_SIZE = 50; // Reports per page (list views only need the summary fields)
+const REVIEW_STATUSES = ["FAIL", "REJECTED", "Manual Review"];
+const PROCESSED_STATUSES = ["PASS", "SUCCESS", "Approved", "Rejected"];
+
+const countOf = (byStatus, statuses) =>
+  statuses.reduce((sum, status) => sum + (byStatus[status] || 0), 0);
+
+// Puts changed / new reports (oldest first, as delta sync returns them) on top, replacing older copies
+const mergeChanges = (reports, changes) => {
+  let merged = reports;
+  for (const report of changes) {
+    merged = [report, ...merged.filter((r) => r.invoice_id !== report.invoice_id)];
+  }
+  return merged;
+};
+
 function App() {
   const [activeTab, setActiveTab] = useState("dashboard");
   const [reports, setReports] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null); // Older page, if any
+  const [reviewQueue, setReviewQueue] = useState([]); // Every report waiting for review, not just the loaded pages
+  const [stats, setStats] = useState({ total: 0, by_status: {} }); // Counts over the whole store
   const [loading, setLoading] = useState(false);
   const [selectedInvoice, setSelectedInvoice] = useState(null); // For Modal
   const [notification, setNotification] = useState(null); // For Toasts
+  const syncToken = useRef(null);
 
   // --- DATA FETCHING ---
+  // Pending items may sit on any page, so the review queue is fetched by status, all pages
+  const loadReviewQueue = async () => {
+    let queue = [];
+    let cursor = null;
+    do {
+      const page = await invoiceService.getReportsPage({
+        view: "summary",
+        status: REVIEW_STATUSES.join(","),
+        limit: PAGE_SIZE,
+        ...(cursor ? { cursor } : {}),
+      });
+      queue = queue.concat(page.reports);
+      cursor = page.nextCursor;
+    } while (cursor);
+    setReviewQueue(queue);
+  };
+
+  // First call loads the newest page; later calls only fetch what changed since (delta sync).
+  // Dashboard counts and the review queue come from the server, independent of paging.
   const refreshData = async () => {
     try {
-      const data = await invoiceService.getReports();
-      setReports(data);
+      const [statsData] = await Promise.all([invoiceService.getReportStats(), loadReviewQueue()]);
+      setStats(statsData);
+      if (syncToken.current === null) {
+        const page = await invoiceService.getReportsPage({ view: "summary", limit: PAGE_SIZE });
+        setReports(page.reports);
+        setNextCursor(page.nextCursor);
+        syncToken.current = page.syncToken;
+        return;
+      }
+      let changes = [];
+      let hasMore = true;
+      while (hasMore) {
+        const delta = await invoiceService.getReportChanges(syncToken.current, {
+          view: "summary",
+          limit: PAGE_SIZE,
+        });
+        changes = changes.concat(delta.reports);
+        syncToken.current = delta.syncToken;
+        hasMore = delta.hasMore && delta.reports.length > 0;
+      }
+      if (changes.length) setReports((current) => mergeChanges(current, changes));
+    } catch (err) {
+      console.error("API Error:", err);
+    }
+  };
+
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      const page = await invoiceService.getReportsPage({
+        view: "summary",
+        limit: PAGE_SIZE,
+        cursor: nextCursor,
+      });
+      setReports((current) => [
+        ...current,
+        ...page.reports.filter((r) => !current.some((c) => c.invoice_id === r.invoice_id)),
+      ]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      console.error("API Error:", err);
+    }
+  };
+
+  // List entries are summaries: the modal shows the full report (line items, audit trail)
+  const openInvoice = async (summary) => {
+    setSelectedInvoice(summary);
+    try {
+      const full = await invoiceService.getReport(summary.invoice_id);
+      setSelectedInvoice((current) =>
+        current && current.invoice_id === full.invoice_id ? full : current
+      );
     } catch (err) {
       console.error("API Error:", err);
     }
@@ -754,23 +843,16 @@ function App() {
   };
 
   // --- COMPUTED LISTS ---
-  const manualQueue = reports.filter((r) =>
-    ["FAIL", "REJECTED", "Manual Review"].includes(r.status)
-  );
-  const processedQueue = reports.filter((r) =>
-    ["PASS", "SUCCESS", "Approved", "Rejected"].includes(r.status)
-  );
+  const manualQueue = reviewQueue;
+  const processedQueue = reports.filter((r) => PROCESSED_STATUSES.includes(r.status));
 
-  const total = reports.length;
+  // Cards use the server-side counts: the lists above only hold the pages loaded so far
+  const total = stats.total;
+  const pendingCount = countOf(stats.by_status, REVIEW_STATUSES);
+  const processedCount = countOf(stats.by_status, PROCESSED_STATUSES);
   const approvalRate =
     total > 0
-      ? Math.round(
-          (processedQueue.filter(
-            (r) => r.status === "Approved" || r.status === "PASS"
-          ).length /
-            total) *
-            100
-        )
+      ? Math.round((countOf(stats.by_status, ["Approved", "PASS"]) / total) * 100)
       : 0;
 
   // --- ANIMATIONS ---
@@ -866,7 +948,7 @@ function App() {
                 />
                 <StatCard
                   title="Action Required"
-                  value={manualQueue.length}
+                  value={pendingCount}
                   subtext="Pending Review"
                   icon={AlertTriangle}
                   color="red"
@@ -927,7 +1009,7 @@ function App() {
                         </td>
                         <td className="p-4">
                           <button
-                            onClick={() => setSelectedInvoice(r)}
+                            onClick={() => openInvoice(r)}
                             className="text-slate-400 hover:text-blue-600 transition-colors"
                           >
                             <Eye size={18} />
@@ -963,9 +1045,12 @@ function App() {
             <AuditVault
               manualQueue={manualQueue}
               processedQueue={processedQueue}
+              processedCount={processedCount}
               refreshData={refreshData}
               showNotification={showNotification}
-              setSelectedInvoice={setSelectedInvoice}
+              setSelectedInvoice={openInvoice}
+              hasMore={Boolean(nextCursor)}
+              loadMore={loadMore}
             />
           )}
 
@@ -1085,16 +1170,28 @@ const UploadComponent = ({ setLoading, refreshData, showNotification }) => {
 const AuditVault = ({
   manualQueue,
   processedQueue,
+  processedCount,
   refreshData,
   showNotification,
   setSelectedInvoice,
+  hasMore,
+  loadMore,
 }) => {
   const [subTab, setSubTab] = useState("review");
   const [searchTerm, setSearchTerm] = useState("");
 
-  const handleAction = async (id, action) => {
-    // Note: ensure mockInvoiceService is imported or available in scope
-    await invoiceService.submitAction(id, action);
+  const handleAction = async (id, action, version) => {
+    try {
+      // The server answers 412 if someone changed the report after this list was loaded
+      await invoiceService.submitAction(id, action, "", version);
+    } catch (err) {
+      if (err.response?.status === 412) {
+        showNotification(`Invoice ${id} was changed by someone else - reloaded`, "error");
+        refreshData();
+        return;
+      }
+      throw err;
+    }
     showNotification(
       `Invoice ${id} ${action === "APPROVE" ? "Approved" : "Rejected"}`,
       action === "APPROVE" ? "success" : "error"
@@ -1106,7 +1203,7 @@ const AuditVault = ({
   const filteredList = currentList.filter(
     (item) =>
       item.invoice_id.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      item.human_readable_summary
+      (item.human_readable_summary || "")
         .toLowerCase()
         .includes(searchTerm.toLowerCase())
   );
@@ -1134,7 +1231,7 @@ const AuditVault = ({
                 : "text-slate-500 hover:text-slate-700"
             }`}
           >
-            🗄️ Archive ({processedQueue.length})
+            🗄️ Archive ({processedCount})
           </button>
         </div>
 
@@ -1225,13 +1322,13 @@ const AuditVault = ({
                   {subTab === "review" && (
                     <div className="flex gap-2 pl-3 border-l border-slate-100">
                       <button
-                        onClick={() => handleAction(item.invoice_id, "APPROVE")}
+                        onClick={() => handleAction(item.invoice_id, "APPROVE", item.version)}
                         className="bg-emerald-500 text-white px-4 py-2 rounded-lg hover:bg-emerald-600 text-sm font-bold shadow-lg shadow-emerald-500/20 transition-all active:scale-95"
                       >
                         Approve
                       </button>
                       <button
-                        onClick={() => handleAction(item.invoice_id, "REJECT")}
+                        onClick={() => handleAction(item.invoice_id, "REJECT", item.version)}
                         className="bg-white border border-slate-200 text-rose-600 px-4 py-2 rounded-lg hover:bg-rose-50 hover:border-rose-200 text-sm font-bold transition-colors active:scale-95"
                       >
                         Reject
@@ -1256,6 +1353,16 @@ const AuditVault = ({
             </p>
           </div>
         )}
+        {subTab === "archive" && hasMore && (
+          <div className="text-center pt-2">
+            <button
+              onClick={loadMore}
+              className="text-sm text-blue-600 font-medium hover:underline"
+            >
+              Load older invoices
+            </button>
+          </div>
+        )}
       </div>
     </motion.div>
   );
@@ -24,9 +24,60 @@ export const invoiceService = {
     return response.data;
   },
 
+  // 1b. Bulk upload: any mix of invoices and ZIP archives in one request.
+  // Returns the batch progress right away ({ batch_id, status, total, done, percent, counts, files })
+  uploadBatch: async (files) => {
+    const formData = new FormData();
+    for (const file of files) formData.append("files", file);
+
+    const response = await api.post("/upload/batch", formData, {
+      headers: { "Content-Type": "multipart/form-data" },
+      timeout: 600000, // Only covers the transfer; processing continues after the response
+    });
+    return response.data;
+  },
+
+  // 1c. Poll until status is "completed"
+  getBatch: async (batchId) => {
+    const response = await api.get(`/batches/${encodeURIComponent(batchId)}`);
+    return response.data;
+  },
+
   // 2. Get Dashboard Data
-  getReports: async () => {
-    const response = await api.get("/reports");
+  // params (all optional): { status, vendor, date_from, date_to, limit, cursor, view: "full" | "summary" }
+  getReports: async (params = {}) => {
+    const response = await api.get("/reports", { params });
+    return response.data;
+  },
+
+  // 2b. One page of reports plus the tokens for the next page / the next delta sync
+  getReportsPage: async (params = {}) => {
+    const response = await api.get("/reports", { params });
+    return {
+      reports: response.data,
+      nextCursor: response.headers["x-next-cursor"] || null,
+      syncToken: response.headers["x-sync-token"] || null,
+    };
+  },
+
+  // 2c. Delta sync: only reports created or changed after syncToken (oldest first)
+  getReportChanges: async (syncToken, params = {}) => {
+    const response = await api.get("/reports", { params: { ...params, since: syncToken } });
+    return {
+      reports: response.data,
+      syncToken: response.headers["x-sync-token"] || syncToken,
+      hasMore: Boolean(response.headers["x-next-cursor"]),
+    };
+  },
+
+  // 2d. Counts by status over all reports ({ total, by_status }) for the dashboard cards
+  getReportStats: async () => {
+    const response = await api.get("/reports/stats");
+    return response.data;
+  },
+
+  getReport: async (invoiceId) => {
+    const response = await api.get(`/reports/${encodeURIComponent(invoiceId)}`);
     return response.data;
   },
 
@@ -36,16 +87,69 @@ export const invoiceService = {
     return response.data;
   },
 
+  // 3b. Streaming RAG Chat (SSE over POST)
+  // handlers: { onMeta, onToken, onAnswer, onVerdict, onRetract, onDone, onError }
+  streamChat: async (question, history, handlers = {}, signal) => {
+    const res = await fetch(`${API_BASE}/chat/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ question, history }),
+      signal,
+    });
+    if (!res.ok || !res.body) throw new Error("Chat stream failed");
+
+    const callbacks = {
+      meta: handlers.onMeta,
+      token: handlers.onToken,
+      answer: handlers.onAnswer,
+      verdict: handlers.onVerdict,
+      retract: handlers.onRetract,
+      done: handlers.onDone,
+      error: handlers.onError,
+    };
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        const callback = callbacks[event];
+        if (callback) callback(data ? JSON.parse(data) : {});
+      }
+    }
+  },
+
   // 4. Human Approval/Rejection
-  submitAction: async (invoiceId, action, notes = "") => {
+  // version (optional): the report version the user saw; the server answers 412 if it changed since
+  submitAction: async (invoiceId, action, notes = "", version = null) => {
     const response = await api.post("/action", {
       invoice_id: invoiceId,
       action: action,
       notes: notes,
+      version: version,
     });
     return response.data;
   },
 
+  getReportEvents: async (invoiceId) => {
+    const response = await api.get(`/reports/${encodeURIComponent(invoiceId)}/events`);
+    return response.data;
+  },
+
   getDownloadUrl: (filename) => {
     return `${API_BASE}/download/${filename}`;
   },
@@ -66,10 +170,11 @@ export const invoiceService = {
     return res.json();
   },
   // 5. Edit & Re-run
-  rerunValidation: async (invoiceId, updatedData) => {
+  rerunValidation: async (invoiceId, updatedData, version = null) => {
     const response = await api.post("/rerun", {
       invoice_id: invoiceId,
       updated_data: updatedData,
+      version: version,
     });
     return response.data;
   },